@@ -3,6 +3,7 @@ import os
 from fastapi import  FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from  utils.database import Base, engine
+from utils.metrics import MetricsMiddleware
 from dotenv import load_dotenv
 from starlette.middleware.base import BaseHTTPMiddleware
 
@@ -47,3 +48,6 @@ app.add_middleware(
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"]
 )
+
+# Outermost, so the requests CORS answers itself (preflights) are counted too
+app.add_middleware(MetricsMiddleware)
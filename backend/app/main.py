@@ -1,3 +1,4 @@
+import os
 
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import (
@@ -14,10 +15,101 @@ from routers import (
     get_users,
     count_users,
     chat,
+    chat_history,
     monitor_model,
     file_upload,
-    predict
+    predict,
+    websocket_endpoint,
+    summarize,
+    jobs,
+    stats,
+    metrics,
 ) 
+from utils.registry import registry
+from utils.model import CAT_DOG_MODEL
+from utils.inference import run_in_executor
+from utils.history import history_writer
+from utils.prediction_log import prediction_logger
+from utils.pdf import shutdown_pool
+from utils.jobs import job_queue
+from utils.database import async_engine
+from utils.aggregates import aggregates
+from utils.models import init_db
+
+
+@app.on_event("startup")
+def create_tables():
+    # Before anything else touches the database
+    init_db()
+
+
+# Models loaded (and run once) before serving the first request, comma separated,
+# e.g. resnet18_cat_dog,chat_embedder; `false` for none. The others load on first use.
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", CAT_DOG_MODEL)
+
+
+@app.on_event("startup")
+async def warmup_models():
+    if MODEL_WARMUP.lower() == "false":
+        return
+    if MODEL_WARMUP.lower() == "true":
+        names = [CAT_DOG_MODEL]
+    else:
+        names = [name.strip() for name in MODEL_WARMUP.split(",") if name.strip()]
+    if names:
+        await run_in_executor(registry.warmup, names)
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    await job_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_queue.stop()
+
+
+@app.on_event("startup")
+def start_aggregates_refresher():
+    aggregates.start()
+
+
+@app.on_event("shutdown")
+async def stop_aggregates_refresher():
+    await aggregates.stop()
+
+
+@app.on_event("startup")
+def start_report_refresher():
+    monitor_model.start_report_refresher()
+
+
+@app.on_event("shutdown")
+async def stop_report_refresher():
+    await monitor_model.stop_report_refresher()
+
+
+@app.on_event("shutdown")
+def flush_chat_history():
+    # Write the chat messages still queued by the write-behind writer
+    history_writer.close()
+
+
+@app.on_event("shutdown")
+def flush_prediction_log():
+    prediction_logger.close()
+
+
+@app.on_event("shutdown")
+def stop_pdf_workers():
+    shutdown_pool()
+
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    # The pooled connections belong to this event loop
+    await async_engine.dispose()
 
 
 @app.get("/")
@@ -29,9 +121,15 @@ app.include_router(auth.router)
 app.include_router(get_users.router)
 app.include_router(count_users.router)
 app.include_router(chat.router)
+app.include_router(chat_history.router)
 app.include_router(monitor_model.router)
 app.include_router(file_upload.router)
 app.include_router(predict.router)
+app.include_router(websocket_endpoint.router)
+app.include_router(summarize.router)
+app.include_router(jobs.router)
+app.include_router(stats.router)
+app.include_router(metrics.router)
 
 
 print("Server is running correctly")
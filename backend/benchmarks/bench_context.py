@@ -0,0 +1,32 @@
+"""Prompt assembly time of the context builder on long conversations.
+
+    python -m benchmarks.bench_context --turns 10000 --budget 2048
+"""
+import time
+import argparse
+
+from utils.context import ContextBuilder, Conversation
+
+
+def main(args):
+    conversation = Conversation()
+    for i in range(args.turns):
+        conversation.add('user' if i % 2 == 0 else 'assistant', f"message {i} " + "lorem ipsum " * 20)
+    # No summarizer: old turns are dropped once, then every build walks the recent ones only
+    builder = ContextBuilder(budget=args.budget, summarize_after=10 ** 9, summarizer=None)
+
+    builder.pack(conversation, "warmup")
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        messages = builder.pack(conversation, "What did we say about lorem ipsum?")
+    elapsed = (time.perf_counter() - start) / args.repeat
+    print(f"{args.turns} turns, budget {args.budget} tokens: {len(messages)} messages packed "
+          f"in {elapsed * 1e6:.1f} us per request")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=10_000)
+    parser.add_argument('--budget', type=int, default=2048)
+    parser.add_argument('--repeat', type=int, default=1000)
+    main(parser.parse_args())
@@ -0,0 +1,138 @@
+"""Signups, logins and chat history writes from several uvicorn workers on one SQLite file.
+
+    python -m benchmarks.bench_db_workers --workers 4 --clients 32 --users 200
+
+Creates a temporary database, starts `uvicorn benchmarks.db_workers_app:app
+--workers N` on it, and has `--clients` clients sign up `--users` users, log
+each one in and post `--messages` chat exchanges with its token (written by
+the history writer of whichever worker got the request). Two runs:
+
+  - default: the engine as it was, rollback journal, synchronous=FULL, the
+    5 s busy timeout of the sqlite3 module, no mmap
+  - tuned: utils.database defaults, WAL, synchronous=NORMAL, mmap
+
+Reports throughput, latency per operation, failed requests (and how many
+said "database is locked") and the chat messages missing from the database
+after the workers shut down. Passwords use `--scheme` (pbkdf2_sha256 at 1000
+rounds by default) so the hashing does not hide the database.
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+import httpx
+import numpy as np
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+CONFIGS = {
+    "default": {"DB_JOURNAL_MODE": "DELETE", "DB_SYNCHRONOUS": "FULL", "DB_BUSY_TIMEOUT_MS": "5000",
+                "DB_MMAP_SIZE": "0"},
+    "tuned": {},
+}
+
+
+def start_server(env, workers, port):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'benchmarks.db_workers_app:app', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=env)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    process.kill()
+    raise RuntimeError("The server did not start")
+
+
+async def client_loop(client, users, args, latencies, failures):
+    async def call(kind, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as error:
+            failures[kind].append(repr(error))
+            return None
+        latencies[kind].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            failures[kind].append(response.text)
+            return None
+        return response
+
+    for user in users:
+        credentials = {'username': user, 'password': 'password'}
+        if await call('signup', 'POST', '/auth/', json=credentials) is None:
+            continue
+        response = await call('login', 'POST', '/auth/token', data=credentials)
+        if response is None:
+            continue
+        headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+        for i in range(args.messages):
+            await call('history', 'POST', '/history', headers=headers,
+                       json={'question': f"question {i} of {user}", 'answer': 'answer ' * 20})
+
+
+async def drive(port, args, run):
+    names = [f"{run}-user-{i}" for i in range(args.users)]
+    latencies, failures = defaultdict(list), defaultdict(list)
+    limits = httpx.Limits(max_connections=args.clients)
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, names[i::args.clients], args, latencies, failures)
+                               for i in range(args.clients)))
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies, failures
+
+
+def main(args):
+    print(f"{'run':<8} {'op':<8} {'ok':>6} {'failed':>6} {'locked':>6} {'p50':>8} {'p99':>8}  throughput / missing")
+    for run in args.runs:
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, 'bench.db')
+            env = {**os.environ, **CONFIGS[run], 'DATABASE_URL': f'sqlite:///{database}',
+                   'BENCH_PASSWORD_SCHEME': args.scheme, 'HISTORY_FLUSH_INTERVAL': '0.05',
+                   'AUTH_SECRET_KEY': os.getenv('AUTH_SECRET_KEY', 'bench-secret'),
+                   'AUTH_ALGORITHM': os.getenv('AUTH_ALGORITHM', 'HS256'), 'MODEL_WARMUP': 'false'}
+            # Schema first, the workers would otherwise race to create it
+            subprocess.run([sys.executable, '-m', 'utils.models'], cwd=BACKEND_DIR, env=env, check=True)
+            server = start_server(env, args.workers, args.port)
+            try:
+                elapsed, latencies, failures = asyncio.run(drive(args.port, args, run))
+            finally:
+                server.send_signal(signal.SIGINT)
+                server.wait(timeout=60)
+
+            with sqlite3.connect(database) as connection:
+                written = connection.execute("SELECT COUNT(*) FROM chat_history").fetchone()[0]
+            posted = 2 * len(latencies['history'])
+            operations = sum(len(samples) for samples in latencies.values())
+            for kind in ['signup', 'login', 'history']:
+                samples = np.array(latencies[kind]) * 1000 if latencies[kind] else np.array([np.nan])
+                locked = sum('database is locked' in failure for failure in failures[kind])
+                print(f"{run:<8} {kind:<8} {len(latencies[kind]):>6} {len(failures[kind]):>6} {locked:>6} "
+                      f"{np.nanpercentile(samples, 50):>6.1f}ms {np.nanpercentile(samples, 99):>6.1f}ms")
+            print(f"{run:<8} {'total':<8} {operations / elapsed:>6.0f} requests/s, "
+                  f"{posted - written} of {posted} chat messages missing")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=5)
+    parser.add_argument('--scheme', default='pbkdf2_sha256')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--runs', nargs='+', default=list(CONFIGS), choices=list(CONFIGS))
+    main(parser.parse_args())
@@ -0,0 +1,78 @@
+"""Bytes copied and latency of the image ingestion paths, without a server.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_ingest --sizes 640 1920 4000 --repeat 20
+
+Compares, per request, the base64 JSON route of routers/predict.py
+(JSON parse -> base64 decode -> decode -> transforms) with the raw body route
+(body buffer -> decode -> transforms), with and without JPEG draft decoding.
+"Allocated" is the peak of Python allocations while handling one request,
+on top of the request body itself, which approximates the bytes copied.
+"""
+import io
+import json
+import time
+import base64
+import argparse
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+import utils.transform as transform
+from utils.models import ImageData
+
+
+def make_jpeg(width):
+    height = width * 3 // 4
+    array = np.random.randint(0, 255, size=(height, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def base64_path(body):
+    image_data = ImageData(**json.loads(body))
+    image_bytes = base64.b64decode(image_data.image_data)
+    return transform.data_transforms(Image.open(io.BytesIO(image_bytes)).convert('RGB'))
+
+
+def raw_path(body):
+    return transform.preprocess_image(memoryview(body))
+
+
+def measure(handler, body, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        handler(body)
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    handler(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return np.median(latencies) * 1000, peak
+
+
+def main(args):
+    print(f"{'image':>10} {'path':<22} {'body':>10} {'allocated':>12} {'latency':>10}")
+    for width in args.sizes:
+        jpeg = make_jpeg(width)
+        json_body = json.dumps({"image_data": base64.b64encode(jpeg).decode()}).encode()
+
+        runs = [("base64 JSON", base64_path, json_body, False),
+                ("raw body", raw_path, jpeg, False),
+                ("raw body + draft", raw_path, jpeg, True)]
+        for name, handler, body, draft in runs:
+            transform.JPEG_DRAFT = draft
+            latency, peak = measure(handler, body, args.repeat)
+            print(f"{width:>10} {name:<22} {len(body):>10} {peak:>12} {latency:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[640, 1920, 4000], help='image widths')
+    parser.add_argument('--repeat', type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,80 @@
+"""Throughput of concurrent chats through the async LLM client.
+
+Start the stub server first, then run from the backend folder:
+
+    uvicorn benchmarks.stub_llm_server:app --port 9000
+    python -m benchmarks.bench_llm_client --url http://127.0.0.1:9000/v1 --chats 200
+
+Three runs are compared:
+  - blocking: a synchronous HTTP call inside the coroutine, what /chat/ used to do
+  - async: the pooled client, every prompt distinct
+  - coalesced: the pooled client, prompts drawn from --distinct questions
+"""
+import time
+import asyncio
+import argparse
+
+import httpx
+import numpy as np
+
+from utils.llm import AsyncLLMClient
+
+
+MODEL = "stub"
+
+
+def messages(i):
+    return [{"role": "user", "content": f"Question number {i}"}]
+
+
+def summary(name, latencies, elapsed):
+    latencies = np.array(latencies) * 1000
+    print(f"{name:<10} {len(latencies) / elapsed:8.1f} chats/s   "
+          f"p50 {np.percentile(latencies, 50):7.1f} ms   p99 {np.percentile(latencies, 99):7.1f} ms")
+
+
+async def run_blocking(url, chats):
+    client = httpx.Client(base_url=url, timeout=60)
+
+    async def one(i):
+        start = time.perf_counter()
+        # Blocks the event loop for the whole round trip
+        client.post('/chat/completions', json={"model": MODEL, "messages": messages(i)}).raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(chats)))
+    summary("blocking", latencies, time.perf_counter() - start)
+    client.close()
+
+
+async def run_async(url, chats, distinct, max_concurrency, name):
+    client = AsyncLLMClient(base_url=url, token=None, max_concurrency=max_concurrency)
+
+    async def one(i):
+        start = time.perf_counter()
+        await client.chat(messages(i % distinct), MODEL)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(chats)))
+    summary(name, latencies, time.perf_counter() - start)
+    print(f"{'':<10} {client.stats()}")
+    await client.aclose()
+
+
+async def main(args):
+    if not args.skip_blocking:
+        await run_blocking(args.url, args.chats)
+    await run_async(args.url, args.chats, args.chats, args.max_concurrency, "async")
+    await run_async(args.url, args.chats, args.distinct, args.max_concurrency, "coalesced")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:9000/v1')
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--distinct', type=int, default=20, help='distinct prompts of the coalesced run')
+    parser.add_argument('--max-concurrency', type=int, default=64)
+    parser.add_argument('--skip-blocking', action='store_true', help='the blocking run takes chats x latency')
+    asyncio.run(main(parser.parse_args()))
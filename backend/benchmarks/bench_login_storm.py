@@ -0,0 +1,150 @@
+"""Latency of an authenticated endpoint during a burst of logins.
+
+    python -m benchmarks.bench_login_storm --logins 64 --concurrency 16
+    python -m benchmarks.bench_login_storm --scheme pbkdf2_sha256 --rounds 600000
+
+Serves the /auth router and a probe endpoint behind `user_dependency` from a
+temporary SQLite database, in process. A probe client calls the endpoint
+with a token every 10 ms, timed from when each call was due, once on an idle
+app, then while `--concurrency` clients post `--logins` logins to
+/auth/token: with the password checked inline on the event loop (as before),
+and on the password executor. The probe latency should stay close to idle
+in the last run.
+
+`--scheme` swaps the hashing scheme, for hosts where passlib cannot load bcrypt.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import timedelta
+
+os.environ.setdefault('AUTH_SECRET_KEY', 'bench-secret')
+os.environ.setdefault('AUTH_ALGORITHM', 'HS256')
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+from passlib.context import CryptContext
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from routers import auth as auth_router
+from utils import auth
+from utils.deps import get_async_db, user_dependency
+from utils.database import Base, make_engine
+from utils.models import User
+
+
+def make_app(database):
+    engine = create_engine(f'sqlite:///{database}', connect_args={'check_same_thread': False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    AsyncSession = async_sessionmaker(make_engine(f'sqlite+aiosqlite:///{database}', create=create_async_engine),
+                                      expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncSession() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(auth_router.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+
+    @app.get('/probe')
+    async def probe(user: user_dependency):
+        return user
+
+    db = Session()
+    db.add(User(username='storm', hashed_password=auth.bcrypt_context.hash('password')))
+    db.commit()
+    db.close()
+    return app
+
+
+async def inline_verify_password(password, hashed_password, context=None):
+    # The handler before the password executor: the check blocks the event loop
+    return (context or auth.bcrypt_context).verify(password, hashed_password)
+
+
+async def probe(client, token, stop, latencies, interval=0.01):
+    # Timed from when each call was due, so a stalled event loop shows up as latency
+    headers = {'Authorization': f'Bearer {token}'}
+    due = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(max(0, due - time.perf_counter()))
+        response = await client.get('/probe', headers=headers)
+        latencies.append(time.perf_counter() - due)
+        assert response.status_code == 200
+        due = max(due + interval, time.perf_counter())
+
+
+async def storm(client, logins, concurrency):
+    remaining = iter(range(logins))
+
+    async def worker():
+        for _ in remaining:
+            response = await client.post('/auth/token', data={'username': 'storm', 'password': 'password'})
+            assert response.status_code == 200
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def run(app, token, logins, concurrency, duration=None):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        stop, latencies = asyncio.Event(), []
+        task = asyncio.create_task(probe(client, token, stop, latencies))
+        start = time.perf_counter()
+        if logins:
+            await storm(client, logins, concurrency)
+        else:
+            await asyncio.sleep(duration)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await task
+    return elapsed, np.array(latencies) * 1000
+
+
+def main(args):
+    if args.scheme != 'bcrypt':
+        auth.bcrypt_context = CryptContext(schemes=[args.scheme], **{f'{args.scheme}__default_rounds': args.rounds})
+    start = time.perf_counter()
+    auth.bcrypt_context.hash('password')
+    print(f"{args.scheme}: {(time.perf_counter() - start) * 1000:.0f} ms per hash, "
+          f"{auth.PASSWORD_HASH_WORKERS} password workers")
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'bench.db'))
+        token = auth_router.create_access_token('storm', 1, timedelta(minutes=20))
+        verify_password = auth_router.verify_password
+        runs = [
+            ("idle", 0, lambda: run(app, token, 0, 0, duration=2)),
+            ("storm, inline", args.logins, lambda: run(app, token, args.logins, args.concurrency)),
+            ("storm, executor", args.logins, lambda: run(app, token, args.logins, args.concurrency)),
+        ]
+
+        async def run_all():
+            # One event loop for every run, the connection pool of the async engine is bound to it
+            print(f"{'run':<18} {'logins/s':>9} {'probes':>7} {'p50':>9} {'p99':>9} {'max':>9}")
+            for name, logins, runner in runs:
+                auth_router.verify_password = inline_verify_password if name.endswith('inline') else verify_password
+                elapsed, latencies = await runner()
+                rate = f"{logins / elapsed:>9.1f}" if logins else f"{'-':>9}"
+                print(f"{name:<18} {rate} {len(latencies):>7} {np.percentile(latencies, 50):>7.1f}ms "
+                      f"{np.percentile(latencies, 99):>7.1f}ms {latencies.max():>7.1f}ms")
+            auth_router.verify_password = verify_password
+
+        asyncio.run(run_all())
+    print(f"token cache: {auth.token_cache.stats()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--scheme', default='bcrypt')
+    parser.add_argument('--rounds', type=int, default=12)
+    main(parser.parse_args())
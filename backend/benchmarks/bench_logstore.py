@@ -0,0 +1,77 @@
+"""Load time of the assistant logs: CSV vs the columnar log store.
+
+    python -m benchmarks.bench_logstore --rows 1000000 --days 30
+
+Builds a CSV of synthetic logs spread over `--days` days, converts it into a
+LogStore, then times the CSV read done by the monitoring before
+(`pd.read_csv(..., parse_dates=['start_time', 'end_time'])`) against reads
+of the store: everything, the report columns of a one-day window, and the
+two columns of a per-model count over that window.
+"""
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from utils.logstore import LogStore
+from utils.monitoring import LogMonitor
+
+
+def make_logs(rows, days, seed=0):
+    rng = np.random.default_rng(seed)
+    start_time = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.sort(rng.uniform(0, days * 86400, rows)), unit='s')
+    words = np.array(["the", "model", "answer", "cat", "dog", "image", "summary", "question", "data", "token"])
+    phrases = [" ".join(rng.choice(words, size)) for size in range(5, 85, 5)]
+    return pd.DataFrame({
+        'start_time': start_time,
+        'end_time': start_time + pd.to_timedelta(rng.uniform(0.5, 8, rows), unit='s'),
+        'question': np.array(phrases)[rng.integers(0, 4, rows)],
+        'response': np.array(phrases)[rng.integers(0, len(phrases), rows)],
+        'organization': rng.choice(['aims', 'okapi', 'acme'], rows),
+        'model_ID': rng.choice(['llama-3-8b', 'mixtral-8x7b', 'gpt-4o-mini'], rows),
+        'region': rng.choice(['africa', 'europe', 'america', 'asia'], rows),
+        'environment': rng.choice(['prod', 'staging'], rows, p=[0.9, 0.1]),
+        'feedback': rng.choice(['positive', 'negative', ''], rows, p=[0.3, 0.1, 0.6]),
+    })
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'logs.csv')
+        make_logs(args.rows, args.days).to_csv(path)
+        store = LogStore(os.path.join(directory, 'store'))
+        seconds, rows = timed(LogMonitor(path, store=store).ingest)
+        stats = store.stats()
+        print(f"{rows} rows, CSV {os.path.getsize(path) / 2**20:.0f} MB, store {stats['bytes'] / 2**20:.0f} MB "
+              f"in {stats['files']} files, converted in {seconds:.1f}s")
+
+        day = pd.Timestamp('2024-01-01') + pd.Timedelta(days=args.days // 2)
+        loads = [
+            ("csv, parse_dates", lambda: pd.read_csv(path, index_col=0, parse_dates=['start_time', 'end_time'])),
+            ("store, everything", lambda: store.read()),
+            ("store, 1 day, report columns", lambda: store.read(day, day + pd.Timedelta(days=1))),
+            ("store, 1 day, 2 columns", lambda: store.read(day, day + pd.Timedelta(days=1),
+                                                           columns=['start_time', 'model_ID'])),
+        ]
+        print(f"{'load':<30} {'rows':>9} {'time':>9} {'memory':>9}")
+        for name, load in loads:
+            best, frame = min((timed(load) for _ in range(args.repeat)), key=lambda result: result[0])
+            memory = frame.memory_usage(deep=True).sum() / 2**20
+            print(f"{name:<30} {len(frame):>9} {best:>8.3f}s {memory:>7.0f}MB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,74 @@
+"""Overhead of the metrics: per request (middleware) and per stage timer.
+
+    python -m benchmarks.bench_metrics --requests 20000
+
+The requests are driven straight through the ASGI app (no server, no
+network), so the difference between the two apps is the middleware itself.
+"""
+import time
+import asyncio
+import argparse
+
+from fastapi import FastAPI
+
+from utils.metrics import MetricsMiddleware, metrics, stage
+
+
+def make_app(instrumented):
+    app = FastAPI()
+
+    @app.get('/items/{item_id}')
+    async def read_item(item_id: int):
+        return {"item_id": item_id}
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware, enabled=True)
+    return app
+
+
+async def drive(app, requests):
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for i in range(requests):
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                 'scheme': 'http', 'path': f'/items/{i}', 'raw_path': f'/items/{i}'.encode(),
+                 'query_string': b'', 'headers': [], 'client': ('127.0.0.1', 1), 'server': ('test', 80)}
+        await app(scope, receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+def main(args):
+    plain, instrumented = make_app(False), make_app(True)
+    # Warm up both, then alternate the runs so drift hits both the same
+    asyncio.run(drive(plain, 1000))
+    asyncio.run(drive(instrumented, 1000))
+    timings = {'plain': [], 'instrumented': []}
+    for _ in range(args.rounds):
+        timings['plain'].append(asyncio.run(drive(plain, args.requests)))
+        timings['instrumented'].append(asyncio.run(drive(instrumented, args.requests)))
+    plain_us, instrumented_us = (min(timings[name]) * 1e6 for name in ('plain', 'instrumented'))
+    print(f"request without metrics: {plain_us:.1f} us, with: {instrumented_us:.1f} us "
+          f"(+{instrumented_us - plain_us:.1f} us, {(instrumented_us / plain_us - 1) * 100:.1f}%)")
+
+    start = time.perf_counter()
+    for _ in range(args.stages):
+        with stage('bench', 'v1'):
+            pass
+    print(f"stage timer: {(time.perf_counter() - start) / args.stages * 1e9:.0f} ns")
+
+    start = time.perf_counter()
+    text = metrics.render()
+    print(f"/metrics: {len(text.splitlines())} lines rendered in {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20_000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--stages', type=int, default=1_000_000)
+    main(parser.parse_args())
@@ -0,0 +1,72 @@
+"""PDF text extraction time for documents of 1 to 1000 pages.
+
+    python -m benchmarks.bench_pdf --pages 1 10 100 1000
+
+Documents are built by repeating the pages of tests/sample.pdf. Three
+extractors are compared: the previous in-memory `text +=` loop, the page
+generator in this process, and the page-parallel process pool used by
+`extract_text_from_pdf`.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from utils.pdf import iter_pages, stream_pages, get_pool
+
+
+def make_pdf(source, pages, directory):
+    reader = PdfReader(source)
+    writer = PdfWriter()
+    for index in range(pages):
+        writer.add_page(reader.pages[index % len(reader.pages)])
+    path = os.path.join(directory, f"{pages}.pdf")
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return path
+
+
+def legacy(path):
+    with open(path, 'rb') as f:
+        reader = PdfReader(f)
+        text = ""
+        for page in reader.pages:
+            text += page.extract_text()
+    return text
+
+
+def sequential(path):
+    return "\n".join(iter_pages(path))
+
+
+def parallel(path):
+    async def run():
+        return "\n".join([text async for text in stream_pages(path, parallel_min_pages=1)])
+    return asyncio.run(run())
+
+
+def timed(func, path):
+    start = time.perf_counter()
+    func(path)
+    return time.perf_counter() - start
+
+
+def main(args):
+    # Spawning the workers is a one-off cost of the server, not of a request
+    list(get_pool().map(abs, range(get_pool()._max_workers)))
+    print(f"{'pages':>6} {'size':>9} {'legacy':>9} {'generator':>10} {'pool':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for pages in args.pages:
+            path = make_pdf(args.pdf, pages, directory)
+            times = [timed(func, path) for func in (legacy, sequential, parallel)]
+            print(f"{pages:>6} {os.path.getsize(path) // 1024:>7}kB " + " ".join(f"{t:>8.2f}s" for t in times))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pdf', default='tests/sample.pdf')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100, 1000])
+    main(parser.parse_args())
@@ -0,0 +1,71 @@
+"""Cost of the prediction log on the request path, relative to a forward pass.
+
+    python -m benchmarks.bench_prediction_log --batch-sizes 1 8 32
+
+Times the ResNet-18 forward pass with and without the avgpool hook keeping
+the embeddings, and `PredictionLogger.record` per image (the writes happen
+on the logger thread and are timed separately, per row).
+"""
+import time
+import argparse
+import tempfile
+
+import torch
+from torchvision import models
+
+from utils.model import ChannelsLast, capture_embeddings, pop_embeddings
+from utils.prediction_log import PredictionLogger
+
+
+def best_of(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(args):
+    torch.set_num_threads(args.threads)
+    plain = ChannelsLast(models.resnet18(weights=None, num_classes=2)).eval()
+    hooked = capture_embeddings(ChannelsLast(models.resnet18(weights=None, num_classes=2)).eval())
+    print(f"{'batch':>5} {'forward':>10} {'+hook':>10} {'record/img':>11} {'write/img':>10} {'overhead':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for batch_size in args.batch_sizes:
+            images = torch.randn(batch_size, 3, 224, 224)
+
+            def forward(model):
+                with torch.inference_mode():
+                    model(images)
+                    return pop_embeddings()
+
+            forward(plain), forward(hooked)
+            plain_time = best_of(lambda: forward(plain), args.repeat)
+            hooked_time = best_of(lambda: forward(hooked), args.repeat)
+
+            embeddings = forward(hooked)
+            logger = PredictionLogger(directory, batch_rows=10 ** 9, flush_interval=3600)
+            rows = 10_000
+
+            def record():
+                for i in range(rows):
+                    logger.record('predict', 'v1', 'cat', 0.9, 12.0, 640, 480, 50_000,
+                                  embedding=embeddings[i % batch_size])
+
+            record_time = best_of(record, 1) / rows
+            write_time = best_of(logger.flush, 1) / rows
+            logger.close()
+
+            per_image = plain_time / batch_size
+            overhead = (max(hooked_time - plain_time, 0) / batch_size + record_time) / per_image
+            print(f"{batch_size:>5} {plain_time * 1000:>8.2f}ms {hooked_time * 1000:>8.2f}ms "
+                  f"{record_time * 1e6:>9.2f}us {write_time * 1e6:>8.2f}us {overhead:>8.2%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=torch.get_num_threads())
+    main(parser.parse_args())
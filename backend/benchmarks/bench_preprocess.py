@@ -0,0 +1,58 @@
+"""Microbenchmark of the fused Preprocessor against the torchvision Compose pipeline.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_preprocess --batch-sizes 1 8 32 128 --width 1280
+
+Images are decoded once beforehand, so only preprocessing is measured.
+"""
+import time
+import argparse
+
+import numpy as np
+import torch
+from PIL import Image
+
+from utils.transform import data_transforms, preprocessor
+
+
+def make_images(count, width):
+    height = width * 3 // 4
+    return [Image.fromarray(np.random.randint(0, 255, size=(height, width, 3), dtype=np.uint8))
+            for _ in range(count)]
+
+
+def compose_batch(images, out=None):
+    return torch.stack([data_transforms(image) for image in images])
+
+
+def fused_batch(images, out=None):
+    return preprocessor.batch(images, out=out)
+
+
+def timeit(func, images, out, repeat):
+    func(images, out)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(images, out)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(args):
+    print(f"{'batch':>6} {'Compose':>12} {'fused':>12} {'speedup':>8} {'fused img/s':>12}")
+    for batch_size in args.batch_sizes:
+        images = make_images(batch_size, args.width)
+        out = preprocessor.empty(batch_size)
+        repeat = max(1, args.images // batch_size)
+        compose = timeit(compose_batch, images, out, repeat)
+        fused = timeit(fused_batch, images, out, repeat)
+        print(f"{batch_size:>6} {compose * 1000:>10.2f}ms {fused * 1000:>10.2f}ms "
+              f"{compose / fused:>7.2f}x {batch_size / fused:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--width', type=int, default=1280, help='width of the decoded images')
+    parser.add_argument('--images', type=int, default=256, help='images processed per measurement')
+    main(parser.parse_args())
@@ -0,0 +1,40 @@
+"""Summarization throughput, in pages per second, on tests/sample.pdf.
+
+Run from the backend folder (downloads the summarization model on first use):
+
+    python -m benchmarks.bench_summarize --copies 20 --batch-sizes 1 4 8 --parallel 2
+
+`--copies` repeats the pages of the sample to get a longer document, so the
+map-reduce levels and the batching have something to work on.
+"""
+import time
+import asyncio
+import argparse
+
+from PyPDF2 import PdfReader
+
+from utils.summarizer import SummarizationEngine, get_summarizer
+
+
+def main(args):
+    pages = [page.extract_text() or "" for page in PdfReader(args.pdf).pages] * args.copies
+    text = "\n\n".join(pages)
+    summarizer = get_summarizer()
+    print(f"{len(pages)} pages, {len(text)} characters")
+
+    for batch_size in args.batch_sizes:
+        engine = SummarizationEngine(summarizer, batch_size=batch_size, parallel_batches=args.parallel)
+        start = time.perf_counter()
+        result = asyncio.run(engine.summarize(text))
+        elapsed = time.perf_counter() - start
+        print(f"batch {batch_size:>3}, parallel {args.parallel}: {len(pages) / elapsed:6.2f} pages/s "
+              f"({result['chunks']} chunks, {result['levels']} levels, {elapsed:.1f}s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pdf', default='tests/sample.pdf')
+    parser.add_argument('--copies', type=int, default=20)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--parallel', type=int, default=2)
+    main(parser.parse_args())
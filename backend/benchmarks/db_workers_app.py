@@ -0,0 +1,54 @@
+"""App served by benchmarks.bench_db_workers: the /auth router and the chat history write path, without the models.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m utils.models
+    DATABASE_URL=sqlite:////tmp/bench.db uvicorn benchmarks.db_workers_app:app --workers 4
+
+`BENCH_PASSWORD_SCHEME` (e.g. pbkdf2_sha256) swaps bcrypt for a cheaper
+scheme, so the run measures the database rather than the password hashing.
+"""
+import os
+
+from fastapi import FastAPI
+from passlib.context import CryptContext
+from pydantic import BaseModel
+
+from routers import auth as auth_router
+from utils import auth
+from utils.deps import user_dependency
+from utils.history import history_writer
+
+
+if os.getenv("BENCH_PASSWORD_SCHEME"):
+    scheme = os.environ["BENCH_PASSWORD_SCHEME"]
+    auth.bcrypt_context = CryptContext(schemes=[scheme], **{f'{scheme}__default_rounds': 1000})
+
+app = FastAPI()
+app.include_router(auth_router.router)
+
+
+class Exchange(BaseModel):
+    question: str
+    answer: str
+    conversation_id: str = 'bench'
+
+
+@app.get('/')
+def index():
+    return {"pid": os.getpid()}
+
+
+@app.post('/history')
+async def record_exchange(user: user_dependency, exchange: Exchange):
+    # What /chat/ does once the answer is in, minus the LLM
+    history_writer.record_exchange(user['id'], exchange.question, exchange.answer, exchange.conversation_id)
+    return {"queued": True}
+
+
+@app.get('/history/stats')
+def history_stats():
+    return history_writer.stats()
+
+
+@app.on_event("shutdown")
+def flush_history():
+    history_writer.close()
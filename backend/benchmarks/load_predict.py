@@ -0,0 +1,101 @@
+"""Load benchmark: latency of unrelated endpoints while /predict is saturated.
+
+Start the API first (`uvicorn app.main:app --workers 1`), then run from the backend folder:
+
+    python -m benchmarks.load_predict --username admin --password userpass --concurrency 32
+
+The probe endpoints are measured once on an idle server and once while
+`--concurrency` clients keep posting images to /predict/. With the inference
+executor in place both runs should report roughly the same p50/p99.
+"""
+import io
+import time
+import asyncio
+import argparse
+
+import httpx
+import numpy as np
+from PIL import Image
+
+
+PROBE_ENDPOINTS = ['/', '/users_count/']
+
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q)) * 1000 if samples else float('nan')
+
+
+def make_image(size=(640, 480)):
+    """Random JPEG used when no --image is given."""
+    array = np.random.randint(0, 255, size=(size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+async def login(client, username, password):
+    response = await client.post('/auth/token', data={'username': username, 'password': password})
+    response.raise_for_status()
+    return response.json()['access_token']
+
+
+async def saturate_predict(client, token, image_bytes, stop):
+    headers = {'Authorization': f'Bearer {token}'}
+    done = 0
+    while not stop.is_set():
+        await client.post('/predict/', headers=headers,
+                          files={'file': ('image.jpg', image_bytes, 'image/jpeg')})
+        done += 1
+    return done
+
+
+async def probe(client, duration, interval):
+    latencies = {endpoint: [] for endpoint in PROBE_ENDPOINTS}
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        for endpoint in PROBE_ENDPOINTS:
+            start = time.perf_counter()
+            await client.get(endpoint)
+            latencies[endpoint].append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+def report(title, latencies):
+    print(title)
+    for endpoint, samples in latencies.items():
+        print(f"  {endpoint:<16} n={len(samples):<5} "
+              f"p50={percentile(samples, 50):7.2f} ms  p99={percentile(samples, 99):7.2f} ms")
+
+
+async def main(args):
+    image_bytes = open(args.image, 'rb').read() if args.image else make_image()
+    limits = httpx.Limits(max_connections=args.concurrency + 8)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        token = await login(client, args.username, args.password)
+
+        report("Idle server", await probe(client, args.duration, args.interval))
+
+        stop = asyncio.Event()
+        load = [asyncio.create_task(saturate_predict(client, token, image_bytes, stop))
+                for _ in range(args.concurrency)]
+        start = time.perf_counter()
+        latencies = await probe(client, args.duration, args.interval)
+        stop.set()
+        predictions = sum(await asyncio.gather(*load))
+        elapsed = time.perf_counter() - start
+
+        report(f"/predict saturated by {args.concurrency} clients", latencies)
+        print(f"  /predict throughput: {predictions / elapsed:.1f} images/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--image', help='image posted to /predict/ (random JPEG if omitted)')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10, help='seconds per phase')
+    parser.add_argument('--interval', type=float, default=0.05, help='pause between probes')
+    asyncio.run(main(parser.parse_args()))
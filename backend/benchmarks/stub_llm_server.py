@@ -0,0 +1,61 @@
+"""Stub OpenAI-compatible chat completion server, for offline benchmarks of the LLM client.
+
+    uvicorn benchmarks.stub_llm_server:app --port 9000
+
+Then point the API or the benchmark at it with `LLM_BASE_URL=http://127.0.0.1:9000/v1`.
+Latency, answer length and failure rate are set with STUB_LATENCY_MS,
+STUB_TOKENS, STUB_TOKEN_DELAY_MS and STUB_FAILURE_RATE.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", 200))
+STUB_TOKENS = int(os.getenv("STUB_TOKENS", 20))
+STUB_TOKEN_DELAY_MS = float(os.getenv("STUB_TOKEN_DELAY_MS", 10))
+STUB_FAILURE_RATE = float(os.getenv("STUB_FAILURE_RATE", 0))
+
+app = FastAPI()
+calls = {"completions": 0}
+
+
+def _answer(messages):
+    question = messages[-1]["content"] if messages else ""
+    return [f"token{i} " for i in range(STUB_TOKENS - 1)] + [f"({len(question)} chars)"]
+
+
+@app.post('/v1/chat/completions')
+async def completions(request: Request):
+    body = await request.json()
+    calls["completions"] += 1
+    if random.random() < STUB_FAILURE_RATE:
+        return JSONResponse({"error": "overloaded"}, status_code=503)
+    await asyncio.sleep(STUB_LATENCY_MS / 1000)
+    tokens = _answer(body.get("messages", []))
+
+    if not body.get("stream"):
+        return {
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "".join(tokens)}}],
+        }
+
+    async def events():
+        for token in tokens:
+            await asyncio.sleep(STUB_TOKEN_DELAY_MS / 1000)
+            chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type='text/event-stream')
+
+
+@app.get('/stats')
+async def stats():
+    return calls
@@ -4,14 +4,16 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from fastapi.security import OAuth2PasswordRequestForm
 from jose import jwt
+from sqlalchemy import select
 from dotenv import load_dotenv
 import os
 
 
 # personal imports
 from utils.models import User
-from utils.deps import db_dependency, bcrypt_context
-from utils.auth import user_dependency
+from utils.deps import async_db_dependency
+from utils.auth import hash_password, verify_password
+from utils.aggregates import increment_statement
 
 
 load_dotenv()
@@ -33,11 +35,14 @@ class Token(BaseModel):
     token_type: str
     
     
-def authenticate_user(username: str, password: str, db):
-    user = db.query(User).filter(User.username == username).first()
+async def authenticate_user(username: str, password: str, db):
+    query = select(User.id, User.username, User.hashed_password).where(User.username == username)
+    user = (await db.execute(query)).first()
+    # End the read before waiting on bcrypt, so queued logins do not hold every pooled connection
+    await db.rollback()
     if not user:
         return False
-    if not bcrypt_context.verify(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -48,21 +53,23 @@ def create_access_token(username: str, user_id: int, expires_delta: timedelta):
     return jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_user(db: db_dependency, create_user_request: UserCreateRequest):
+async def create_user(db: async_db_dependency, create_user_request: UserCreateRequest):
+    hashed_password = await hash_password(create_user_request.password)
     try:
         create_user_model = User(
         username=create_user_request.username,
-        hashed_password=bcrypt_context.hash(create_user_request.password))
+        hashed_password=hashed_password)
         db.add(create_user_model)
-        db.commit()
+        await db.execute(increment_statement(db, {'users': 1}))
+        await db.commit()
     except Exception as e:
-       db.rollback()
+       await db.rollback()
        raise HTTPException(status_code=400, detail="Error creating user: " + str(e))
     
 @router.post('/token', response_model=Token)
 async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-                                 db: db_dependency):
-    user = authenticate_user(form_data.username, form_data.password, db)
+                                 db: async_db_dependency):
+    user = await authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user")
     token = create_access_token(user.username, user.id, timedelta(minutes=20))
@@ -1,7 +1,16 @@
+import json
+import time
+
 from fastapi import APIRouter
 from fastapi import HTTPException
-from utils.api import Client, ChatRequest
+from fastapi.responses import StreamingResponse
+from utils.api import ChatRequest, CHAT_MODEL, SYSTEM_PROMPT
+from utils.chat_cache import chat_cache
 from utils.deps import db_dependency, user_dependency
+from utils.context import context_builder
+from utils.history import history_writer
+from utils.llm import llm_client, CircuitOpenError
+from utils.streaming import TokenStream
 # import markdown as md
 
 
@@ -10,71 +19,95 @@ router = APIRouter(
     tags=['Summarize or Chat']
 )
 
-# Dummy list to hold chat messages
-chat_history = []
-
 @router.post('/')
 async def chat(
-      db: db_dependency, user: user_dependency, 
+      db: db_dependency, user: user_dependency,
       chat_request: ChatRequest,
     #   file: UploadFile = File(...),
-     
+
 ):
     #  Test chat request:
     try:
         # if   chat_request.content:
-            stream = Client.chat.completions.create(
-                 messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a wise  assistant. Your name is Okapi. You are helping a user with a question.",
-                    },
-                    {
-                        "role": "user",
-                        "content": chat_request.content,
-                    },
-                ],
+            messages = await context_builder.build(user['id'], chat_request.content, chat_request.conversation_id)
+            # Answers depend on the earlier turns, only opening questions are cached
+            cacheable = len(messages) == 2
+            response_message = await chat_cache.get(chat_request.content, CHAT_MODEL, SYSTEM_PROMPT) if cacheable else None
+            if response_message is not None:
+                context_builder.record_exchange(user['id'], chat_request.content, response_message,
+                                                chat_request.conversation_id)
+                return {"response": response_message, "cached": True}
+
+            started = time.perf_counter()
+            response_message = await llm_client.chat(
+                messages,
                 # temperature=0.1,
                 # max_tokens=524,
-                # top_p=1,
-                # stop= None,
-                # model="mixtral-8x7b-32768",  # Groq model - commented out
-                model="HuggingFaceTB/SmolLM3-3B",  # Hugging Face model that works
-                # stream=True,
+                model=CHAT_MODEL,
             )
+            if cacheable:
+                await chat_cache.set(chat_request.content, CHAT_MODEL, SYSTEM_PROMPT,
+                                     response_message, time.perf_counter() - started)
+            # Written in the background, the answer is not delayed by the database
+            context_builder.record_exchange(user['id'], chat_request.content, response_message,
+                                            chat_request.conversation_id)
+            return {"response": response_message}
 
-            # def stream_response():
-            #     for chunk in stream:
-            #         content = chunk.choices[0].delta.content
-            #         if content:
-            #             yield {"response": content}
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Groq API error: {str(e)}")
 
-            # prettified_output = ""
-            # for message in stream_response():
-            #     prettified_output += md.convert(message["response"]) + "\n"
 
-            # return {"response": prettified_output}
+@router.get('/stats')
+async def chat_stats():
+    """LLM client counters (retries, coalescing, circuit breaker), response cache hit rates and history writes."""
+    return {**llm_client.stats(), "cache": chat_cache.stats(), "history": history_writer.stats()}
 
-            # stream_messages = []
-            # for chunk in stream:
-            #     content = chunk.choices[0].delta.content
-            #     if content:
-            #         stream_messages.append(content)
-            #         yield {"response": [ word  for word in stream_messages]}  # Yield content for streaming
-            # # all_messages = [message for message in stream]
-            # all_messages = []
-            # for message in stream:
-            #     all_messages.append(message.choices[0].delta.content)
 
-            # print("Debugging all_messages", all_messages)   
-            # return {"response": all_messages}
+def _sse(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
-            response_message = stream.choices[0].message.content
-            chat_history.append(chat_request.content)  # Store user message
-            chat_history.append(response_message)  # Store AI response
-            return {"response": response_message}
-   
-   
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Groq API error: {str(e)}")
-    
+
+@router.post('/stream')
+async def chat_stream(user: user_dependency, chat_request: ChatRequest):
+    """Stream the answer token by token as Server-Sent Events.
+
+    Every token is sent as a `data: {"token": ...}` event. The last event is
+    `event: done` with the time to first token and the total latency, or
+    `event: error` if the model failed. A cached answer comes as a single token.
+    """
+    async def events():
+        stream = None
+        try:
+            messages = await context_builder.build(user['id'], chat_request.content, chat_request.conversation_id)
+            cacheable = len(messages) == 2
+            cached = await chat_cache.get(chat_request.content, CHAT_MODEL, SYSTEM_PROMPT) if cacheable else None
+            if cached is not None:
+                yield _sse({"token": cached})
+                context_builder.record_exchange(user['id'], chat_request.content, cached,
+                                                chat_request.conversation_id)
+                yield _sse({"cached": True}, event="done")
+                return
+            stream = TokenStream(messages, CHAT_MODEL)
+            async for token in stream:
+                yield _sse({"token": token})
+            context_builder.record_exchange(user['id'], chat_request.content, stream.text,
+                                            chat_request.conversation_id)
+            if cacheable:
+                await chat_cache.set(chat_request.content, CHAT_MODEL, SYSTEM_PROMPT,
+                                     stream.text, stream.timings()["total_ms"] / 1000)
+            yield _sse(stream.timings(), event="done")
+        except Exception as e:
+            yield _sse({"detail": f"Groq API error: {str(e)}"}, event="error")
+        finally:
+            # Also reached when the client disconnects and the response is cancelled
+            if stream is not None:
+                stream.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
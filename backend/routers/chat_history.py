@@ -1,14 +1,74 @@
-from fastapi import APIRouter
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Query
 from fastapi import HTTPException
-from utils.api import Client, ChatRequest
-from utils.deps import db_dependency, user_dependency
+from sqlalchemy import delete
+from utils.aggregates import increment_statement
+from utils.context import context_builder
+from utils.deps import async_db_dependency, user_dependency
+from utils.history import history_writer, fetch_messages, fetch_conversations
+from utils.models import ChatHistory
 
 
 router = APIRouter(
-    prefix='/chat',
+    prefix='/chat/history',
     tags=['Summarize or Chat']
 )
 
-# Dummy list to hold chat messages
 
-    
\ No newline at end of file
+async def flush_history():
+    # The write-behind flush is a blocking SQLite write, kept off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, history_writer.flush)
+
+
+@router.get('/')
+async def list_conversations(db: async_db_dependency, user: user_dependency):
+    """Conversations of the current user, most recent first."""
+    await flush_history()
+    return [
+        {"conversation_id": conversation_id, "messages": messages, "last_message_at": last_message_at}
+        for conversation_id, messages, last_message_at in await fetch_conversations(db, user['id'])
+    ]
+
+
+@router.get('/{conversation_id}')
+async def read_conversation(
+    db: async_db_dependency, user: user_dependency, conversation_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
+    """Messages of a conversation, newest first. Pass `next_cursor` back as `cursor` for older ones."""
+    # Read your own writes: messages may still be waiting in the write-behind queue
+    await flush_history()
+    try:
+        messages, next_cursor = await fetch_messages(db, user['id'], conversation_id, limit, cursor)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    return {
+        "messages": [
+            {
+                "id": message.id,
+                "role": message.role,
+                "content": message.content,
+                "created_at": message.created_at,
+                "token_count": message.token_count,
+            }
+            for message in messages
+        ],
+        "next_cursor": next_cursor,
+    }
+
+
+@router.delete('/{conversation_id}', status_code=204)
+async def delete_conversation(db: async_db_dependency, user: user_dependency, conversation_id: str):
+    await flush_history()
+    result = await db.execute(delete(ChatHistory).where(
+        ChatHistory.user_id == user['id'],
+        ChatHistory.conversation_id == conversation_id,
+    ))
+    if result.rowcount:
+        await db.execute(increment_statement(db, {'chats': -result.rowcount}))
+    await db.commit()
+    # The next /chat in this conversation must not send the deleted turns (nor their summary) again
+    context_builder.forget(user['id'], conversation_id)
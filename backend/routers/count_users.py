@@ -1,6 +1,6 @@
 from fastapi import APIRouter
-from utils.deps import db_dependency
-from utils.models import User
+
+from utils.aggregates import aggregates
 
 
 router = APIRouter(
@@ -10,6 +10,6 @@ router = APIRouter(
 
 
 @router.get('/')
-def read_users_count(db=db_dependency):
-    count = db.query(User).count()
-    return count
\ No newline at end of file
+async def read_users_count():
+    # From the in-memory counters of /stats, no COUNT(*) per call
+    return (await aggregates.snapshot())['users']
@@ -1,17 +1,69 @@
-from fastapi import APIRouter
-from utils.deps import db_dependency, user_dependency
+import os
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from dotenv import load_dotenv
+
+from utils.database import AsyncSessionLocal
+from utils.deps import async_db_dependency, user_dependency
 from utils.models import User
 
 
+load_dotenv()
+
 router = APIRouter(
     prefix='/users',
     tags=['Get all users']
 )
 
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", 100))
+USERS_MAX_PAGE_SIZE = int(os.getenv("USERS_MAX_PAGE_SIZE", 1000))
+
+
+async def users_page(db, after=None, limit=USERS_PAGE_SIZE):
+    """Users with `id > after`, in id order, and the cursor of the next page (None on the last one).
+
+    Keyset pagination on the primary key, every page is an index range scan.
+    Only the public columns are read, never the password hashes.
+    """
+    query = select(User.id, User.username).order_by(User.id).limit(limit + 1)
+    if after is not None:
+        query = query.where(User.id > after)
+    rows = (await db.execute(query)).all()
+    users = [{"id": row.id, "username": row.username} for row in rows[:limit]]
+    next_cursor = users[-1]["id"] if len(rows) > limit else None
+    return users, next_cursor
+
+
+@router.get('/')
+@router.post('/', include_in_schema=False)
+async def read_users(db: async_db_dependency, user: user_dependency,
+                     limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_MAX_PAGE_SIZE),
+                     cursor: Optional[int] = None):
+    """One page of users. Pass `next_cursor` back as `cursor` for the next one."""
+    users, next_cursor = await users_page(db, cursor, limit)
+    return {"response": users, "next_cursor": next_cursor}
+
 
-@router.post('/')
-async def read_users(db: db_dependency, user: user_dependency):
-    users = db.query(User).all()
-    return {"response": users }
+@router.get('/stream')
+async def stream_users(user: user_dependency, cursor: Optional[int] = None,
+                       page_size: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_MAX_PAGE_SIZE)):
+    """Every user (after `cursor`) as NDJSON, read one keyset page at a time."""
 
+    async def lines():
+        after = cursor
+        # Its own session: the request's is closed before the body is sent
+        async with AsyncSessionLocal() as db:
+            while True:
+                users, after = await users_page(db, after, page_size)
+                # Between pages no transaction stays open, nor a read snapshot holding back the WAL
+                await db.rollback()
+                for row in users:
+                    yield json.dumps(row) + "\n"
+                if after is None:
+                    break
 
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
@@ -0,0 +1,42 @@
+from fastapi import APIRouter
+from fastapi import HTTPException
+from utils.deps import user_dependency
+from utils.jobs import job_queue
+
+
+router = APIRouter(
+    prefix='/jobs',
+    tags=['Background jobs']
+)
+
+
+async def _own_job(job_id: str, user: dict):
+    job = await job_queue.get(job_id)
+    if job is None or job["user_id"] != user['id']:
+        raise HTTPException(status_code=404, detail='Job not found')
+    return job
+
+
+@router.get('/')
+async def list_jobs(user: user_dependency, limit: int = 50):
+    """Jobs of the current user, most recent first."""
+    return await job_queue.list(user['id'], limit)
+
+
+@router.get('/stats')
+async def jobs_stats():
+    return job_queue.stats()
+
+
+@router.get('/{job_id}')
+async def read_job(user: user_dependency, job_id: str):
+    """Status, progress and, once done, result or error of a job."""
+    return await _own_job(job_id, user)
+
+
+@router.delete('/{job_id}')
+async def cancel_job(user: user_dependency, job_id: str):
+    await _own_job(job_id, user)
+    if not await job_queue.cancel(job_id):
+        raise HTTPException(status_code=409, detail='Job already finished')
+    return {"id": job_id, "status": "cancelling"}
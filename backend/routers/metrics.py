@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from utils.metrics import metrics
+
+
+router = APIRouter(
+    prefix='/metrics',
+    tags=['Metrics']
+)
+
+# Version of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@router.get('', response_class=PlainTextResponse)
+async def read_metrics():
+    """Request counts and latency histograms of this worker, for Prometheus to scrape."""
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
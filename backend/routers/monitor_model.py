@@ -1,11 +1,14 @@
 import os 
+import asyncio
 import logging
 import tempfile
 import pandas as pd
 import numpy as np
 import requests 
-from typing import Callable, Text
-from fastapi import APIRouter, HTTPException
+import functools
+from collections import OrderedDict
+from typing import Callable, Optional, Text
+from fastapi import APIRouter, HTTPException, Query, Header
 from fastapi.responses import (
     HTMLResponse,
     JSONResponse,
@@ -13,6 +16,7 @@ from fastapi.responses import (
     FileResponse
 )
 
+import evidently
 from evidently import ColumnMapping
 from evidently.report import Report
 from evidently.test_suite import TestSuite
@@ -30,35 +34,70 @@ from evidently.ui.dashboards import TestSuitePanelType
 from evidently.renderers.html_widgets import WidgetSize
 from dotenv import load_dotenv
 
+from utils.deps import user_dependency
+from utils.jobs import job_queue
+from utils.monitoring import log_monitor, MONITORING_WINDOW_HOURS
+from utils.report_cache import ReportCache, report_key, etag_matches
+from utils.metrics import stage
+
 
 
 
 load_dotenv()
 
-DATA_RAW_PATH=os.getenv("DATA_RAW_PATH")
 EVIDENTLY_AI_TOKEN=os.getenv("EVIDENTLY_AI_TOKEN")
 EVIDENTLY_TEAM_ID=os.getenv("EVIDENTLY_TEAM_ID")
+EVIDENTLY_PROJECT=os.getenv("EVIDENTLY_PROJECT", "mlops project")
 
-REPORTS_DIR=os.getenv("REPORTS_DIR")
+# Windows whose report is rendered again in the background when new logs arrive, and how often to check
+REPORT_REFRESH_INTERVAL=float(os.getenv("REPORT_REFRESH_INTERVAL", 60))
+REPORT_REFRESH_WINDOWS=int(os.getenv("REPORT_REFRESH_WINDOWS", 8))
+# Part of the report keys: changing the metrics or Evidently renders new reports
+REPORT_METRICS=f"TextEvals(response, [TextLength]) evidently=={evidently.__version__}"
 
 router = APIRouter(
     prefix='/monitor-model',
     tags=['Monitor the performance of the model']
 )
 
-
-@router.post('/', response_class=FileResponse)
-def monitor_model_performance(window_size:int = 300) -> FileResponse: 
+# Read from the log store, the other columns are not loaded
+REPORT_COLUMNS = ['start_time', 'end_time', 'question', 'response',
+                  'organization', 'model_ID', 'region', 'environment', 'feedback']
+
+_cloud_project = None
+report_cache = ReportCache()
+_recent_windows = OrderedDict()
+_refresher = None
+
+
+def cloud_project():
+    """The Evidently cloud project of the reports, found or created once. None without EVIDENTLY_AI_TOKEN."""
+    global _cloud_project
+    if not EVIDENTLY_AI_TOKEN:
+        return None
+    if _cloud_project is None:
+        ws = CloudWorkspace(token=EVIDENTLY_AI_TOKEN, url="https://app.evidently.cloud")
+        projects = ws.search_project(EVIDENTLY_PROJECT, team_id=EVIDENTLY_TEAM_ID)
+        if projects:
+            project = projects[0]
+        else:
+            project = ws.create_project(EVIDENTLY_PROJECT, team_id=EVIDENTLY_TEAM_ID)
+            project.description = "This is a project to monitor the performance of LLMs"
+            project.save()
+        _cloud_project = (ws, project)
+    return _cloud_project
+
+
+def render_performance_report(start, end, path):
+    """Run the text evaluations on the assistant logs of [start, end) and save the HTML report to `path`."""
+    with stage('report_render'):
+        _render_performance_report(start, end, path)
+
+
+def _render_performance_report(start, end, path):
     logging.info("Monitoring the performance of the model")
-    logging.info("Loading the data")
-    assistant_logs = pd.read_csv(DATA_RAW_PATH, index_col=0, parse_dates=['start_time', 'end_time'])
-    assistant_logs.index = assistant_logs.start_time
-    assistant_logs.index.rename('index', inplace=True)
-
-    # Setting up the Cloud Workspace
-    ws = CloudWorkspace(token=EVIDENTLY_AI_TOKEN, url="https://app.evidently.cloud")
-    project = ws.create_project("mlops project", team_id=EVIDENTLY_TEAM_ID)
-    project.description = "This is a project to monitor the performance of LLMs"
+    # Only the window is read, from the memory-mapped columnar store
+    assistant_logs = log_monitor.read_window(start, end, columns=REPORT_COLUMNS)
 
     # Run evaluations:
     column_mapping = ColumnMapping(
@@ -68,7 +107,7 @@ def monitor_model_performance(window_size:int = 300) -> FileResponse:
         categorical_features=['organization', 'model_ID', 'region', 'environment', 'feedback'],
     )
 
-    logging.info("Running the text evaluations")
+    logging.info("Running the text evaluations on %d rows", len(assistant_logs))
     text_evals_report = Report(metrics=[
         TextEvals(column_name="response",
                   descriptors=[
@@ -76,26 +115,111 @@ def monitor_model_performance(window_size:int = 300) -> FileResponse:
                       ]
                   )
     ])
+    text_evals_report.run(reference_data=None, current_data=assistant_logs, column_mapping=column_mapping)
+    text_evals_report.save_html(path)
+
+    # The cloud workspace is optional, the local report does not depend on it
+    try:
+        cloud = cloud_project()
+        if cloud is not None:
+            ws, project = cloud
+            ws.add_report(project.id, text_evals_report)
+    except Exception:
+        logging.exception("Could not upload the report to Evidently cloud")
+
+
+async def performance_report(window_size: int = MONITORING_WINDOW_HOURS, remember: bool = True):
+    """Key and path of the report of the last `window_size` hours of logs, rendered only if not cached."""
+    loop = asyncio.get_running_loop()
+    window = await loop.run_in_executor(None, log_monitor.window_version, window_size)
+    if window is None:
+        raise HTTPException(status_code=404, detail="No logs in the window")
+    if remember:
+        _recent_windows[window_size] = None
+        _recent_windows.move_to_end(window_size)
+        while len(_recent_windows) > REPORT_REFRESH_WINDOWS:
+            _recent_windows.popitem(last=False)
+    key = report_key(start=window["start"], end=window["end"], version=window["version"], metrics=REPORT_METRICS)
+    path = await report_cache.get(key, functools.partial(render_performance_report, window["start"], window["end"]))
+    return key, path
+
+
+def report_response(key, path, if_none_match=None):
+    etag = f'"{key}"'
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    # no-cache: clients keep the report but check its ETag, the data may have changed
+    return FileResponse(path=path, filename='model_performance_report.html', media_type='text/html',
+                        headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+async def refresh_reports():
+    """Render the reports of the recently requested windows as soon as new logs arrive."""
+    while True:
+        await asyncio.sleep(REPORT_REFRESH_INTERVAL)
+        for window_size in list(_recent_windows):
+            try:
+                await performance_report(window_size, remember=False)
+            except HTTPException:
+                pass
+            except Exception:
+                logging.exception("Could not refresh the report of the last %d hours", window_size)
+
+
+def start_report_refresher():
+    global _refresher
+    if REPORT_REFRESH_INTERVAL > 0 and _refresher is None:
+        _refresher = asyncio.create_task(refresh_reports())
+
+
+async def stop_report_refresher():
+    global _refresher
+    if _refresher is not None:
+        _refresher.cancel()
+        await asyncio.gather(_refresher, return_exceptions=True)
+        _refresher = None
+
+
+@router.get('/summary')
+async def monitoring_summary(window_size: int = Query(MONITORING_WINDOW_HOURS, ge=1)):
+    """Text lengths, counts and feedback ratios of the last `window_size` hours of logs, from the hourly aggregates."""
+    loop = asyncio.get_running_loop()
+    summary = await loop.run_in_executor(None, log_monitor.summary, window_size)
+    return {**summary, "ingest": log_monitor.stats(), "reports": report_cache.stats()}
+
+
+@router.get('/report', response_class=FileResponse)
+async def get_performance_report(window_size: int = Query(MONITORING_WINDOW_HOURS, ge=1),
+                                 if_none_match: Optional[str] = Header(None)):
+    """The report of the last `window_size` hours, 304 when If-None-Match has its current ETag."""
+    key, path = await performance_report(window_size)
+    return report_response(key, path, if_none_match)
+
+
+@router.post('/', response_class=FileResponse)
+async def monitor_model_performance(window_size: int = Query(MONITORING_WINDOW_HOURS, ge=1)) -> FileResponse:
+    key, path = await performance_report(window_size)
+    return report_response(key, path)
+
+
+async def monitor_model_job(context, window_size: int = MONITORING_WINDOW_HOURS):
+    """Job handler: the report is rendered on a thread (or found in the cache), the result is its path."""
+    key, path = await performance_report(window_size)
+    return {"report_path": path, "etag": key}
+
 
-    logging.info("Running the text evaluations report")
-    text_evals_report.run(reference_data=None, current_data=assistant_logs[:100], column_mapping=column_mapping)
+job_queue.register('monitor_model', monitor_model_job)
 
-    # # Save the report to a temporary file
-    # with tempfile.NamedTemporaryFile(delete=False, suffix='.html') as tmp_file:
-    #     text_evals_report.save(tmp_file.name)
-    #     return FileResponse(path=tmp_file.name, filename='report.html', media_type='text/html')
-    # Specify a directory and filename
-    # report_directory = '/path/to/desired/directory'  # Adjust this path as necessary
-    report_filename = 'model_performance_report.html'
-    report_path = os.path.join(REPORTS_DIR, report_filename)
 
-    # Save the report
-    text_evals_report.save_html(report_path)
-    # save(report_path)
-    return FileResponse(path=report_path, filename=report_filename, media_type='text/html')
+@router.post('/jobs', status_code=202)
+async def submit_monitor_job(user: user_dependency, window_size: int = Query(MONITORING_WINDOW_HOURS, ge=1),
+                             priority: int = 0):
+    """Build the report in the background: returns a job id to poll on /jobs/{id} or to follow on /ws."""
+    job_id = await job_queue.submit('monitor_model', {"window_size": window_size}, user_id=user['id'], priority=priority)
+    return {"job_id": job_id}
 
 
 
 if __name__ == "__main__":
-    print(monitor_model_performance())
+    print(asyncio.run(performance_report())[1])
     print("Model performance monitoring completed successfully")
\ No newline at end of file
@@ -1,56 +1,46 @@
 import os
 import io
+import json
+import time
+import asyncio
 import numpy as np
+from typing import List
+from types import SimpleNamespace
 
-# PyTorch imports
-import torch
-import torch.nn as nn
-from torchvision.models import resnet18, ResNet18_Weights
-
-from fastapi import APIRouter, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, File, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from dotenv import load_dotenv
 
 # Visualization imports
 import matplotlib.pyplot as plt
 from PIL import Image
+import torch
 
 
 
 # Custom imports
 # from app.api import app
-from utils.model import model
-from utils.tools import get_classes
-from utils.transform import data_transforms, imshow_tensor
+from utils.model import CAT_DOG_MODEL, cat_dog_classes, device, model_version, pop_embeddings
+from utils.cache import prediction_cache
+from utils.registry import registry
+from utils.transform import data_transforms, imshow_tensor, preprocess_image, preprocessor, open_image
 from utils.deps import db_dependency, user_dependency
 from utils.models import ImageData
+from utils.inference import get_batcher, run_in_executor, run_model
+from utils.batch import BATCH_PREDICT_SIZE, iter_upload_images, chunked
+from utils.jobs import job_queue
+from utils.prediction_log import prediction_logger
+from utils.drift import run_drift, DRIFT_WINDOW_HOURS
+from utils.metrics import stage
 
 
 
 load_dotenv()
 
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-
-#Load the model
-model = resnet18(weights=ResNet18_Weights.DEFAULT)
-num_ftrs = model.fc.in_features
-model.fc = nn.Linear(num_ftrs, 2)  # 2 classes (binary classification)
-
-# Load the model's state_dict
-model_weight = os.environ.get("RESNET_CAT_AND_DOG_MODEL_WEIGHT")
-TRAIN_DATA_DIR = os.environ.get("TRAIN_DATA_DIR")
-classes = get_classes(path=TRAIN_DATA_DIR )
-
-model.load_state_dict(torch.load(model_weight, map_location=torch.device('cpu'), weights_only=True))
-
-model.eval()
-
-
-
-
-# Device configuration (CPU or GPU)
-model = model.to(device)
+# The model is loaded once per process by the registry and shared by every router;
+# concurrent requests share forward passes through the batcher, which also hands back the embeddings
+batcher = get_batcher(CAT_DOG_MODEL, device, capture=pop_embeddings)
 
 
 router = APIRouter(
@@ -68,24 +58,225 @@ async def upload_image(
 ):
     
     try:
+        started = time.perf_counter()
+        version = model_version()
         # Read the uploaded image file
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
 
-        # Apply the transformations
-        image = data_transforms(image).unsqueeze(0)  # Add batch dimension
-        image = image.to(device)
+        # Identical images get the cached prediction without being decoded again
+        key, cached = await run_in_executor(prediction_cache.lookup, contents, version)
+        if cached is not None:
+            prediction_logger.record('predict', version, cached.get("predicted_class"),
+                                     latency_ms=(time.perf_counter() - started) * 1000,
+                                     size=len(contents), cached=True)
+            return JSONResponse(content=cached)
 
-        # Perform inference
-        with torch.no_grad():  # No need for gradients during inference
-            outputs = model(image)
-            _, predicted = torch.max(outputs, 1)
-            predicted_class = classes[predicted.item()]
+        # Decode and apply the transformations off the event loop
+        image, (width, height) = await run_in_executor(_decode, contents, version)
+
+        # Perform inference, batched with the other in-flight requests (the wait for the batch included)
+        with stage('forward', version):
+            outputs, embedding = await batcher.predict_with_extras(image)
+        confidence, predicted = torch.softmax(outputs, dim=0).max(0)
+        predicted_class = cat_dog_classes()[predicted.item()]
+        result = {"predicted_class": predicted_class}
+        await run_in_executor(prediction_cache.set, key, result)
+        prediction_logger.record('predict', version, predicted_class, confidence.item(),
+                                 (time.perf_counter() - started) * 1000, width, height, len(contents),
+                                 embedding=embedding)
         # Return the prediction
-        return JSONResponse(content={"predicted_class": predicted_class})
+        return JSONResponse(content=result)
 
     except Exception as e:
         return JSONResponse(content={"error": str(e)})
 
 
+@router.post('/raw')
+async def upload_raw_image(request: Request, user: user_dependency):
+    """Classify an image sent as the raw request body (application/octet-stream) or as multipart.
+
+    Unlike a base64 JSON body, the bytes go straight from the request buffer to
+    the decoder: no JSON parsing, no base64 decoding and no intermediate copies.
+    """
+    try:
+        started = time.perf_counter()
+        version = model_version()
+        if request.headers.get('content-type', '').startswith('multipart/form-data'):
+            form = await request.form()
+            upload = next((value for value in form.values() if hasattr(value, 'file')), None)
+            if upload is None:
+                raise HTTPException(status_code=400, detail="No file in the multipart body")
+            # Decode from the spooled upload itself instead of reading it into memory first
+            data, size = upload.file, upload.size
+        else:
+            data = await request.body()
+            if not data:
+                raise HTTPException(status_code=400, detail="Empty request body")
+            size = len(data)
+
+        key, cached = await run_in_executor(prediction_cache.lookup, data, version)
+        if cached is not None:
+            prediction_logger.record('predict_raw', version, cached.get("predicted_class"),
+                                     latency_ms=(time.perf_counter() - started) * 1000, size=size, cached=True)
+            return JSONResponse(content=cached)
+
+        image, (width, height) = await run_in_executor(_decode, data, version)
+        with stage('forward', version):
+            outputs, embedding = await batcher.predict_with_extras(image)
+        confidence, predicted = torch.softmax(outputs, dim=0).max(0)
+        result = {"predicted_class": cat_dog_classes()[predicted.item()]}
+        await run_in_executor(prediction_cache.set, key, result)
+        prediction_logger.record('predict_raw', version, result["predicted_class"], confidence.item(),
+                                 (time.perf_counter() - started) * 1000, width, height, size,
+                                 embedding=embedding)
+        return JSONResponse(content=result)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _image_size(data):
+    # Only the header is parsed: the size before the draft mode of open_image shrinks JPEGs
+    if hasattr(data, 'read'):
+        data.seek(0)
+    with Image.open(data if hasattr(data, 'read') else io.BytesIO(data)) as image:
+        return image.size
+
+
+def _decode(contents, version=''):
+    with stage('decode', version):
+        image = open_image(contents)
+    with stage('transform', version):
+        tensor = preprocessor(image)
+    return tensor, _image_size(contents)
+
+
+def _preprocess_into(data, out, index, version=''):
+    """Decode one image into its slot of the batch buffer, returning its size or the error."""
+    # Archive members that failed to read arrive as exceptions instead of bytes
+    if isinstance(data, Exception):
+        return data
+    try:
+        with stage('decode', version):
+            image = open_image(data)
+        with stage('transform', version):
+            preprocessor.into(image, out, index)
+        return _image_size(data)
+    except Exception as e:
+        return e
+
+
+def _forward_batch(images, version=''):
+    # The embeddings are kept by the thread that ran the forward pass
+    with stage('forward', version):
+        return run_model(CAT_DOG_MODEL, images, device), pop_embeddings()
+
+
+def _iter_images(files):
+    for file in files:
+        yield from iter_upload_images(file.filename, file.file)
+
+
+async def _stream_batch_predictions(files):
+    classes = cat_dog_classes()
+    version = model_version()
+    # Only one chunk of BATCH_PREDICT_SIZE images is held in memory at a time
+    chunks = chunked(_iter_images(files), BATCH_PREDICT_SIZE)
+    # Every chunk is decoded into the same preallocated batch tensor
+    buffer = preprocessor.empty(BATCH_PREDICT_SIZE)
+    while chunk := await run_in_executor(next, chunks, None):
+        started = time.perf_counter()
+        # Decode and transform the chunk in parallel on the inference executor
+        decoded = await asyncio.gather(*(run_in_executor(_preprocess_into, data, buffer, i, version)
+                                         for i, (_, data) in enumerate(chunk)))
+        errors = [result if isinstance(result, Exception) else None for result in decoded]
+
+        probabilities = None
+        if any(error is None for error in errors):
+            # Slots of failed images hold stale data, their rows are simply ignored
+            outputs, embeddings = await run_in_executor(_forward_batch, buffer[:len(chunk)], version)
+            probabilities = torch.softmax(outputs, dim=1)
+        # Per image, the chunk is decoded and classified at once
+        latency_ms = (time.perf_counter() - started) * 1000 / len(chunk)
+
+        for i, (name, data) in enumerate(chunk):
+            if errors[i] is None:
+                confidence, predicted = probabilities[i].max(0)
+                result = {"filename": name, "predicted_class": classes[predicted.item()],
+                          "confidence": round(confidence.item(), 4)}
+                width, height = decoded[i]
+                prediction_logger.record('predict_batch', version, result["predicted_class"],
+                                         confidence.item(), latency_ms, width, height, len(data),
+                                         embedding=embeddings[i] if embeddings is not None else None)
+            else:
+                result = {"filename": name, "error": str(errors[i])}
+            yield json.dumps(result) + "\n"
+
+
+@router.post('/batch')
+async def upload_images_batch(
+      user: user_dependency,
+      files: List[UploadFile] = File(...)
+):
+    """Classify many images, or the images of zip/tar archives, streaming one NDJSON line per image."""
+    return StreamingResponse(_stream_batch_predictions(files), media_type='application/x-ndjson')
+
+
+async def predict_batch_job(context):
+    """Job handler: classify the uploaded images and archives, the predictions are the job result."""
+    files = [SimpleNamespace(filename=file["filename"], file=open(file["path"], 'rb')) for file in context.files]
+    predictions = []
+    try:
+        async for line in _stream_batch_predictions(files):
+            predictions.append(json.loads(line))
+            if len(predictions) % BATCH_PREDICT_SIZE == 0:
+                await context.progress(detail=f"{len(predictions)} images classified")
+    finally:
+        for file in files:
+            file.file.close()
+    return {"predictions": predictions}
+
+
+job_queue.register('predict_batch', predict_batch_job)
+
+
+@router.post('/batch/jobs', status_code=202)
+async def submit_batch_job(
+      user: user_dependency,
+      files: List[UploadFile] = File(...),
+      priority: int = 0,
+):
+    """Same as /predict/batch in the background: returns a job id to poll on /jobs/{id} or to follow on /ws."""
+    job_id = await job_queue.submit('predict_batch', user_id=user['id'], priority=priority, files=files)
+    return {"job_id": job_id}
+
+
+async def prediction_drift_job(context, hours: int = DRIFT_WINDOW_HOURS, rebuild_reference: bool = False):
+    """Job handler: compare the logged predictions of the window to the training images."""
+    await context.progress(detail="Comparing the logged predictions to the reference")
+    # Building the reference runs the model, on the inference executor
+    return await run_in_executor(run_drift, hours, rebuild_reference=rebuild_reference)
+
+
+job_queue.register('prediction_drift', prediction_drift_job)
+
+
+@router.post('/drift/jobs', status_code=202)
+async def submit_drift_job(user: user_dependency, hours: int = DRIFT_WINDOW_HOURS,
+                           rebuild_reference: bool = False, priority: int = 0):
+    """Drift of the embeddings, confidences and classes of the last `hours` hours against the training images."""
+    job_id = await job_queue.submit('prediction_drift', {"hours": hours, "rebuild_reference": rebuild_reference},
+                                    user_id=user['id'], priority=priority)
+    return {"job_id": job_id}
+
+
+@router.get('/stats')
+def inference_stats():
+    return {**batcher.stats(), "cache": prediction_cache.stats(), "prediction_log": prediction_logger.stats()}
+
 
+@router.get('/models')
+def loaded_models():
+    return registry.report()
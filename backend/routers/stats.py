@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Response
+
+from utils.aggregates import aggregates
+
+
+router = APIRouter(
+    prefix='/stats',
+    tags=['Statistics']
+)
+
+
+@router.get('/')
+async def read_stats(response: Response):
+    """Users, documents, chat messages and predictions per class, from memory (see `age_seconds`)."""
+    stats = await aggregates.snapshot()
+    # Dashboards polling faster than the refresh interval get the same numbers anyway
+    response.headers['Cache-Control'] = f"max-age={int(aggregates.refresh_interval)}"
+    return stats
@@ -0,0 +1,88 @@
+import json
+import logging
+
+from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi.responses import StreamingResponse
+
+from utils.deps import user_dependency
+from utils.jobs import job_queue
+from utils.pdf import extract_text_from_pdf, stream_pages
+from utils.summarizer import summarization_engine
+
+
+router = APIRouter(
+    prefix='/summarize',
+    tags=['Summarize or Chat']
+)
+
+
+def is_pdf(filename, content_type):
+    return content_type == 'application/pdf' or (filename or '').lower().endswith('.pdf')
+
+
+async def read_document(file: UploadFile):
+    """Text of an uploaded PDF or text file."""
+    if is_pdf(file.filename, file.content_type):
+        text = await extract_text_from_pdf(file)
+    else:
+        text = (await file.read()).decode('utf-8', errors='replace')
+    if not text.strip():
+        raise HTTPException(status_code=400, detail='No text found in the document')
+    return text
+
+
+@router.post('/')
+async def summarize(file: UploadFile = File(...)):
+    """Summary of a text or PDF document, map-reduced over chunks for long documents."""
+    text = await read_document(file)
+    try:
+        result = await summarization_engine.summarize(text)
+    except Exception as e:
+        logging.exception("Summarization failed")
+        raise HTTPException(status_code=503, detail=f"Summarization failed: {e}")
+    return result
+
+
+@router.post('/stream')
+async def summarize_stream(file: UploadFile = File(...)):
+    """Same as `/summarize/`, as NDJSON: one line per summarized chunk, then the final summary."""
+    text = await read_document(file)
+
+    async def lines():
+        try:
+            async for event in summarization_engine.stream(text):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            logging.exception("Summarization failed")
+            yield json.dumps({"error": f"Summarization failed: {e}"}) + "\n"
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+async def summarize_job(context):
+    """Job handler: summarize the uploaded document, reporting the chunks done."""
+    file = context.files[0]
+    await context.progress(0.0, "Extracting text")
+    if is_pdf(file["filename"], file["content_type"]):
+        text = "\n".join([page async for page in stream_pages(file["path"])])
+    else:
+        with open(file["path"], 'rb') as f:
+            text = f.read().decode('utf-8', errors='replace')
+
+    done = 0
+    async for event in summarization_engine.stream(text):
+        if event.get("level") == 0:
+            # The first level is most of the work, the reduce steps are much shorter
+            done += 1
+            await context.progress(0.9 * done / event["chunks"], f"Chunk {done}/{event['chunks']} summarized")
+    return event
+
+
+job_queue.register('summarize', summarize_job)
+
+
+@router.post('/jobs', status_code=202)
+async def submit_summarize_job(user: user_dependency, file: UploadFile = File(...), priority: int = 0):
+    """Summarize in the background: returns a job id to poll on /jobs/{id} or to follow on /ws."""
+    job_id = await job_queue.submit('summarize', user_id=user['id'], priority=priority, files=[file])
+    return {"job_id": job_id}
@@ -1,38 +1,149 @@
-from fastapi import WebSocket
-from starlette.endpoints import WebSocketEndpoint
+import json
+import asyncio
+
+from fastapi import APIRouter, WebSocket, HTTPException
 from starlette.websockets import WebSocketDisconnect
 
-from typing import List
-from app import app
+from typing import Dict, Optional, Set
+
+from utils.api import CHAT_MODEL
+from utils.context import context_builder
+from utils.deps import get_current_user
+from utils.jobs import job_queue, TERMINAL_STATUSES
+from utils.streaming import TokenStream
+
+
+router = APIRouter(
+    tags=['Chat over WebSocket']
+)
+
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        # Every connection keeps the task streaming its current answer, if any
+        self.active_connections: Dict[WebSocket, Optional[asyncio.Task]] = {}
+        # and the tasks following its job subscriptions
+        self.subscriptions: Dict[WebSocket, Set[asyncio.Task]] = {}
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections[websocket] = None
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        self.cancel(websocket)
+        self.active_connections.pop(websocket, None)
+        for task in self.subscriptions.pop(websocket, ()):
+            task.cancel()
+
+    def follow(self, websocket: WebSocket, coroutine):
+        task = asyncio.create_task(coroutine)
+        tasks = self.subscriptions.setdefault(websocket, set())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def is_streaming(self, websocket: WebSocket):
+        task = self.active_connections.get(websocket)
+        return task is not None and not task.done()
+
+    def start(self, websocket: WebSocket, coroutine):
+        self.active_connections[websocket] = asyncio.create_task(coroutine)
+
+    def cancel(self, websocket: WebSocket):
+        task = self.active_connections.get(websocket)
+        if task is not None and not task.done():
+            task.cancel()
+
+    async def send_json(self, websocket: WebSocket, data: dict):
+        await websocket.send_text(json.dumps(data))
 
     async def send_data(self, data: str):
-        for connection in self.active_connections:
+        for connection in list(self.active_connections):
             await connection.send_text(data)
 
+
 manager = ConnectionManager()
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+
+async def relay_chat(websocket: WebSocket, user: dict, content: str, conversation_id: Optional[str] = None):
+    """Stream the answer to one question over the connection, one message per token."""
+    stream = None
+    try:
+        messages = await context_builder.build(user['id'], content, conversation_id)
+        stream = TokenStream(messages, CHAT_MODEL)
+        async for token in stream:
+            # Awaiting the send is the backpressure: a slow client pauses the LLM stream
+            await manager.send_json(websocket, {"type": "token", "token": token})
+        context_builder.record_exchange(user['id'], content, stream.text, conversation_id)
+        await manager.send_json(websocket, {"type": "done", **stream.timings()})
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await manager.send_json(websocket, {"type": "error", "detail": str(e)})
+    finally:
+        if stream is not None:
+            stream.cancel()
+
+
+async def relay_job(websocket: WebSocket, user: dict, job_id: str):
+    """Send the updates of a job until it is finished."""
+    updates = job_queue.subscribe(job_id)
+    try:
+        job = await job_queue.get(job_id)
+        if job is None or job["user_id"] != user['id']:
+            await manager.send_json(websocket, {"type": "error", "detail": "Job not found"})
+            return
+        event = {key: job[key] for key in ("id", "status", "progress", "detail", "result", "error")}
+        while True:
+            await manager.send_json(websocket, {"type": "job", **event})
+            if event.get("status") in TERMINAL_STATUSES:
+                break
+            event = await updates.get()
+    finally:
+        job_queue.unsubscribe(job_id, updates)
+
+
+def parse_message(data: str):
+    """Messages are either plain text questions or JSON.
+
+    JSON messages: {"content": ..., "conversation_id": ...}, {"type": "cancel"}
+    or {"type": "subscribe", "job_id": ...} to follow a background job.
+    """
+    try:
+        message = json.loads(data)
+    except ValueError:
+        return {"type": "chat", "content": data}
+    if not isinstance(message, dict):
+        return {"type": "chat", "content": data}
+    message.setdefault("type", "chat")
+    return message
+
+
+@router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, token: str = None):
+    # Browsers cannot set headers on WebSockets, the JWT comes as `?token=`
+    try:
+        user = await get_current_user(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
     await manager.connect(websocket)
     try:
         while True:
-            data = await websocket.receive_text()
-            await manager.send_data(f"You wrote: {data}")
+            message = parse_message(await websocket.receive_text())
+            if message["type"] == "cancel":
+                manager.cancel(websocket)
+            elif message["type"] == "subscribe" and message.get("job_id"):
+                manager.follow(websocket, relay_job(websocket, user, message["job_id"]))
+            elif message["type"] == "chat" and message.get("content"):
+                if manager.is_streaming(websocket):
+                    await manager.send_json(websocket, {"type": "error", "detail": "An answer is already streaming"})
+                else:
+                    manager.start(websocket, relay_chat(websocket, user, message["content"], message.get("conversation_id")))
+            else:
+                await manager.send_json(websocket, {"type": "error", "detail": "Unknown message"})
     except WebSocketDisconnect:
+        pass
+    finally:
+        # Stops the LLM stream of a client that went away
         manager.disconnect(websocket)
-
-@app.on_event("startup")
-async def startup_event():
-    # Here, you could set up your data streaming and processing logic
-    pass
\ No newline at end of file
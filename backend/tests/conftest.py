@@ -0,0 +1,9 @@
+import os
+import shutil
+import atexit
+import tempfile
+
+# Set before utils.database is imported: the tests never touch the database of the app
+directory = tempfile.mkdtemp(prefix='okapi-tests-')
+atexit.register(shutil.rmtree, directory, ignore_errors=True)
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'okapi_app.db')}"
@@ -0,0 +1,131 @@
+import time
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from utils.aggregates import Aggregates, count_predictions, increment_statement
+from utils.database import Base, make_engine
+from utils.models import ChatHistory, User
+from utils.prediction_log import PredictionLogger
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    path = tmp_path / 'app.db'
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    async_engine = make_engine(f"sqlite+aiosqlite:///{path}", create=create_async_engine)
+    return sessionmaker(bind=engine), async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+def test_counters_are_backfilled_then_maintained_by_the_writers(sessions, tmp_path):
+    Session, AsyncSession = sessions
+    # Like AsyncSessionLocal: the insert fails at commit, after the counter was updated
+    db = Session(autoflush=False)
+    db.add_all([User(username='alice', hashed_password='x'), User(username='bob', hashed_password='x')])
+    db.add_all([ChatHistory(user_id=1, content='hi') for _ in range(3)])
+    db.commit()
+
+    logger = PredictionLogger(str(tmp_path / 'predictions'), flush_interval=3600)
+    for predicted_class in ['cat', 'cat', 'dog']:
+        logger.record('predict', 'v1', predicted_class)
+    logger.flush()
+
+    aggregates = Aggregates(AsyncSession, max_staleness=3600, prediction_log_dir=str(tmp_path / 'predictions'))
+    snapshot = asyncio.run(aggregates.snapshot())
+    assert (snapshot['users'], snapshot['documents'], snapshot['chats']) == (2, 0, 3)
+    assert snapshot['predictions'] == {'cat': 2, 'dog': 1}
+
+    # Writers count in their own transaction, a rolled back insert counts nothing
+    db.add(User(username='carol', hashed_password='x'))
+    db.execute(increment_statement(db, {'users': 1}))
+    db.commit()
+    db.add(User(username='alice', hashed_password='x'))
+    db.execute(increment_statement(db, {'users': 1}))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+
+    logger.add_listener(lambda table: count_predictions(table, Session))
+    logger.record('predict', 'v1', 'dog')
+    logger.close()
+
+    # Served from memory until refreshed
+    assert asyncio.run(aggregates.snapshot())['users'] == 2
+    asyncio.run(aggregates.refresh())
+    snapshot = asyncio.run(aggregates.snapshot())
+    assert snapshot['users'] == 3
+    assert snapshot['predictions'] == {'cat': 2, 'dog': 2}
+    assert aggregates.stats()['refreshes'] == 2
+
+
+def test_reads_past_the_staleness_bound_refresh(sessions, tmp_path):
+    Session, AsyncSession = sessions
+    aggregates = Aggregates(AsyncSession, max_staleness=0.05, prediction_log_dir=str(tmp_path / 'none'))
+    assert asyncio.run(aggregates.snapshot())['users'] == 0
+
+    db = Session()
+    db.add(User(username='alice', hashed_password='x'))
+    db.execute(increment_statement(db, {'users': 1}))
+    db.commit()
+
+    async def read_later():
+        await asyncio.sleep(0.1)
+        return await asyncio.gather(*(aggregates.snapshot() for _ in range(5)))
+
+    assert [snapshot['users'] for snapshot in asyncio.run(read_later())] == [1] * 5
+    # The concurrent reads shared one refresh
+    assert aggregates.stats()['refreshes'] == 2
+
+
+def test_increments_before_the_first_rebuild_are_not_taken_for_the_counts(sessions, tmp_path):
+    Session, AsyncSession = sessions
+    db = Session(autoflush=False)
+    db.add_all([User(username=f'user-{i}', hashed_password='x') for i in range(3)])
+    db.add_all([ChatHistory(user_id=1, content='hi') for _ in range(4)])
+    db.commit()
+    # Writers add to counters nobody has seeded yet: the rows only hold their increments
+    db.add(User(username='late', hashed_password='x'))
+    db.add(ChatHistory(user_id=1, content='late'))
+    db.execute(increment_statement(db, {'users': 1, 'chats': 1, 'documents': 0}))
+    db.commit()
+
+    aggregates = Aggregates(AsyncSession, max_staleness=3600, prediction_log_dir=str(tmp_path / 'none'))
+    snapshot = asyncio.run(aggregates.snapshot())
+    assert (snapshot['users'], snapshot['chats']) == (4, 5)
+
+
+def test_writers_in_flight_during_the_rebuild_are_counted_once(sessions, tmp_path):
+    Session, AsyncSession = sessions
+    db = Session(autoflush=False)
+    db.add_all([User(username=f'user-{i}', hashed_password='x') for i in range(3)])
+    db.commit()
+
+    def signup():
+        # Inserted, then counted a little later, in the same transaction
+        writer = Session(autoflush=False)
+        writer.add(User(username='new', hashed_password='x'))
+        writer.flush()
+        time.sleep(0.2)
+        writer.execute(increment_statement(writer, {'users': 1}))
+        writer.commit()
+
+    aggregates = Aggregates(AsyncSession, max_staleness=3600, prediction_log_dir=str(tmp_path / 'none'))
+
+    async def run():
+        # Connected first: switching the file to WAL needs the database to itself
+        async with AsyncSession() as session:
+            await session.execute(select(1))
+        loop = asyncio.get_running_loop()
+        signed_up = loop.run_in_executor(None, signup)
+        await asyncio.sleep(0.05)
+        await aggregates.refresh()
+        await signed_up
+        await aggregates.refresh()
+        return await aggregates.snapshot()
+
+    assert asyncio.run(run())['users'] == 4
@@ -0,0 +1,119 @@
+import json
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from routers import auth as auth_router, chat_history, count_users, get_users, stats
+from utils import auth
+from utils.aggregates import Aggregates, increment_statement
+from utils.context import Conversation, context_builder
+from utils.database import Base, make_engine
+from utils.deps import get_async_db
+from utils.history import fetch_messages
+from utils.models import ChatHistory
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(auth, 'AUTH_SECRET_KEY', 'test-secret')
+    monkeypatch.setattr(auth_router, 'SECRET_KEY', 'test-secret')
+    monkeypatch.setattr(auth, 'ALGORITHM', 'HS256')
+    monkeypatch.setattr(auth_router, 'ALGORITHM', 'HS256')
+    monkeypatch.setattr(auth, 'bcrypt_context', CryptContext(schemes=['pbkdf2_sha256'], pbkdf2_sha256__default_rounds=1000))
+
+    engine = make_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}", create=create_async_engine)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def create_tables():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+    asyncio.run(create_tables())
+
+    async def override_get_async_db():
+        async with Session() as db:
+            yield db
+
+    monkeypatch.setattr(get_users, 'AsyncSessionLocal', Session)
+    counters = Aggregates(Session, refresh_interval=0, max_staleness=0, prediction_log_dir=str(tmp_path / 'none'))
+    monkeypatch.setattr(count_users, 'aggregates', counters)
+    monkeypatch.setattr(stats, 'aggregates', counters)
+    app = FastAPI()
+    for module in (auth_router, count_users, get_users, chat_history, stats):
+        app.include_router(module.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    with TestClient(app) as client:
+        client.session_factory = Session
+        yield client
+
+
+def login(client, username):
+    assert client.post('/auth/', json={'username': username, 'password': 'secret'}).status_code == 201
+    response = client.post('/auth/token', data={'username': username, 'password': 'secret'})
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+def test_signup_login_and_count(client):
+    headers = login(client, 'alice')
+    assert client.post('/auth/token', data={'username': 'alice', 'password': 'wrong'}).status_code == 401
+    assert client.post('/auth/', json={'username': 'alice', 'password': 'x'}).status_code == 400
+    assert client.get('/users_count/').json() == 1
+    assert client.get('/users/', headers=headers).status_code == 200
+
+
+def test_users_are_listed_by_keyset_pages_and_streamed_without_hashes(client):
+    headers = login(client, 'user-00')
+    for i in range(1, 7):
+        client.post('/auth/', json={'username': f'user-{i:02d}', 'password': 'secret'})
+
+    names, cursor = [], None
+    while True:
+        params = {'limit': 3} if cursor is None else {'limit': 3, 'cursor': cursor}
+        page = client.get('/users/', params=params, headers=headers).json()
+        assert all(set(user) == {'id', 'username'} for user in page['response'])
+        names += [user['username'] for user in page['response']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert names == [f'user-{i:02d}' for i in range(7)]
+
+    response = client.get('/users/stream', params={'page_size': 2}, headers=headers)
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row['username'] for row in rows] == names
+    assert 'hashed_password' not in response.text
+
+
+def test_history_is_read_and_deleted_through_the_async_session(client):
+    headers = login(client, 'alice')
+    assert client.get('/stats/').json()['chats'] == 0
+    start = datetime(2024, 1, 1)
+
+    async def insert():
+        async with client.session_factory() as db:
+            db.add_all([ChatHistory(user_id=1, conversation_id='c1', role='user', content=f"message {i}",
+                                    created_at=start + timedelta(seconds=i)) for i in range(5)])
+            await db.execute(increment_statement(db, {'chats': 5}))
+            await db.commit()
+            messages, cursor = await fetch_messages(db, 1, 'c1', limit=2)
+            return [message.content for message in messages], cursor
+    assert asyncio.run(insert())[0] == ['message 4', 'message 3']
+
+    assert client.get('/chat/history/', headers=headers).json()[0]['messages'] == 5
+    assert client.get('/stats/').json()['chats'] == 5
+    page = client.get('/chat/history/c1', params={'limit': 3}, headers=headers).json()
+    assert [message['content'] for message in page['messages']] == ['message 4', 'message 3', 'message 2']
+    older = client.get('/chat/history/c1', params={'cursor': page['next_cursor']}, headers=headers).json()
+    assert [message['content'] for message in older['messages']] == ['message 1', 'message 0']
+    assert client.get('/chat/history/c1', params={'cursor': 'nope'}, headers=headers).status_code == 400
+
+    # The copy the context builder keeps for /chat is dropped with the conversation
+    context_builder._conversations[(1, 'c1')] = Conversation()
+    assert client.delete('/chat/history/c1', headers=headers).status_code == 204
+    assert (1, 'c1') not in context_builder._conversations
+    assert client.get('/chat/history/', headers=headers).json() == []
+    assert client.get('/stats/').json()['chats'] == 0
@@ -0,0 +1,34 @@
+import io
+import tarfile
+import zipfile
+
+from utils.batch import iter_upload_images, chunked
+
+
+def test_plain_image_is_yielded_as_is():
+    assert list(iter_upload_images('cat.jpg', io.BytesIO(b'jpeg bytes'))) == [('cat.jpg', b'jpeg bytes')]
+
+
+def test_zip_members_are_filtered_on_extension():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('pets/cat.jpg', b'cat')
+        archive.writestr('pets/dog.PNG', b'dog')
+        archive.writestr('notes.txt', b'ignored')
+
+    assert list(iter_upload_images('pets.zip', buffer)) == [('pets/cat.jpg', b'cat'), ('pets/dog.PNG', b'dog')]
+
+
+def test_compressed_tar_members_are_streamed():
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        info = tarfile.TarInfo('dog.jpg')
+        info.size = 3
+        archive.addfile(info, io.BytesIO(b'dog'))
+    buffer.seek(0, io.SEEK_END)  # the position left by the upload must not matter
+
+    assert list(iter_upload_images('pets.tgz', buffer)) == [('dog.jpg', b'dog')]
+
+
+def test_chunked():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
@@ -0,0 +1,72 @@
+import io
+
+from utils.cache import LRUCache, SQLiteCache, PredictionCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_used_over_budget():
+    # Every entry is 9 bytes: a 1 byte key and an 8 bytes payload
+    cache = LRUCache(max_bytes=27, ttl=60)
+    cache.set('a', {'v': 1})
+    cache.set('b', {'v': 2})
+    cache.get('a')
+    cache.set('c', {'v': 3})
+    cache.set('d', {'v': 4})
+
+    assert cache.get('b') is None
+    assert cache.get('a') == {'v': 1}
+    assert cache.size == 27
+
+
+def test_lru_entries_expire():
+    clock = FakeClock()
+    cache = LRUCache(max_bytes=1000, ttl=10, clock=clock)
+    cache.set('a', {'v': 1})
+
+    clock.now = 9
+    assert cache.get('a') == {'v': 1}
+    clock.now = 10
+    assert cache.get('a') is None
+    assert len(cache) == 0 and cache.size == 0
+
+
+def test_key_depends_on_content_and_model_version():
+    key = PredictionCache.key(b'image', 'v1')
+
+    assert key == PredictionCache.key(memoryview(b'image'), 'v1')
+    assert key == PredictionCache.key(io.BytesIO(b'image'), 'v1')
+    assert key != PredictionCache.key(b'image', 'v2')
+    assert key != PredictionCache.key(b'other', 'v1')
+
+
+def test_shared_tier_is_seen_by_other_workers(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first = PredictionCache(shared=SQLiteCache(path))
+    second = PredictionCache(shared=SQLiteCache(path))
+
+    key, cached = first.lookup(b'image', 'v1')
+    assert cached is None
+    first.set(key, {'predicted_class': 'cat'})
+
+    assert second.get(key) == {'predicted_class': 'cat'}
+    assert second.get(key) == {'predicted_class': 'cat'}
+    assert second.stats()['hits_shared'] == 1
+    assert second.stats()['hits_memory'] == 1
+    assert first.stats()['misses'] == 1
+
+
+def test_shared_tier_eviction_keeps_newest_entries(tmp_path):
+    shared = SQLiteCache(str(tmp_path / 'cache.db'), max_entries=2)
+    for key in 'abc':
+        shared.set(key, {'key': key})
+    shared.evict()
+
+    assert shared.get('a') is None
+    assert shared.get('c') == {'key': 'c'}
@@ -0,0 +1,68 @@
+import asyncio
+
+import numpy as np
+
+from utils.cache import LRUCache
+from utils.chat_cache import ChatCache, SemanticIndex, normalize_prompt
+
+
+WORDS = ['cat', 'dog', 'okapi', 'weather', 'name', 'your', 'what', 'is']
+
+
+def bag_of_words(texts):
+    """Stands in for the embedding model: normalized word counts."""
+    vectors = np.array([[text.split().count(word) for word in WORDS] for text in texts], dtype=np.float32) + 1e-3
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_cache(**kwargs):
+    return ChatCache(exact=LRUCache(1024 * 1024, 60), semantic=SemanticIndex(**kwargs), embedder=bag_of_words)
+
+
+def test_normalize_prompt():
+    assert normalize_prompt("  What is   your NAME?? ") == "what is your name"
+
+
+def test_exact_then_semantic_hits():
+    cache = make_cache(threshold=0.95)
+
+    async def run():
+        assert await cache.get("What is your name?", "m", "sys") is None
+        await cache.set("What is your name?", "m", "sys", "Okapi", latency=2.0)
+        exact = await cache.get("what is your  name", "m", "sys")
+        semantic = await cache.get("your name is what", "m", "sys")
+        unrelated = await cache.get("cat dog weather", "m", "sys")
+        return exact, semantic, unrelated
+
+    assert asyncio.run(run()) == ("Okapi", "Okapi", None)
+    stats = cache.stats()
+    assert (stats["hits_exact"], stats["hits_semantic"], stats["misses"]) == (1, 1, 2)
+    assert 0 < stats["latency_saved_seconds"] <= 4.0
+
+
+def test_model_and_system_prompt_are_part_of_the_key():
+    cache = make_cache()
+
+    async def run():
+        await cache.set("What is your name?", "m", "sys", "Okapi", latency=1.0)
+        return [await cache.get("What is your name?", model, system)
+                for model, system in [("other", "sys"), ("m", "other"), ("m", "sys")]]
+
+    assert asyncio.run(run()) == [None, None, "Okapi"]
+
+
+def test_semantic_index_evicts_least_recently_used_and_expired():
+    now = [0.0]
+    index = SemanticIndex(max_entries=2, ttl=10, threshold=0.99, clock=lambda: now[0])
+    a, b, c = np.eye(3, dtype=np.float32)
+    index.add("ns", a, "a")
+    now[0] = 1
+    index.add("ns", b, "b")
+    now[0] = 2
+    assert index.search("ns", a)[0] == "a"
+    index.add("ns", c, "c")
+    assert len(index) == 2
+    assert index.search("ns", b)[0] is None
+    assert index.search("ns", a)[0] == "a"
+    now[0] = 20
+    assert index.search("ns", c)[0] is None
@@ -0,0 +1,81 @@
+import asyncio
+
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import sessionmaker
+
+from utils.context import ContextBuilder, Conversation
+from utils.database import Base
+from utils.history import HistoryWriter, estimate_tokens
+from utils.models import ChatHistory
+
+
+def make_conversation(turns):
+    conversation = Conversation()
+    for i in range(turns):
+        conversation.add('user' if i % 2 == 0 else 'assistant', f"turn {i} " + "x" * 36)  # 11 tokens
+    return conversation
+
+
+def test_recent_turns_fit_in_the_budget_in_order():
+    builder = ContextBuilder(budget=100, summarize_after=10_000, summarizer=None)
+    messages = builder.pack(make_conversation(20), "question?", system_prompt="system")
+    contents = [message["content"] for message in messages]
+    assert contents[0] == "system" and contents[-1] == "question?"
+    assert [content.split()[1] for content in contents[1:-1]] == [str(i) for i in range(12, 20)]
+    assert sum(estimate_tokens(content) for content in contents) <= 100
+
+
+def test_old_turns_are_folded_into_the_summary():
+    summarized = []
+
+    def summarizer(text):
+        summarized.append(text)
+        return "they talked"
+
+    builder = ContextBuilder(budget=100, summarize_after=50, summarizer=summarizer)
+    conversation = make_conversation(20)
+
+    async def run():
+        builder.pack(conversation, "question?", system_prompt="system")
+        while conversation.summarizing:
+            await asyncio.sleep(0.01)
+        return builder.pack(conversation, "question?", system_prompt="system")
+
+    messages = asyncio.run(run())
+    assert summarized[0].startswith("user: turn 0")
+    assert messages[0]["content"].endswith("Summary of the earlier conversation: they talked")
+    # The summarized turns are gone, the recent ones are kept
+    assert len(conversation.turns) == 8
+
+
+def test_conversations_follow_the_other_workers_and_deletions(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}", connect_args={'check_same_thread': False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    # One builder, and its history writer, per worker process
+    first, second = (ContextBuilder(budget=1000, summarizer=None, session_factory=Session,
+                                    writer=HistoryWriter(session_factory=Session)) for _ in range(2))
+
+    def contents(messages):
+        return [message["content"] for message in messages[1:-1]]
+
+    async def run():
+        loaded = await first.conversation(1, 'c')
+        first.record_exchange(1, 'hi', 'hello', 'c')
+        # Its own exchanges are added to the copy, which is not loaded again
+        assert await first.conversation(1, 'c') is loaded
+
+        assert contents(await second.build(1, 'and?', 'c')) == ['hi', 'hello']
+        second.record_exchange(1, 'how are you?', 'fine', 'c')
+        # Written behind by the other worker, within HISTORY_FLUSH_INTERVAL
+        second.writer.flush()
+        assert contents(await first.build(1, 'and?', 'c')) == ['hi', 'hello', 'how are you?', 'fine']
+
+        # Deleted through the second worker: it forgets its copy, the first one notices the count
+        with Session() as db:
+            db.execute(delete(ChatHistory).where(ChatHistory.conversation_id == 'c'))
+            db.commit()
+        second.forget(1, 'c')
+        return contents(await first.build(1, 'new?', 'c')), contents(await second.build(1, 'new?', 'c'))
+
+    assert asyncio.run(run()) == ([], [])
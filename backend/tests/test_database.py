@@ -0,0 +1,58 @@
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from utils.database import Base, LazySession, make_engine
+from utils.models import User
+
+
+def test_sqlite_engine_is_tuned_for_concurrent_writers(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'app.db'}", pool_size=2, max_overflow=0)
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    assert engine.pool.size() == 2
+
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    errors = []
+
+    def signup(worker):
+        for i in range(20):
+            db = Session()
+            try:
+                db.add(User(username=f"user-{worker}-{i}", hashed_password='x'))
+                db.commit()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=signup, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert Session().query(User).count() == 80
+
+
+def test_lazy_session_opens_on_first_use():
+    opened = []
+
+    def factory():
+        session = sessionmaker(bind=make_engine('sqlite://'))()
+        opened.append(session)
+        return session
+
+    db = LazySession(factory)
+    db.close()
+    assert opened == [] and not db.opened
+
+    assert db.execute(text("SELECT 1")).scalar() == 1
+    db.execute(text("SELECT 2"))
+    assert len(opened) == 1 and db.opened
+    db.close()
+    assert not db.opened
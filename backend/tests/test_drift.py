@@ -0,0 +1,48 @@
+from datetime import datetime
+
+import numpy as np
+import torch
+
+from utils.drift import compute_drift, run_drift
+from utils.prediction_log import PredictionLogger
+
+
+def make_reference(rng, rows=500):
+    return {
+        "embeddings": rng.normal(0, 1, (rows, 16)).astype(np.float16),
+        "confidence": rng.beta(8, 2, rows).astype(np.float32),
+        "predicted": np.array(['cat', 'dog'] * (rows // 2)),
+        "model_version": np.array('v1'),
+    }
+
+
+def test_same_distribution_does_not_drift():
+    rng = np.random.default_rng(0)
+    reference = make_reference(rng)
+    report = compute_drift(reference, rng.beta(8, 2, 400), ['cat', 'dog'] * 200, rng.normal(0, 1, (400, 16)))
+    assert not report['drift']
+    assert report['embedding']['drifted_dimensions'] < 0.2
+
+
+def test_shifted_distribution_drifts():
+    rng = np.random.default_rng(0)
+    reference = make_reference(rng)
+    # Less confident, mostly cats, embeddings moved on every dimension
+    report = compute_drift(reference, rng.beta(2, 2, 400), ['cat'] * 350 + ['dog'] * 50,
+                           rng.normal(0.5, 1, (400, 16)))
+    assert report['drift']
+    assert report['confidence']['drift'] and report['predicted_class']['drift'] and report['embedding']['drift']
+
+
+def test_drift_of_the_logged_predictions(tmp_path):
+    rng = np.random.default_rng(1)
+    logger = PredictionLogger(str(tmp_path))
+    for i in range(100):
+        logger.record('predict', 'v1', 'cat' if i % 2 else 'dog', float(rng.beta(8, 2)),
+                      embedding=torch.from_numpy(rng.normal(0, 1, 16).astype(np.float32)))
+    logger.close()
+
+    report = run_drift(hours=1, end=datetime.utcnow(), directory=str(tmp_path), reference=make_reference(rng))
+    assert report['rows'] == 100 and report['drift'] is False
+    assert report['embedding']['rows'] == 100
+    assert run_drift(hours=1, directory=str(tmp_path / 'empty'))['drift'] is None
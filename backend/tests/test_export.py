@@ -0,0 +1,52 @@
+import pytest
+import torch
+import torch.nn as nn
+from torchvision import models
+
+from utils import export as export_module
+from utils import model as model_module
+from utils.model import load_cat_dog_model
+
+
+@pytest.fixture(scope='module')
+def exported(tmp_path_factory):
+    """A randomly initialized cat/dog ResNet-18, exported to every backend that needs no calibration data."""
+    directory = tmp_path_factory.mktemp('exported')
+    torch.manual_seed(0)
+    resnet = models.resnet18(weights=None)
+    resnet.fc = nn.Linear(resnet.fc.in_features, 2)
+    torch.save(resnet.state_dict(), directory / 'weights.pt')
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(model_module, 'RESNET_CAT_AND_DOG_MODEL_WEIGHT', str(directory / 'weights.pt'))
+        monkeypatch.setattr(model_module, 'EXPORT_DIR', str(directory))
+        monkeypatch.setattr(export_module, 'EXPORT_DIR', str(directory))
+        backends = ['torchscript', 'int8-dynamic']
+        try:
+            import onnx, onnxruntime  # noqa: F401
+            backends.append('onnx')
+        except ImportError:
+            pass
+        export_module.export(backends)
+        yield backends
+
+
+@pytest.mark.parametrize('backend, tolerance', [('torchscript', 1e-4), ('onnx', 1e-4), ('int8-dynamic', 0.1)])
+def test_exported_backends_match_the_eager_model(exported, backend, tolerance):
+    if backend not in exported:
+        pytest.skip('onnx and onnxruntime are not installed')
+    images = torch.randn(4, 3, 224, 224, generator=torch.Generator().manual_seed(1))
+    with torch.inference_mode():
+        expected = load_cat_dog_model('eager').cpu()(images)
+        logits = load_cat_dog_model(backend)(images)
+    assert logits.shape == (4, 2)
+    # Relative to the size of the logits: quantization error grows with them
+    assert (logits - expected).abs().max() <= tolerance * expected.abs().max()
+
+
+def test_unknown_and_missing_backends(exported):
+    with pytest.raises(ValueError, match='Unknown inference backend'):
+        load_cat_dog_model('tensorrt')
+    # Needs calibration images, so it was not exported
+    with pytest.raises(FileNotFoundError, match='int8-static'):
+        load_cat_dog_model('int8-static')
@@ -0,0 +1,69 @@
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from utils.database import Base
+from utils.history import HistoryWriter, get_messages, get_conversations
+from utils.models import ChatHistory, init_db
+
+
+def make_session_factory():
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def test_pages_follow_the_cursor_newest_first():
+    Session = make_session_factory()
+    writer = HistoryWriter(session_factory=Session, batch_size=4)
+    for i in range(10):
+        writer.record(1, 'user', f"message {i}", conversation_id='c1')
+    writer.record(2, 'user', "someone else", conversation_id='c1')
+    writer.record(1, 'user', "other conversation", conversation_id='c2')
+    writer.flush()
+    assert writer.stats()['batches'] == 3
+
+    db = Session()
+    contents, cursor = [], None
+    while True:
+        messages, cursor = get_messages(db, 1, 'c1', limit=3, cursor=cursor)
+        contents += [message.content for message in messages]
+        if cursor is None:
+            break
+    assert contents == [f"message {i}" for i in reversed(range(10))]
+    assert [(c, n) for c, n, _ in get_conversations(db, 1)] == [('c2', 1), ('c1', 10)]
+    writer.close()
+
+
+def test_background_thread_writes_batches():
+    Session = make_session_factory()
+    writer = HistoryWriter(session_factory=Session, flush_interval=0.01)
+    writer.record_exchange(1, "question", "answer")
+    deadline = time.time() + 2
+    while writer.stats()['written'] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    writer.close()
+
+    messages, _ = get_messages(Session(), 1, 'default')
+    assert [(m.role, m.content) for m in messages] == [('assistant', 'answer'), ('user', 'question')]
+    assert messages[0].token_count > 0
+
+
+def test_legacy_chat_history_with_rows_is_migrated(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE chat_history (id INTEGER PRIMARY KEY, user_id INTEGER, content VARCHAR)"))
+        connection.execute(text("INSERT INTO chat_history (user_id, content) VALUES (1, 'hello'), (1, 'world')"))
+
+    init_db(engine)
+    # Idempotent: nothing left to create or add the second time
+    init_db(engine)
+    assert {'users', 'jobs', 'aggregates'} <= set(inspect(engine).get_table_names())
+
+    messages = sessionmaker(bind=engine)().query(ChatHistory).order_by(ChatHistory.id).all()
+    assert [(m.content, m.conversation_id, m.role, m.token_count) for m in messages] == [
+        ('hello', 'default', 'user', 0), ('world', 'default', 'user', 0)]
+    assert all(isinstance(m.created_at, datetime) for m in messages)
@@ -0,0 +1,61 @@
+import asyncio
+
+import torch
+import torch.nn as nn
+
+from utils.inference import InferenceBatcher
+
+
+def make_model():
+    model = nn.Sequential(nn.Flatten(), nn.Linear(3 * 4 * 4, 2))
+    model.eval()
+    return model
+
+
+def test_concurrent_requests_share_a_forward_pass():
+    model = make_model()
+    batcher = InferenceBatcher(model, max_batch_size=8, max_wait_ms=50)
+    images = [torch.randn(3, 4, 4) for _ in range(8)]
+
+    async def run():
+        return await asyncio.gather(*(batcher.predict(image) for image in images))
+
+    outputs = asyncio.run(run())
+
+    with torch.no_grad():
+        expected = model(torch.stack(images))
+    for output, row in zip(outputs, expected):
+        assert torch.allclose(output, row, atol=1e-6)
+
+    stats = batcher.stats()
+    assert stats["requests"] == 8
+    assert stats["batches"] == 1
+    assert stats["batch_size_histogram"] == {8: 1}
+
+
+def test_batch_is_capped_at_max_batch_size():
+    batcher = InferenceBatcher(make_model(), max_batch_size=3, max_wait_ms=50)
+
+    async def run():
+        return await asyncio.gather(*(batcher.predict(torch.randn(3, 4, 4)) for _ in range(7)))
+
+    outputs = asyncio.run(run())
+
+    assert len(outputs) == 7
+    assert max(batcher.stats()["batch_size_histogram"]) == 3
+
+
+def test_forward_errors_are_returned_to_every_caller():
+    def broken_model(images):
+        raise RuntimeError("boom")
+
+    batcher = InferenceBatcher(broken_model, max_batch_size=4, max_wait_ms=10)
+
+    async def run():
+        return await asyncio.gather(
+            *(batcher.predict(torch.randn(3, 4, 4)) for _ in range(2)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
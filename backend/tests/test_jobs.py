@@ -0,0 +1,236 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from utils.database import Base
+from utils import jobs as jobs_module
+from utils.jobs import JobQueue
+from utils.models import Job
+
+
+def make_queue(tmp_path, workers=1, **kwargs):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={'check_same_thread': False})
+    Base.metadata.create_all(bind=engine)
+    return JobQueue(session_factory=sessionmaker(bind=engine), workers=workers, jobs_dir=str(tmp_path / 'jobs'),
+                    **kwargs)
+
+
+async def wait_for(queue, job_id, statuses=('succeeded', 'failed', 'cancelled')):
+    for _ in range(500):
+        job = await queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise TimeoutError(job)
+
+
+def test_jobs_run_by_priority_and_report_progress(tmp_path):
+    queue = make_queue(tmp_path)
+    order = []
+
+    async def handler(context, name):
+        order.append(name)
+        await context.progress(0.5, "halfway")
+        return {"name": name}
+
+    queue.register('echo', handler)
+
+    async def run():
+        low = await queue.submit('echo', {"name": "low"}, user_id=1)
+        high = await queue.submit('echo', {"name": "high"}, user_id=1, priority=10)
+        updates = queue.subscribe(low)
+        await queue.start()
+        job = await wait_for(queue, low)
+        await queue.stop()
+        events = []
+        while not updates.empty():
+            events.append(updates.get_nowait())
+        return job, events
+
+    job, events = asyncio.run(run())
+    assert order == ["high", "low"]
+    assert job["result"] == {"name": "low"} and job["progress"] == 1.0
+    assert [event["status"] for event in events] == ["running", "running", "succeeded"]
+    assert events[1]["detail"] == "halfway"
+
+
+def test_progress_keeps_what_it_is_not_given(tmp_path, monkeypatch):
+    queue = make_queue(tmp_path)
+
+    async def handler(context):
+        await context.progress(0.5, "halfway")
+        monkeypatch.setattr(jobs_module, 'JOB_PROGRESS_INTERVAL', 60)
+        # Not saved yet: throttled
+        await context.progress(detail="almost")
+        monkeypatch.setattr(jobs_module, 'JOB_PROGRESS_INTERVAL', 0)
+        await context.progress(0.75)
+        job = await context.queue.get(context.job_id)
+        return {"progress": job["progress"], "detail": job["detail"]}
+
+    queue.register('steps', handler)
+
+    async def run():
+        job_id = await queue.submit('steps', {})
+        updates = queue.subscribe(job_id)
+        await queue.start()
+        job = await wait_for(queue, job_id)
+        await queue.stop()
+        events = []
+        while not updates.empty():
+            events.append(updates.get_nowait())
+        return job, events
+
+    job, events = asyncio.run(run())
+    assert job["result"] == {"progress": 0.75, "detail": "almost"}
+    assert job["detail"] == "almost"
+    assert [(event.get("progress"), event.get("detail")) for event in events[1:4]] == [
+        (0.5, "halfway"), (None, "almost"), (0.75, None)]
+    assert "detail" not in events[3]
+
+
+def test_cancel_and_failure(tmp_path):
+    queue = make_queue(tmp_path, workers=2)
+
+    async def slow(context):
+        await asyncio.sleep(10)
+
+    async def broken(context):
+        raise ValueError("boom")
+
+    queue.register('slow', slow)
+    queue.register('broken', broken)
+
+    async def run():
+        await queue.start()
+        slow_id = await queue.submit('slow')
+        broken_id = await queue.submit('broken')
+        await wait_for(queue, slow_id, ('running',))
+        assert await queue.cancel(slow_id)
+        results = await wait_for(queue, slow_id), await wait_for(queue, broken_id)
+        await queue.stop()
+        return results
+
+    cancelled, failed = asyncio.run(run())
+    assert cancelled["status"] == "cancelled"
+    assert failed["status"] == "failed" and failed["error"] == "boom"
+
+
+def test_unfinished_jobs_run_again_after_a_restart(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.register('echo', lambda context: asyncio.sleep(0, result="done"))
+
+    def interrupted(db):
+        db.add(Job(id="abc", kind="echo", status="running", params="{}"))
+        db.commit()
+
+    async def run():
+        await asyncio.get_running_loop().run_in_executor(None, queue._query, interrupted)
+        await queue.start()
+        job = await wait_for(queue, "abc")
+        await queue.stop()
+        return job
+
+    assert asyncio.run(run())["result"] == "done"
+
+
+def test_uploaded_files_are_kept_until_the_job_ran(tmp_path):
+    queue = make_queue(tmp_path)
+    seen = []
+
+    async def handler(context):
+        with open(context.files[0]["path"]) as f:
+            seen.append(f.read())
+
+    queue.register('read', handler)
+
+    class Upload:
+        filename = "notes.txt"
+        content_type = "text/plain"
+
+        def __init__(self):
+            import io
+            self.file = io.BytesIO(b"hello")
+
+    async def run():
+        job_id = await queue.submit('read', files=[Upload()])
+        await queue.start()
+        await wait_for(queue, job_id)
+        await queue.stop()
+        return job_id
+
+    job_id = asyncio.run(run())
+    assert seen == ["hello"]
+    assert not (tmp_path / 'jobs' / job_id).exists()
+
+
+def test_worker_processes_share_the_table(tmp_path):
+    # Two queues on one database stand in for two uvicorn workers
+    first, second = (make_queue(tmp_path, workers=2, poll_interval=0.02) for _ in range(2))
+    runs = []
+
+    async def count(context, n):
+        runs.append((n, context.queue.owner))
+        await asyncio.sleep(0.01)
+
+    async def slow(context):
+        await context.progress(0.5, "halfway")
+        await asyncio.sleep(10)
+
+    for queue in (first, second):
+        queue.register('count', count)
+        queue.register('slow', slow)
+
+    async def run():
+        await first.start()
+        await second.start()
+        # Both poll the queued jobs, each one is claimed once
+        jobs = [await first.submit('count', {"n": n}) for n in range(20)]
+        for job_id in jobs:
+            await wait_for(first, job_id)
+
+        # Followed and cancelled through the worker not running it
+        slow_id = await first.submit('slow')
+        while slow_id not in first._running and slow_id not in second._running:
+            await asyncio.sleep(0.01)
+        other = second if slow_id in first._running else first
+        updates = other.subscribe(slow_id)
+        event = await asyncio.wait_for(updates.get(), 5)
+        while event["detail"] != 'halfway':
+            event = await asyncio.wait_for(updates.get(), 5)
+        assert event["status"] == 'running'
+        assert await other.cancel(slow_id)
+        event = await asyncio.wait_for(updates.get(), 5)
+        await first.stop()
+        await second.stop()
+        return event
+
+    event = asyncio.run(run())
+    assert sorted(n for n, _ in runs) == list(range(20))
+    assert event["status"] == 'cancelled'
+
+
+def test_only_jobs_of_dead_workers_are_recovered(tmp_path):
+    queue = make_queue(tmp_path, heartbeat_timeout=30)
+    ran = []
+    queue.register('echo', lambda context: asyncio.sleep(0, result=ran.append(context.job_id)))
+
+    def jobs(db):
+        now = datetime.utcnow()
+        db.add(Job(id="alive", kind="echo", status="running", params="{}", owner="other", heartbeat_at=now))
+        db.add(Job(id="dead", kind="echo", status="running", params="{}", owner="gone",
+                   heartbeat_at=now - timedelta(minutes=5)))
+        db.commit()
+
+    async def run():
+        await asyncio.get_running_loop().run_in_executor(None, queue._query, jobs)
+        await queue.start()
+        dead = await wait_for(queue, "dead")
+        alive = await queue.get("alive")
+        await queue.stop()
+        return dead, alive
+
+    dead, alive = asyncio.run(run())
+    assert ran == ["dead"] and dead["status"] == 'succeeded'
+    assert alive["status"] == 'running'
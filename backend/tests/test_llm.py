@@ -0,0 +1,155 @@
+import json
+import asyncio
+
+import httpx
+import pytest
+
+from utils.llm import AsyncLLMClient, CircuitBreaker, CircuitOpenError, LLMError
+
+
+def completion(content):
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+
+
+def make_client(handler, **kwargs):
+    kwargs.setdefault('backoff_base', 0.001)
+    return AsyncLLMClient(base_url='http://llm.test/v1', token='t', transport=httpx.MockTransport(handler), **kwargs)
+
+
+def test_retries_transient_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, json=completion("hi"))
+
+    client = make_client(handler, max_retries=3)
+    assert asyncio.run(client.chat([{"role": "user", "content": "q"}], "m")) == "hi"
+    assert len(calls) == 3
+    assert calls[0].headers['authorization'] == 'Bearer t'
+    assert client.stats()['retries'] == 2
+
+
+def test_client_errors_are_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(400, json={"error": "bad"})
+
+    client = make_client(handler)
+    with pytest.raises(LLMError):
+        asyncio.run(client.chat([], "m"))
+    assert len(calls) == 1
+
+
+def test_identical_prompts_are_coalesced():
+    calls = []
+
+    async def handler(request):
+        payload = json.loads(request.content)
+        calls.append(payload)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=completion(payload["messages"][0]["content"]))
+
+    client = make_client(handler)
+
+    async def run():
+        same = [client.chat([{"role": "user", "content": "same"}], "m") for _ in range(10)]
+        other = client.chat([{"role": "user", "content": "other"}], "m")
+        return await asyncio.gather(*same, other)
+
+    answers = asyncio.run(run())
+    assert answers == ["same"] * 10 + ["other"]
+    assert len(calls) == 2
+    assert client.stats()['coalesced'] == 9
+
+
+def test_concurrency_is_bounded():
+    active, peak = [0], [0]
+
+    async def handler(request):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.01)
+        active[0] -= 1
+        return httpx.Response(200, json=completion("ok"))
+
+    client = make_client(handler, max_concurrency=4)
+
+    async def run():
+        return await asyncio.gather(*(client.chat([{"role": "user", "content": str(i)}], "m") for i in range(20)))
+
+    assert asyncio.run(run()) == ["ok"] * 20
+    assert peak[0] == 4
+
+
+def test_circuit_breaker_fails_fast():
+    now = [0.0]
+    breaker = CircuitBreaker(threshold=2, reset_after=10, clock=lambda: now[0])
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(500)
+
+    client = make_client(handler, max_retries=0, breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(LLMError):
+            asyncio.run(client.chat([], "m"))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.chat([], "m"))
+    assert len(calls) == 2
+
+    # After the reset delay one trial call goes through
+    now[0] = 11
+    assert breaker.state == "half-open"
+    with pytest.raises(LLMError):
+        asyncio.run(client.chat([], "m"))
+    assert breaker.state == "open"
+
+
+def test_stream_parses_server_sent_events():
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        chunks = [{"choices": [{"delta": {"content": token}}]} for token in ["Hel", "lo"]]
+        body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    client = make_client(handler)
+
+    async def consume():
+        return [token async for token in client.stream([], "m")]
+
+    assert asyncio.run(consume()) == ["Hel", "lo"]
+
+
+def test_half_open_circuit_lets_a_single_trial_through():
+    now = [0.0]
+    breaker = CircuitBreaker(threshold=1, reset_after=10, clock=lambda: now[0])
+    calls = []
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def handler(request):
+            calls.append(request)
+            await gate.wait()
+            return httpx.Response(200, json=completion("back"))
+
+        client = make_client(handler, max_retries=0, breaker=breaker)
+        breaker.record_failure()
+        now[0] = 11
+        # Different payloads, so that the calls are not coalesced into one
+        tasks = [asyncio.ensure_future(client.chat([{"role": "user", "content": str(i)}], "m")) for i in range(5)]
+        await asyncio.sleep(0.05)
+        gate.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert results.count("back") == 1
+    assert sum(isinstance(result, CircuitOpenError) for result in results) == 4
+    assert breaker.state == "closed"
@@ -0,0 +1,40 @@
+import os
+
+import pandas as pd
+
+from utils.logstore import LogStore
+
+
+def make_frame(start, rows, minutes=30):
+    start_time = pd.date_range(start, periods=rows, freq=f'{minutes}min')
+    return pd.DataFrame({
+        'start_time': start_time,
+        'end_time': start_time + pd.Timedelta(seconds=3),
+        'question': [f"q{i}" for i in range(rows)],
+        'response': [f"r{i}" for i in range(rows)],
+        'model_ID': ['a', 'b'] * (rows // 2) + ['a'] * (rows % 2),
+        'feedback': [1.0, None] * (rows // 2) + [1.0] * (rows % 2),
+    })
+
+
+def test_reads_a_window_across_days(tmp_path):
+    store = LogStore(str(tmp_path), row_group_size=8)
+    store.append(make_frame('2024-01-01 12:00', 96))
+    assert store.days() == ['2024-01-01', '2024-01-02', '2024-01-03']
+
+    frame = store.read('2024-01-01 23:00', '2024-01-02 02:00', columns=['start_time', 'model_ID'])
+    assert list(frame.columns) == ['start_time', 'model_ID']
+    assert list(frame['start_time']) == list(pd.date_range('2024-01-01 23:00', periods=6, freq='30min'))
+    assert frame['model_ID'].dtype == 'category'
+    # Columns missing from the logs are stored as nulls
+    assert store.read(columns=['region'])['region'].isna().all()
+    feedback = store.read(columns=['start_time', 'feedback'])['feedback']
+    assert feedback.iloc[0] == '1.0' and pd.isna(feedback.iloc[1])
+
+
+def test_small_appends_are_compacted(tmp_path):
+    store = LogStore(str(tmp_path), compact_files=4)
+    for i in range(10):
+        store.append(make_frame(pd.Timestamp('2024-01-01') + pd.Timedelta(minutes=i), 1))
+    assert len(os.listdir(tmp_path / 'day=2024-01-01')) <= 4
+    assert list(store.read()['question']) == ['q0'] * 10
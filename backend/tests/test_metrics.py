@@ -0,0 +1,65 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from utils import metrics as metrics_module
+from utils.inference import run_in_executor
+from utils.metrics import (
+    HTTP_DURATION, HTTP_REQUESTS, STAGE_DURATION, Counter, Histogram, MetricsMiddleware,
+    instrument_engine, stage,
+)
+
+
+def test_histograms_render_cumulative_buckets():
+    histogram = Histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1))
+    for value in [0.05, 0.5, 0.5, 3]:
+        histogram.observe(value, '/a')
+    counter = Counter('requests_total', 'Requests.', ('route', 'status'))
+    counter.inc('/a', '200')
+    counter.inc('/a', '200', amount=2)
+
+    lines = histogram.render() + counter.render()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{route="/a"} 4.05' in lines
+    assert 'latency_seconds_count{route="/a"} 4' in lines
+    assert 'requests_total{route="/a",status="200"} 3' in lines
+    assert histogram.count('/a') == 4
+
+
+def test_requests_are_labelled_with_their_route_template():
+    app = FastAPI()
+
+    @app.get('/items/{item_id}')
+    async def read_item(item_id: int):
+        # Timed on the inference executor, still labelled with the route of the request
+        await run_in_executor(_timed_stage)
+        return {"item_id": item_id}
+
+    app.add_middleware(MetricsMiddleware, enabled=True)
+    route = '/items/{item_id}'
+    before = (HTTP_REQUESTS.value('GET', route, '200'), HTTP_REQUESTS.value('GET', 'unmatched', '404'),
+              HTTP_DURATION.count('GET', route), STAGE_DURATION.count('test_stage', route, 'v1'))
+
+    with TestClient(app) as client:
+        for item_id in range(3):
+            assert client.get(f'/items/{item_id}').status_code == 200
+        assert client.get('/random/path').status_code == 404
+
+    after = (HTTP_REQUESTS.value('GET', route, '200'), HTTP_REQUESTS.value('GET', 'unmatched', '404'),
+             HTTP_DURATION.count('GET', route), STAGE_DURATION.count('test_stage', route, 'v1'))
+    assert [b - a for a, b in zip(before, after)] == [3, 1, 3, 3]
+
+
+def _timed_stage():
+    with stage('test_stage', 'v1'):
+        pass
+
+
+def test_sql_statements_are_timed_outside_requests_too():
+    engine = instrument_engine(create_engine('sqlite://'))
+    before = STAGE_DURATION.count('db', metrics_module.NO_ROUTE, '')
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    assert STAGE_DURATION.count('db', metrics_module.NO_ROUTE, '') == before + 1
@@ -0,0 +1,144 @@
+import os
+import threading
+
+import pandas as pd
+
+from utils.logstore import LogStore
+from utils.monitoring import LogMonitor, split_records
+
+
+def make_logs(start, hours, per_hour=3):
+    rows = []
+    for i in range(hours * per_hour):
+        start_time = pd.Timestamp(start) + pd.Timedelta(minutes=60 * i // per_hour)
+        rows.append({
+            'start_time': start_time,
+            'end_time': start_time + pd.Timedelta(seconds=5),
+            'question': f"question {i}",
+            # Quoted newlines and quotes, as in real answers
+            'response': f'answer "{i}"\nsecond line' + 'x' * (i % 5),
+            'organization': 'aims',
+            'model_ID': 'gpt' if i % 2 else 'llama',
+            'region': 'eu',
+            'environment': 'prod',
+            'feedback': 'positive' if i % 3 else None,
+        })
+    return pd.DataFrame(rows)
+
+
+def test_split_records_ignores_quoted_newlines():
+    data = b'0,"a\nb",x\n1,"c ""d""\ne",y\n2,"unfinished\n'
+    starts, end = split_records(data)
+    assert starts == [0, 10]
+    assert data[end:] == b'2,"unfinished\n'
+
+
+def test_ingests_only_the_appended_rows(tmp_path):
+    path = tmp_path / 'logs.csv'
+    first, second = make_logs('2024-01-01', 4), make_logs('2024-01-01 04:00', 2)
+    first.to_csv(path)
+    monitor = LogMonitor(str(path), store=LogStore(str(tmp_path / 'store')))
+    assert monitor.ingest() == 12
+    assert monitor.ingest() == 0
+
+    second.index += len(first)
+    second.to_csv(path, mode='a', header=False)
+    assert monitor.ingest() == 6
+
+    everything = pd.concat([first, second])
+    summary = monitor.summary(window_size=24)
+    assert summary['rows'] == 18
+    assert summary['counts']['model_ID'] == everything['model_ID'].value_counts().to_dict()
+    assert summary['counts']['feedback'] == {'positive': 12, 'unknown': 6}
+    assert summary['text_length']['response']['max'] == everything['response'].str.len().max()
+    assert abs(summary['text_length']['response']['mean'] - everything['response'].str.len().mean()) < 0.01
+
+    last_two_hours = monitor.summary(window_size=2)
+    assert last_two_hours['rows'] == 6
+    assert [hour['hour'] for hour in last_two_hours['hourly']] == ['2024-01-01T04:00:00', '2024-01-01T05:00:00']
+
+
+def test_window_frame_reads_the_window_from_the_store(tmp_path):
+    path = tmp_path / 'logs.csv'
+    logs = make_logs('2024-01-01', 10)
+    logs.to_csv(path)
+    monitor = LogMonitor(str(path), read_bytes=256, store=LogStore(str(tmp_path / 'store')))
+    frame = monitor.window_frame(window_size=3)
+    assert len(frame) == 9
+    assert frame['start_time'].min() == pd.Timestamp('2024-01-01 07:00')
+    assert list(frame['response']) == list(logs['response'][-9:])
+    assert frame['model_ID'].dtype == 'category'
+
+
+def test_restart_resumes_from_the_store(tmp_path):
+    path, store = tmp_path / 'logs.csv', LogStore(str(tmp_path / 'store'))
+    first, second = make_logs('2024-01-01', 4), make_logs('2024-01-01 04:00', 2)
+    first.to_csv(path)
+    LogMonitor(str(path), store=store).ingest()
+
+    second.index += len(first)
+    second.to_csv(path, mode='a', header=False)
+    restarted = LogMonitor(str(path), store=store)
+    # Only the rows appended since are parsed, the others come back from the store
+    assert restarted.ingest() == 6
+    assert restarted.summary()['rows'] == 18
+    assert restarted.summary()['counts']['feedback'] == {'positive': 12, 'unknown': 6}
+    assert len(store.read()) == 18
+
+
+def test_rewritten_file_is_read_again(tmp_path):
+    path = tmp_path / 'logs.csv'
+    make_logs('2024-01-01', 4).to_csv(path)
+    monitor = LogMonitor(str(path), store=LogStore(str(tmp_path / 'store')))
+    monitor.ingest()
+    make_logs('2024-02-01', 1).to_csv(path)
+    assert monitor.ingest() == 3
+    assert monitor.summary()['rows'] == 3
+
+
+def test_monitors_of_several_workers_share_the_store(tmp_path):
+    path, root = tmp_path / 'logs.csv', str(tmp_path / 'store')
+    first, second = make_logs('2024-01-01', 4), make_logs('2024-01-01 04:00', 2)
+    first.to_csv(path)
+    # One monitor, and one store object, per worker process
+    workers = [LogMonitor(str(path), store=LogStore(root)) for _ in range(2)]
+    threads = [threading.Thread(target=worker.ingest) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    second.index += len(first)
+    second.to_csv(path, mode='a', header=False)
+    assert sum(worker.ingest() for worker in workers) == 6
+    # Each row is stored once, and every worker sees all of them
+    assert len(LogStore(root).read()) == 18
+    assert [worker.summary()['rows'] for worker in workers] == [18, 18]
+
+
+def test_monitors_follow_the_position_saved_by_the_others(tmp_path):
+    path, root = tmp_path / 'logs.csv', str(tmp_path / 'store')
+    first, second = make_logs('2024-01-01', 4), make_logs('2024-01-01 04:00', 2)
+    first.to_csv(path)
+    ahead, behind = (LogMonitor(str(path), store=LogStore(root)) for _ in range(2))
+    assert ahead.ingest() == 12
+    assert behind.ingest() == 0
+
+    second.index += len(first)
+    second.to_csv(path, mode='a', header=False)
+    assert ahead.ingest() == 6
+    # Caught up from the CSV, without storing the rows again
+    assert behind.summary(window_size=24)['rows'] == 18
+    assert len(LogStore(root).read()) == 18
+
+    # Rewritten in place by one process, grown past the old position before the other one reads it
+    first.iloc[:6].to_csv(path)
+    assert ahead.ingest() == 6
+    third = make_logs('2024-01-02', 5)
+    third.index += 6
+    third.to_csv(path, mode='a', header=False)
+    assert os.path.getsize(path) > behind.offset
+    assert behind.ingest() == 15
+    assert ahead.ingest() == 0
+    assert [monitor.summary(window_size=48)['rows'] for monitor in (ahead, behind)] == [21, 21]
+    assert len(LogStore(root).read()) == 21
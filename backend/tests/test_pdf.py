@@ -0,0 +1,37 @@
+import io
+import asyncio
+
+from PyPDF2 import PdfReader, PdfWriter
+from fastapi import UploadFile
+
+from utils.pdf import iter_pages, stream_pages, extract_text_from_pdf
+
+
+def make_pdf(tmp_path, pages):
+    reader = PdfReader('tests/sample.pdf')
+    writer = PdfWriter()
+    for index in range(pages):
+        writer.add_page(reader.pages[index % len(reader.pages)])
+    path = tmp_path / 'document.pdf'
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return str(path)
+
+
+def test_process_pool_pages_come_in_order(tmp_path):
+    path = make_pdf(tmp_path, 6)
+
+    async def run():
+        return [text async for text in stream_pages(path, parallel_min_pages=1, pages_per_task=4)]
+
+    assert asyncio.run(run()) == list(iter_pages(path))
+
+
+def test_extract_text_from_upload(tmp_path):
+    path = make_pdf(tmp_path, 2)
+    with open(path, 'rb') as f:
+        upload = UploadFile(io.BytesIO(f.read()), filename='document.pdf')
+
+    text = asyncio.run(extract_text_from_pdf(upload))
+    assert text == "\n".join(iter_pages(path))
+    assert "Statement of Purpose" in text
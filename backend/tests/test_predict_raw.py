@@ -0,0 +1,70 @@
+import io
+
+import pytest
+import torch
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from routers import predict
+from utils.auth import get_current_user
+from utils.cache import PredictionCache
+from utils.prediction_log import PredictionLogger
+
+
+class FakeBatcher:
+    """Stands in for the batcher of the model, records the tensors it was given."""
+
+    def __init__(self):
+        self.images = []
+
+    async def predict_with_extras(self, image):
+        self.images.append(image)
+        return torch.tensor([0.1, 2.0]), None
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    batcher = FakeBatcher()
+    monkeypatch.setattr(predict, 'batcher', batcher)
+    monkeypatch.setattr(predict, 'cat_dog_classes', lambda: ['cat', 'dog'])
+    monkeypatch.setattr(predict, 'prediction_cache', PredictionCache())
+    monkeypatch.setattr(predict, 'prediction_logger', PredictionLogger(str(tmp_path / 'predictions'), enabled=False))
+    app = FastAPI()
+    app.include_router(predict.router)
+    app.dependency_overrides[get_current_user] = lambda: {'username': 'alice', 'id': 1}
+    with TestClient(app) as client:
+        client.batcher = batcher
+        yield client
+
+
+def jpeg(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (320, 240), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def test_raw_body_and_multipart_uploads_are_classified(client):
+    response = client.post('/predict/raw', content=jpeg('red'),
+                           headers={'Content-Type': 'application/octet-stream'})
+    assert response.status_code == 200
+    assert response.json() == {'predicted_class': 'dog'}
+
+    response = client.post('/predict/raw', files={'file': ('blue.jpg', jpeg('blue'), 'image/jpeg')})
+    assert response.status_code == 200
+    assert response.json() == {'predicted_class': 'dog'}
+
+    # Both were decoded and transformed into model inputs
+    assert [tuple(image.shape) for image in client.batcher.images] == [(3, 224, 224)] * 2
+
+    # The same image again is served from the cache
+    client.post('/predict/raw', content=jpeg('red'), headers={'Content-Type': 'application/octet-stream'})
+    assert len(client.batcher.images) == 2
+
+
+def test_raw_upload_errors(client):
+    assert client.post('/predict/raw', content=b'', headers={'Content-Type': 'application/octet-stream'}).status_code == 400
+    # Multipart, without any file part
+    assert client.post('/predict/raw', files={'field': (None, 'value')}).status_code == 400
+    assert client.post('/predict/raw', content=b'not an image',
+                       headers={'Content-Type': 'application/octet-stream'}).status_code == 500
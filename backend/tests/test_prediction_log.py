@@ -0,0 +1,47 @@
+import numpy as np
+import torch
+from torchvision import models
+
+from utils.model import ChannelsLast, capture_embeddings, pop_embeddings
+from utils.prediction_log import PredictionLogger, read_predictions, embeddings_matrix
+
+
+def test_rows_are_written_in_batches_and_read_back(tmp_path):
+    logger = PredictionLogger(str(tmp_path), batch_rows=1000, flush_interval=60)
+    embeddings = torch.randn(3, 512)
+    for i in range(3):
+        logger.record('predict', 'v1', 'cat' if i else 'dog', 0.9, 12.5, 640, 480, 1000, embedding=embeddings[i])
+    logger.record('predict', 'v1', 'cat', latency_ms=0.4, cached=True)
+    # Nothing is written on the request path
+    assert logger.stats()['files'] == 0
+    logger.close()
+
+    frame = read_predictions(str(tmp_path))
+    assert len(frame) == 4 and logger.stats()['written'] == 4
+    assert list(frame['predicted_class']) == ['dog', 'cat', 'cat', 'cat']
+    assert frame['cached'].tolist() == [False, False, False, True]
+    stored = embeddings_matrix(frame['embedding'].tolist())
+    assert stored.shape == (3, 512)
+    assert np.allclose(stored, embeddings.numpy(), atol=1e-2)
+
+
+def test_rows_are_dropped_past_max_pending(tmp_path):
+    logger = PredictionLogger(str(tmp_path), max_pending=2, flush_interval=60)
+    for _ in range(5):
+        logger.record('predict', 'v1', 'cat', 0.5)
+    assert logger.stats()['dropped'] == 3
+    logger.close()
+    assert len(read_predictions(str(tmp_path))) == 2
+
+
+def test_forward_pass_keeps_the_avgpool_embeddings():
+    resnet = models.resnet18(weights=None, num_classes=2).eval()
+    model = capture_embeddings(ChannelsLast(resnet))
+    images = torch.randn(2, 3, 64, 64)
+    with torch.inference_mode():
+        model(images)
+        embeddings = pop_embeddings()
+        assert pop_embeddings() is None
+        features = torch.nn.Sequential(*list(resnet.children())[:-1])(images).flatten(1)
+    assert embeddings.shape == (2, 512)
+    assert torch.allclose(embeddings, features, atol=1e-5)
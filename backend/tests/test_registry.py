@@ -0,0 +1,41 @@
+import threading
+
+from utils.registry import ModelRegistry
+
+
+def test_models_load_once_and_lazily():
+    registry = ModelRegistry()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return object()
+
+    registry.register('dummy', loader)
+    assert registry.report() == {'dummy': {'loaded': False}}
+
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(registry.get('dummy'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(model is models[0] for model in models)
+    report = registry.report()['dummy']
+    assert report['loaded']
+    assert 'load_seconds' in report and 'rss_bytes' in report
+
+
+def test_warmup_runs_the_model_and_survives_failures():
+    registry = ModelRegistry()
+    warmed = []
+    registry.register('ok', lambda: 'model', warmup=warmed.append)
+    registry.register('broken', lambda: 1 / 0)
+
+    registry.warmup()
+
+    assert warmed == ['model']
+    assert 'warmup_seconds' in registry.report()['ok']
+    assert not registry.report()['broken']['loaded']
@@ -0,0 +1,76 @@
+import os
+import time
+import asyncio
+
+from utils.report_cache import ReportCache, report_key, etag_matches
+
+
+def test_concurrent_requests_render_once(tmp_path):
+    cache = ReportCache(str(tmp_path))
+    renders = []
+
+    def render(path):
+        renders.append(path)
+        time.sleep(0.05)
+        with open(path, 'w') as f:
+            f.write("<html>report</html>")
+
+    async def run():
+        key = report_key(start='2024-01-01', end='2024-01-02', version='v1', metrics='m')
+        paths = await asyncio.gather(*[cache.get(key, render) for _ in range(5)])
+        # Served from the cache without rendering again
+        paths.append(await cache.get(key, render))
+        return key, paths
+
+    key, paths = asyncio.run(run())
+    assert len(renders) == 1
+    assert set(paths) == {cache.path(key)}
+    assert open(cache.path(key)).read() == "<html>report</html>"
+    # Rendered under a temporary name, nothing is left behind
+    assert os.listdir(tmp_path) == [f"{key}.html"]
+    assert cache.stats()['renders'] == 1 and cache.stats()['hits'] == 1
+
+
+def test_failed_render_leaves_no_report(tmp_path):
+    cache = ReportCache(str(tmp_path))
+
+    def render(path):
+        with open(path, 'w') as f:
+            f.write("<html>half")
+        raise ValueError("no data")
+
+    async def run():
+        try:
+            await cache.get('k', render)
+        except ValueError:
+            return True
+
+    assert asyncio.run(run())
+    assert os.listdir(tmp_path) == []
+
+
+def test_least_recently_used_reports_are_evicted(tmp_path):
+    cache = ReportCache(str(tmp_path), max_files=2)
+
+    def render(path):
+        open(path, 'w').close()
+
+    async def run():
+        for key in ('a', 'b'):
+            await cache.get(key, render)
+            time.sleep(0.01)
+        await cache.get('a', render)
+        time.sleep(0.01)
+        await cache.get('c', render)
+
+    asyncio.run(run())
+    assert sorted(os.listdir(tmp_path)) == ['a.html', 'c.html']
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", W/"abc"', '"abc"')
+    assert etag_matches('*', '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert report_key(a=1, b=2) == report_key(b=2, a=1) != report_key(a=1, b=3)
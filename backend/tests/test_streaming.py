@@ -0,0 +1,53 @@
+import asyncio
+
+from utils.streaming import TokenStream
+
+
+class FakeClient:
+    """Stands in for AsyncLLMClient.stream."""
+
+    def __init__(self, tokens, delay):
+        self.tokens = tokens
+        self.delay = delay
+        self.read = 0
+        self.closed = False
+
+    async def stream(self, messages, model):
+        try:
+            for token in self.tokens:
+                await asyncio.sleep(self.delay)
+                self.read += 1
+                yield token
+        finally:
+            self.closed = True
+
+
+def test_tokens_are_relayed_with_timings():
+    stream = TokenStream([], buffer=2, client=FakeClient(['Hel', 'lo', '!'], delay=0.01))
+
+    async def consume():
+        return [token async for token in stream]
+
+    assert asyncio.run(consume()) == ['Hel', 'lo', '!']
+    timings = stream.timings()
+    assert timings['tokens'] == 3
+    assert 0 < timings['time_to_first_token_ms'] <= timings['total_ms']
+
+
+def test_cancel_stops_reading_the_upstream_stream():
+    upstream = FakeClient([str(i) for i in range(1000)], delay=0.001)
+    stream = TokenStream([], buffer=4, client=upstream)
+
+    async def consume_two():
+        received = []
+        async for token in stream:
+            received.append(token)
+            if len(received) == 2:
+                break
+        await asyncio.sleep(0.1)
+        return received
+
+    assert asyncio.run(consume_two()) == ['0', '1']
+    # The bounded buffer stops the producer far before the end of the stream
+    assert upstream.read < 20
+    assert upstream.closed
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+from utils.inference import INFERENCE_WORKERS, run_in_executor
+from utils.summarizer import SummarizationEngine, chunk_text
+
+
+class FakePipeline:
+    """Called like a transformers summarization pipeline: keeps the first sentence of each text."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts, **kwargs):
+        self.batches.append(len(texts))
+        return [{"summary_text": text.split(". ")[0] + "."} for text in texts]
+
+
+def document(sentences):
+    return " ".join(f"Sentence number {i} talks about topic {i % 7}." for i in range(sentences))
+
+
+def test_chunks_respect_the_budget_and_keep_every_sentence():
+    text = document(200)
+    chunks = chunk_text(text, max_tokens=50)
+    assert len(chunks) > 1
+    # Per-sentence estimates are rounded down, allow a few tokens of slack
+    assert all(len(chunk) // 4 <= 55 for chunk in chunks)
+    assert " ".join(chunks) == text
+
+
+def test_long_sentences_are_cut_on_words():
+    chunks = chunk_text("word " * 1000, max_tokens=50)
+    assert len(chunks) > 1
+    assert sum(len(chunk.split()) for chunk in chunks) == 1000
+
+
+def test_map_reduce_streams_partial_summaries():
+    pipeline = FakePipeline()
+    engine = SummarizationEngine(pipeline, chunk_tokens=50, batch_size=4, parallel_batches=2)
+
+    async def run():
+        return [event async for event in engine.stream(document(200))]
+
+    events = asyncio.run(run())
+    final = events[-1]
+    partial = events[:-1]
+    first_level = [event for event in partial if event["level"] == 0]
+    assert len(first_level) == final["chunks"] > 4
+    assert final["levels"] >= 2
+    assert final["summary"].startswith("Sentence number 0")
+    assert max(pipeline.batches) == 4
+
+
+def test_empty_document():
+    engine = SummarizationEngine(FakePipeline())
+    assert asyncio.run(engine.summarize("  ")) == {"summary": "", "levels": 0, "chunks": 0}
+
+
+def test_summaries_leave_the_inference_executor_free():
+    started, release = threading.Event(), threading.Event()
+
+    class SlowPipeline(FakePipeline):
+        def __call__(self, texts, **kwargs):
+            self.thread = threading.current_thread().name
+            started.set()
+            release.wait(10)
+            return super().__call__(texts, **kwargs)
+
+    pipeline = SlowPipeline()
+    engine = SummarizationEngine(pipeline, chunk_tokens=50, batch_size=1, parallel_batches=INFERENCE_WORKERS)
+
+    async def run():
+        summary = asyncio.ensure_future(engine.summarize(document(200)))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 10)
+        # Every inference thread is still free while the summary generates
+        done = await asyncio.wait_for(asyncio.gather(*(run_in_executor(sum, [i, 1]) for i in range(INFERENCE_WORKERS))), 5)
+        release.set()
+        await summary
+        return done
+
+    assert asyncio.run(run()) == list(range(1, INFERENCE_WORKERS + 1))
+    assert pipeline.thread.startswith('summary')
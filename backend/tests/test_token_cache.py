@@ -0,0 +1,89 @@
+import time
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+from passlib.context import CryptContext
+
+from utils import auth
+from utils.auth import TokenCache, verify_token, hash_password, verify_password
+
+
+@pytest.fixture
+def secret(monkeypatch):
+    monkeypatch.setattr(auth, 'AUTH_SECRET_KEY', 'test-secret')
+    monkeypatch.setattr(auth, 'ALGORITHM', 'HS256')
+
+
+def make_token(exp, username='alice', user_id=1):
+    return jwt.encode({'sub': username, 'id': user_id, 'exp': exp}, 'test-secret', algorithm='HS256')
+
+
+def test_verified_tokens_are_served_from_the_cache(secret, monkeypatch):
+    cache = TokenCache(max_size=10, ttl=60)
+    token = make_token(int(time.time()) + 600)
+    assert verify_token(token, cache) == {'username': 'alice', 'id': 1}
+
+    # A hit does not decode the token again
+    def fail(*args, **kwargs):
+        raise AssertionError("decoded again")
+    monkeypatch.setattr(auth.jwt, 'decode', fail)
+    user = verify_token(token, cache)
+    assert user == {'username': 'alice', 'id': 1}
+    user['id'] = 2
+    assert verify_token(token, cache)['id'] == 1
+    assert cache.stats()['hits'] == 2
+
+
+def test_cached_tokens_expire_with_their_exp_claim():
+    cache = TokenCache(max_size=10, ttl=60)
+    cache.put('token', {'username': 'alice', 'id': 1}, exp=1_000, now=990)
+    assert cache.get('token', now=995) is not None
+    assert cache.get('token', now=1_000) is None
+    assert cache.stats()['size'] == 0
+
+    # Nor longer than the ttl
+    cache.put('token', {'username': 'alice', 'id': 1}, exp=10_000, now=990)
+    assert cache.get('token', now=1_049) is not None
+    assert cache.get('token', now=1_050) is None
+
+
+def test_expired_and_invalid_tokens_are_rejected_and_not_cached(secret):
+    cache = TokenCache(max_size=10, ttl=60)
+    for token in [make_token(int(time.time()) - 10), 'not-a-token', None,
+                  jwt.encode({'sub': 'alice'}, 'test-secret', algorithm='HS256')]:
+        with pytest.raises(HTTPException) as error:
+            verify_token(token, cache)
+        assert error.value.status_code == 401
+    assert cache.stats()['size'] == 0
+
+
+def test_least_recently_used_tokens_are_evicted():
+    cache = TokenCache(max_size=2, ttl=60)
+    for token in 'abc':
+        cache.put(token, {'username': token, 'id': 1})
+        cache.get('a')
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('c') is not None
+
+
+def test_passwords_are_hashed_off_the_event_loop():
+    context = CryptContext(schemes=['pbkdf2_sha256'], pbkdf2_sha256__default_rounds=1000)
+    threads = []
+    original = context.hash
+
+    def hash(password):
+        threads.append(threading.current_thread().name)
+        return original(password)
+    context.hash = hash
+
+    async def main():
+        hashed = await hash_password('secret', context)
+        return hashed, await verify_password('secret', hashed, context), await verify_password('wrong', hashed, context)
+
+    hashed, right, wrong = asyncio.run(main())
+    assert (right, wrong) == (True, False)
+    assert threads[0].startswith('password')
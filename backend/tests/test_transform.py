@@ -0,0 +1,49 @@
+import io
+
+import numpy as np
+import torch
+from PIL import Image
+
+from utils.transform import STD, data_transforms, open_image, preprocess_image, preprocessor
+
+
+def make_png(size=(300, 200)):
+    array = np.random.randint(0, 255, size=(size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_buffers_decode_like_bytes():
+    png = make_png()
+    expected = preprocess_image(png)
+
+    for data in (bytearray(png), memoryview(png), io.BytesIO(png)):
+        assert torch.equal(preprocess_image(data), expected)
+
+
+def test_images_are_converted_to_rgb():
+    buffer = io.BytesIO()
+    Image.new('RGBA', (64, 64)).save(buffer, format='PNG')
+
+    assert open_image(memoryview(buffer.getvalue())).mode == 'RGB'
+
+
+def test_preprocessor_matches_data_transforms():
+    # One uint8 gray level, expressed in normalized units of the smallest std
+    tolerance = 1.01 / 255 / min(STD)
+    for size in [(640, 480), (480, 640), (256, 256), (300, 1000)]:
+        image = Image.open(io.BytesIO(make_png(size)))
+        assert (preprocessor(image) - data_transforms(image)).abs().max() <= tolerance
+
+
+def test_batch_reuses_the_output_buffer():
+    images = [Image.open(io.BytesIO(make_png())) for _ in range(3)]
+    buffer = preprocessor.empty(4)
+
+    batch = preprocessor.batch(images, out=buffer)
+
+    assert batch.shape == (3, 3, 224, 224)
+    assert batch.data_ptr() == buffer.data_ptr()
+    for image, row in zip(images, batch):
+        assert torch.equal(row, preprocessor(image))
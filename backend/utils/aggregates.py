@@ -0,0 +1,219 @@
+"""Counters of the dashboard (users, documents, chat messages, predictions per class), kept in the database.
+
+    python -m utils.aggregates            # current counters
+    python -m utils.aggregates --rebuild  # recount everything
+
+The writers add to the counters in the transaction of the rows they count
+(`increment_statement`), so a counter never disagrees with its table. Every
+worker keeps a copy in memory, refreshed every AGGREGATES_REFRESH_INTERVAL
+seconds from the few rows of the `aggregates` table: reads never count rows.
+Predictions are counted when the prediction logger writes them, within
+PREDICTION_LOG_FLUSH_INTERVAL seconds.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import functools
+from collections import Counter
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import false, func, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .database import AsyncSessionLocal, SessionLocal
+from .models import Aggregate, ChatHistory, Document, User
+from .prediction_log import PREDICTION_LOG_DIR, prediction_logger, read_predictions
+
+
+load_dotenv()
+
+AGGREGATES_REFRESH_INTERVAL = float(os.getenv("AGGREGATES_REFRESH_INTERVAL", 2))
+# A read refreshes the copy itself past this age (e.g. when the refresher is not running)
+AGGREGATES_MAX_STALENESS = float(os.getenv("AGGREGATES_MAX_STALENESS", 10))
+
+TABLE_COUNTERS = {'users': User, 'documents': Document, 'chats': ChatHistory}
+PREDICTIONS = 'predictions:'
+# Stored by `rebuild` only: until then the counters hold at most the increments made since they appeared
+SEEDED = 'seeded'
+
+
+def _upsert(db, counts, mode='add'):
+    """INSERT ... ON CONFLICT of `counts`, existing counters: 'add' to them or 'set' them."""
+    insert = postgresql.insert if db.bind.dialect.name == 'postgresql' else sqlite.insert
+    now = datetime.utcnow()
+    statement = insert(Aggregate).values([
+        {'name': name, 'value': value, 'updated_at': now} for name, value in counts.items()
+    ])
+    value = Aggregate.value + statement.excluded.value if mode == 'add' else statement.excluded.value
+    return statement.on_conflict_do_update(
+        index_elements=['name'], set_={'value': value, 'updated_at': statement.excluded.updated_at})
+
+
+def increment_statement(db, counts):
+    """Statement adding `counts` ({name: delta}) to the counters, to execute in the session `db` before its commit."""
+    return _upsert(db, counts)
+
+
+async def lock_counters(db):
+    """Hold back the increments of the writers until the transaction of `db` ends.
+
+    A writer adds its rows and its increment in one transaction: with the
+    counters locked, the rows committed so far are all counted, and those of
+    the writers still running are added by their increment once it is over.
+    To run first in the transaction.
+    """
+    if db.bind.dialect.name == 'postgresql':
+        await db.execute(text("LOCK TABLE aggregates IN SHARE ROW EXCLUSIVE MODE"))
+    else:
+        # SQLite: the first write of a transaction takes the write lock of the database until its end
+        await db.execute(update(Aggregate).where(false()).values(value=Aggregate.value))
+
+
+async def count_rows(db, prediction_log_dir=PREDICTION_LOG_DIR):
+    """Counters recounted from the tables and the prediction log."""
+    counts = {}
+    for name, model in TABLE_COUNTERS.items():
+        counts[name] = await db.scalar(select(func.count()).select_from(model))
+    loop = asyncio.get_running_loop()
+    predictions = await loop.run_in_executor(None, functools.partial(read_predictions, prediction_log_dir, columns=['predicted_class']))
+    for name, value in predictions['predicted_class'].dropna().astype(str).value_counts().items():
+        counts[PREDICTIONS + name] = int(value)
+    return counts
+
+
+def count_predictions(table, session_factory=SessionLocal):
+    """Listener of the prediction logger: adds the predictions it just wrote to their class counters."""
+    classes = Counter(name for name in table.column('predicted_class').to_pylist() if name is not None)
+    if not classes:
+        return
+    with session_factory() as db:
+        db.execute(increment_statement(db, {PREDICTIONS + name: count for name, count in classes.items()}))
+        db.commit()
+
+
+class Aggregates:
+    """In-memory copy of the counters, at most `max_staleness` seconds old when read.
+
+    A background task (`start`) refreshes the copy every `refresh_interval`
+    seconds; reads serve the copy and only query the database themselves when
+    it is older than `max_staleness`. The first refresh of an empty table
+    counts the rows once (`rebuild`).
+
+    Args:
+        session_factory (Callable): returns an AsyncSession
+        refresh_interval (float): seconds between two refreshes
+        max_staleness (float): age past which a read refreshes the copy first
+        prediction_log_dir (str): prediction log recounted by `rebuild`
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, refresh_interval=AGGREGATES_REFRESH_INTERVAL,
+                 max_staleness=AGGREGATES_MAX_STALENESS, prediction_log_dir=PREDICTION_LOG_DIR):
+        self.session_factory = session_factory
+        self.prediction_log_dir = prediction_log_dir
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self.counters = {}
+        self.as_of = None
+        self.refreshes = 0
+        self.errors = 0
+        self._refreshed_at = None
+        self._refreshing = None
+        self._task = None
+
+    def age(self):
+        return float('inf') if self._refreshed_at is None else time.monotonic() - self._refreshed_at
+
+    async def refresh(self):
+        """Read the counters again, one query shared by the concurrent callers."""
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._refresh())
+            self._refreshing.add_done_callback(lambda _: setattr(self, '_refreshing', None))
+        await asyncio.shield(self._refreshing)
+
+    async def _refresh(self):
+        async with self.session_factory() as db:
+            counters = dict((await db.execute(select(Aggregate.name, Aggregate.value))).all())
+            if SEEDED not in counters:
+                counters = await self.rebuild(db, only_unseeded=True)
+        self.counters = counters
+        self.as_of = datetime.utcnow()
+        self._refreshed_at = time.monotonic()
+        self.refreshes += 1
+
+    async def rebuild(self, db, only_unseeded=False):
+        """Recount every counter and store them, returns the counters.
+
+        The recount runs with the counters locked (`lock_counters`), so it is
+        exact whatever the writers do meanwhile. The prediction counters are
+        counted from the log files, outside of it: a batch of predictions
+        written during the recount may be counted twice.
+        """
+        # The lock opens the transaction: with WAL, SQLite cannot turn an older read into a write
+        await db.rollback()
+        await lock_counters(db)
+        counters = dict((await db.execute(select(Aggregate.name, Aggregate.value))).all())
+        # Another worker may have seeded them while this one waited for the lock
+        if not (only_unseeded and SEEDED in counters):
+            counts = await count_rows(db, self.prediction_log_dir)
+            await db.execute(_upsert(db, {**counts, SEEDED: 1}, 'set'))
+        await db.commit()
+        return dict((await db.execute(select(Aggregate.name, Aggregate.value))).all())
+
+    async def snapshot(self):
+        """The counters, refreshed first if the copy is older than `max_staleness`."""
+        if self.age() > self.max_staleness:
+            await self.refresh()
+        counters = self.counters
+        return {
+            **{name: counters.get(name, 0) for name in TABLE_COUNTERS},
+            "predictions": {name[len(PREDICTIONS):]: value for name, value in sorted(counters.items())
+                            if name.startswith(PREDICTIONS)},
+            "as_of": self.as_of.isoformat() if self.as_of else None,
+            "age_seconds": round(self.age(), 3),
+            "max_staleness_seconds": self.max_staleness,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                self.errors += 1
+                logging.exception("Could not refresh the aggregates")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self.refresh_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self):
+        return {"counters": len(self.counters), "refreshes": self.refreshes, "errors": self.errors,
+                "age_seconds": round(self.age(), 3)}
+
+
+aggregates = Aggregates()
+prediction_logger.add_listener(count_predictions)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rebuild', action='store_true')
+    args = parser.parse_args()
+
+    async def main():
+        if args.rebuild:
+            async with AsyncSessionLocal() as db:
+                await aggregates.rebuild(db)
+        return await aggregates.snapshot()
+
+    print(json.dumps(asyncio.run(main()), indent=2))
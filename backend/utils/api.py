@@ -1,5 +1,6 @@
 
 import os
+from typing import Optional
 from huggingface_hub import InferenceClient
 from pydantic import BaseModel
 from dotenv import load_dotenv
@@ -9,6 +10,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 HUGGINGFACE_TOKEN = os.environ.get("HUGGINGFACE_TOKEN")
+CHAT_MODEL = os.environ.get("CHAT_MODEL", "HuggingFaceTB/SmolLM3-3B")  # Hugging Face model that works
+SYSTEM_PROMPT = "You are a wise  assistant. Your name is Okapi. You are helping a user with a question."
 
 client = InferenceClient(
     token=HUGGINGFACE_TOKEN,
@@ -19,4 +22,13 @@ Client = client
 
 class ChatRequest(BaseModel):
     content: str
+    conversation_id: Optional[str] = None
+
+
+def chat_messages(content, system_prompt=SYSTEM_PROMPT):
+    """Messages sent to the chat model for a user question."""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": content},
+    ]
 
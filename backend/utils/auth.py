@@ -1,52 +1,129 @@
 import os
+import time
+import asyncio
+import threading
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from typing import Annotated
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
 from jose import jwt, JWTError
-from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 from passlib.context import CryptContext
 
 
-#  Personal imports:
-from .database import SessionLocal
-
-
 load_dotenv()
 
-AUTH_SECRET_KEY= os.getenv("AUTH_SECRET_KEY")
+AUTH_SECRET_KEY = os.getenv("AUTH_SECRET_KEY")
 ALGORITHM = os.getenv('AUTH_ALGORITHM')
+# Verified tokens kept in memory, and how long at most (their own `exp` comes first)
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 10_000))
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", 300))
+# bcrypt costs ~250 ms of CPU per hash or check, it runs on these threads instead of the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
 
+bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password')
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+oauth2_bearer = OAuth2PasswordBearer(tokenUrl='auth/token')
+oauth2_bearer_dependency = Annotated[str, Depends(oauth2_bearer)]
 
 
-db_dependency = Annotated[Session, Depends(get_db)]
+class TokenCache:
+    """LRU cache of the verified JWTs: token -> (user, expiry).
 
-bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
-oauth2_bearer = OAuth2PasswordBearer(tokenUrl='auth/token')
-oauth2_bearer_dependency = Annotated[str, Depends(oauth2_bearer)]
+    A token is only cached once its signature and claims checked out, and is
+    served until the earliest of its `exp` claim and `ttl` seconds, after
+    which it is decoded again (and rejected if expired). Invalid tokens are
+    never cached, so they cannot push valid ones out.
 
+    Args:
+        max_size (int): tokens kept, the least recently used go first
+        ttl (float): seconds a token is trusted without being decoded again
+    """
 
+    def __init__(self, max_size=AUTH_TOKEN_CACHE_SIZE, ttl=AUTH_TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
 
-async def get_current_user(token: oauth2_bearer_dependency):
-    try:
-        payload = jwt.decode(token, AUTH_SECRET_KEY, algorithms=[ALGORITHM])
+    def get(self, token, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is not None:
+                user, expires = entry
+                if now < expires:
+                    self._tokens.move_to_end(token)
+                    self.hits += 1
+                    return user
+                del self._tokens[token]
+            self.misses += 1
+            return None
+
+    def put(self, token, user, exp=None, now=None):
+        if self.max_size <= 0:
+            return
+        now = time.time() if now is None else now
+        expires = now + self.ttl if exp is None else min(float(exp), now + self.ttl)
+        with self._lock:
+            self._tokens[token] = (user, expires)
+            self._tokens.move_to_end(token)
+            while len(self._tokens) > self.max_size:
+                self._tokens.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def stats(self):
+        return {"size": len(self._tokens), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache()
+
+
+def verify_token(token: str, cache=token_cache):
+    """The user ({'username', 'id'}) a JWT was issued to, from the cache or decoded."""
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate user')
+    user = cache.get(token)
+    if user is None:
+        try:
+            payload = jwt.decode(token, AUTH_SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate user')
         username: str = payload.get('sub')
         user_id: int = payload.get('id')
         if username is None or user_id is None:
-            raise HTTPException(status_code=401, detail='Could not validate user')
-        return {'username': username, 'id': user_id}
-    except JWTError:
-        raise HTTPException(status_code=401, detail='Could not validate user')
-    
-    
-user_dependency = Annotated[dict, Depends(get_current_user)]
\ No newline at end of file
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate user')
+        user = {'username': username, 'id': user_id}
+        cache.put(token, user, payload.get('exp'))
+    # A copy, so a handler changing it does not change the cached user
+    return dict(user)
+
+
+async def get_current_user(token: oauth2_bearer_dependency):
+    return verify_token(token)
+
+
+user_dependency = Annotated[dict, Depends(get_current_user)]
+
+
+async def hash_password(password: str, context=None):
+    """bcrypt hash of a password, computed on the password executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, (context or bcrypt_context).hash, password)
+
+
+async def verify_password(password: str, hashed_password: str, context=None):
+    """Whether a password matches its hash, checked on the password executor."""
+    loop = asyncio.get_running_loop()
+    verify = functools.partial((context or bcrypt_context).verify, password, hashed_password)
+    return await loop.run_in_executor(password_executor, verify)
@@ -0,0 +1,83 @@
+import os
+import tarfile
+import zipfile
+from itertools import islice
+
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+BATCH_PREDICT_SIZE = int(os.getenv("BATCH_PREDICT_SIZE", 32))
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp', '.tif', '.tiff'}
+
+
+def _is_image(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _iter_zip(fileobj):
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not _is_image(info.filename):
+                continue
+            if info.file_size > MAX_IMAGE_BYTES:
+                yield info.filename, ValueError(f"Image larger than {MAX_IMAGE_BYTES} bytes")
+                continue
+            yield info.filename, archive.read(info)
+
+
+def _iter_tar(fileobj):
+    # Stream mode reads members one after the other without seeking back
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile() or not _is_image(member.name):
+                continue
+            if member.size > MAX_IMAGE_BYTES:
+                yield member.name, ValueError(f"Image larger than {MAX_IMAGE_BYTES} bytes")
+                continue
+            yield member.name, archive.extractfile(member).read()
+
+
+def _is_tarfile(fileobj):
+    fileobj.seek(0)
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r:*'):
+            return True
+    except tarfile.TarError:
+        return False
+    finally:
+        fileobj.seek(0)
+
+
+def iter_upload_images(filename, fileobj):
+    """Yield (name, bytes) for an uploaded image, or for every image inside a zip/tar archive.
+
+    Archive members are read one at a time, so memory only holds the current image
+    whatever the size of the archive. Members that cannot be read are yielded with
+    the exception instead of the bytes.
+
+    Args:
+        filename (str): name of the uploaded file
+        fileobj: seekable binary file object (e.g. `UploadFile.file`)
+    """
+    if zipfile.is_zipfile(fileobj):
+        yield from _iter_zip(fileobj)
+    elif _is_tarfile(fileobj):
+        yield from _iter_tar(fileobj)
+    else:
+        fileobj.seek(0)
+        data = fileobj.read(MAX_IMAGE_BYTES + 1)
+        if len(data) > MAX_IMAGE_BYTES:
+            yield filename, ValueError(f"Image larger than {MAX_IMAGE_BYTES} bytes")
+        else:
+            yield filename, data
+
+
+def chunked(iterable, size):
+    """Yield lists of at most `size` items from `iterable`."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
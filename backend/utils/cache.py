@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+PREDICTION_CACHE_MAX_BYTES = int(os.getenv("PREDICTION_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", 24 * 3600))
+# Optional SQLite file shared by every worker of the host
+PREDICTION_CACHE_DB = os.getenv("PREDICTION_CACHE_DB")
+PREDICTION_CACHE_SHARED_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_SHARED_MAX_ENTRIES", 100_000))
+
+
+class LRUCache:
+    """In-process LRU cache with a TTL and a memory budget.
+
+    Values are stored serialized, so their size is known and cached objects
+    cannot be mutated by the caller.
+
+    Args:
+        max_bytes (int): budget for keys and serialized values
+        ttl (float): seconds an entry stays valid
+        clock (Callable): time source, overridable in tests
+    """
+
+    def __init__(self, max_bytes=PREDICTION_CACHE_MAX_BYTES, ttl=PREDICTION_CACHE_TTL, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+        return json.loads(payload)
+
+    def set(self, key, value):
+        payload = json.dumps(value)
+        entry_size = len(key) + len(payload)
+        if entry_size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (payload, self.clock() + self.ttl)
+            self.size += entry_size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        payload, _ = self._entries.pop(key)
+        self.size -= len(key) + len(payload)
+
+
+class SQLiteCache:
+    """Cache tier stored in a SQLite file, shared by all the workers of a host.
+
+    Args:
+        path (str): SQLite database file
+        ttl (float): seconds an entry stays valid
+        max_entries (int): entries kept, the least recently written ones are evicted first
+    """
+
+    def __init__(self, path, ttl=PREDICTION_CACHE_TTL, max_entries=PREDICTION_CACHE_SHARED_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS prediction_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, written_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_prediction_cache_written_at ON prediction_cache (written_at)"
+            )
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads, keep one per thread
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM prediction_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO prediction_cache (key, value, expires_at, written_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            self._writes += 1
+            # Evicting on every write would make each insert scan the table
+            if self._writes % 1000 == 0:
+                self.evict(connection)
+
+    def evict(self, connection=None):
+        connection = connection or self._connection()
+        connection.execute("DELETE FROM prediction_cache WHERE expires_at <= ?", (time.time(),))
+        connection.execute(
+            "DELETE FROM prediction_cache WHERE key IN ("
+            "SELECT key FROM prediction_cache ORDER BY written_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+
+class PredictionCache:
+    """Content-addressed cache of predictions: the key is a hash of the image bytes and the model version.
+
+    Lookups go to the in-process tier first, then to the optional shared tier,
+    whose hits are copied into the in-process tier.
+    """
+
+    def __init__(self, memory=None, shared=None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.shared = shared
+        self.hits_memory = 0
+        self.hits_shared = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(data, model_version):
+        """Hash bytes, any buffer or a binary file object, together with the model version."""
+        digest = hashlib.sha256(model_version.encode())
+        if hasattr(data, 'read'):
+            data.seek(0)
+            while chunk := data.read(1024 * 1024):
+                digest.update(chunk)
+            data.seek(0)
+        else:
+            digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits_memory += 1
+            return value
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.hits_shared += 1
+                self.memory.set(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def lookup(self, data, model_version):
+        """Return (key, cached value or None) for an image."""
+        key = self.key(data, model_version)
+        return key, self.get(key)
+
+    def stats(self):
+        lookups = self.hits_memory + self.hits_shared + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_shared": self.hits_shared,
+            "misses": self.misses,
+            "hit_ratio": (self.hits_memory + self.hits_shared) / lookups if lookups else 0.0,
+            "entries": len(self.memory),
+            "bytes": self.memory.size,
+            "max_bytes": self.memory.max_bytes,
+            "shared": self.shared is not None,
+        }
+
+
+prediction_cache = PredictionCache(shared=SQLiteCache(PREDICTION_CACHE_DB) if PREDICTION_CACHE_DB else None)
@@ -0,0 +1,210 @@
+import os
+import re
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .cache import LRUCache
+from .registry import registry
+from .inference import run_in_executor
+
+
+load_dotenv()
+
+CHAT_CACHE_MAX_BYTES = int(os.getenv("CHAT_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", 6 * 3600))
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", 10_000))
+# Cosine similarity above which two questions get the same answer
+CHAT_CACHE_SIMILARITY = float(os.getenv("CHAT_CACHE_SIMILARITY", 0.92))
+CHAT_CACHE_SEMANTIC = os.getenv("CHAT_CACHE_SEMANTIC", "true").lower() in ("1", "true", "yes")
+CHAT_EMBEDDING_MODEL = os.getenv("CHAT_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+EMBEDDER = 'chat_embedder'
+
+
+def normalize_prompt(prompt):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    prompt = re.sub(r"\s+", " ", prompt.strip().lower())
+    return prompt.rstrip(" ?!.")
+
+
+def load_embedder(model_name=CHAT_EMBEDDING_MODEL):
+    """Small sentence embedding model on CPU: mean pooled, L2 normalized.
+
+    transformers is optional, without it only the exact tier is used.
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    def embed(texts):
+        inputs = tokenizer(texts, padding=True, truncation=True, max_length=256, return_tensors='pt')
+        with torch.inference_mode():
+            hidden = model(**inputs).last_hidden_state
+        mask = inputs['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+        vectors = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+        vectors = torch.nn.functional.normalize(vectors, dim=1)
+        return vectors.numpy().astype(np.float32)
+
+    return embed
+
+
+registry.register(EMBEDDER, load_embedder)
+
+
+class SemanticIndex:
+    """Brute force vector index of the cached questions, one per system prompt and model.
+
+    A few thousand 384-d vectors fit in a few MB and one matrix product is
+    faster than any approximate index at that size.
+
+    Args:
+        max_entries (int): vectors kept per namespace, the least recently used ones are evicted first
+        ttl (float): seconds an entry stays valid
+        threshold (float): minimum cosine similarity of a hit
+    """
+
+    def __init__(self, max_entries=CHAT_CACHE_MAX_ENTRIES, ttl=CHAT_CACHE_TTL,
+                 threshold=CHAT_CACHE_SIMILARITY, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.clock = clock
+        # namespace -> (vectors, [entry, ...]), entry = [value, expires_at, last_used]
+        self._namespaces = {}
+
+    def __len__(self):
+        return sum(len(entries) for _, entries in self._namespaces.values())
+
+    def search(self, namespace, vector):
+        """Return (value, similarity) of the closest valid entry above the threshold, or (None, best)."""
+        if namespace not in self._namespaces:
+            return None, 0.0
+        vectors, entries = self._namespaces[namespace]
+        similarities = vectors @ vector
+        now = self.clock()
+        for index in np.argsort(-similarities):
+            similarity = float(similarities[index])
+            if similarity < self.threshold:
+                return None, similarity
+            entry = entries[index]
+            if entry[1] > now:
+                entry[2] = now
+                return entry[0], similarity
+        return None, 0.0
+
+    def add(self, namespace, vector, value):
+        now = self.clock()
+        vectors, entries = self._namespaces.get(namespace, (np.empty((0, len(vector)), np.float32), []))
+        # Drop expired entries and, when full, the least recently used one
+        keep = [i for i, entry in enumerate(entries) if entry[1] > now]
+        if len(keep) >= self.max_entries:
+            keep.sort(key=lambda i: entries[i][2])
+            keep = sorted(keep[len(keep) - self.max_entries + 1:])
+        vectors = np.vstack([vectors[keep], vector[None, :]])
+        entries = [entries[i] for i in keep] + [[value, now + self.ttl, now]]
+        self._namespaces[namespace] = (vectors, entries)
+
+
+class ChatCache:
+    """Response cache for the chat endpoints.
+
+    Two tiers: exact match on the normalized question, then semantic match on
+    its embedding. Both are keyed on the model and the system prompt, so
+    changing either never serves a stale answer.
+
+    Args:
+        exact (LRUCache): exact match tier
+        semantic (SemanticIndex): semantic tier, None to disable it
+        embedder (Callable): list of texts -> normalized vectors, defaults to the registry model
+    """
+
+    def __init__(self, exact=None, semantic=None, embedder=None):
+        self.exact = exact if exact is not None else LRUCache(CHAT_CACHE_MAX_BYTES, CHAT_CACHE_TTL)
+        self.semantic = semantic
+        self.embedder = embedder
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.lookup_seconds = 0.0
+        # Embeddings of the last questions, `set` after a missed `get` reuses them
+        self._vectors = OrderedDict()
+
+    @staticmethod
+    def namespace(model, system_prompt):
+        return hashlib.sha256(f"{model}\0{system_prompt}".encode()).hexdigest()[:16]
+
+    def key(self, prompt, model, system_prompt):
+        return self.namespace(model, system_prompt) + hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+
+    async def _embed(self, prompt):
+        if self.semantic is None:
+            return None
+        text = normalize_prompt(prompt)
+        if text in self._vectors:
+            return self._vectors[text]
+        try:
+            embedder = self.embedder or await run_in_executor(registry.get, EMBEDDER)
+            vector = (await run_in_executor(embedder, [text]))[0]
+        except Exception as e:
+            # Missing transformers or no model download: keep the exact tier only
+            logging.warning("Semantic chat cache disabled: %s", e)
+            self.semantic = None
+            return None
+        self._vectors[text] = vector
+        if len(self._vectors) > 256:
+            self._vectors.popitem(last=False)
+        return vector
+
+    async def get(self, prompt, model, system_prompt):
+        """Return the cached answer, or None. The embedding is kept for the following `set`."""
+        started = time.perf_counter()
+        try:
+            entry = self.exact.get(self.key(prompt, model, system_prompt))
+            if entry is not None:
+                self.hits_exact += 1
+                self.saved_seconds += entry["latency"]
+                return entry["response"]
+            vector = await self._embed(prompt)
+            if vector is not None:
+                entry, _ = self.semantic.search(self.namespace(model, system_prompt), vector)
+                if entry is not None:
+                    self.hits_semantic += 1
+                    self.saved_seconds += entry["latency"]
+                    return entry["response"]
+            self.misses += 1
+            return None
+        finally:
+            self.lookup_seconds += time.perf_counter() - started
+
+    async def set(self, prompt, model, system_prompt, response, latency):
+        """Cache an answer with the time it took to produce it."""
+        entry = {"response": response, "latency": latency}
+        self.exact.set(self.key(prompt, model, system_prompt), entry)
+        vector = await self._embed(prompt)
+        if vector is not None:
+            self.semantic.add(self.namespace(model, system_prompt), vector, entry)
+
+    def stats(self):
+        lookups = self.hits_exact + self.hits_semantic + self.misses
+        return {
+            "hits_exact": self.hits_exact,
+            "hits_semantic": self.hits_semantic,
+            "misses": self.misses,
+            "hit_ratio": (self.hits_exact + self.hits_semantic) / lookups if lookups else 0.0,
+            # Net of the time spent in lookups, embeddings included
+            "latency_saved_seconds": round(self.saved_seconds - self.lookup_seconds, 3),
+            "entries": len(self.exact),
+            "semantic_entries": len(self.semantic) if self.semantic is not None else None,
+            "semantic": self.semantic is not None,
+        }
+
+
+chat_cache = ChatCache(semantic=SemanticIndex() if CHAT_CACHE_SEMANTIC else None)
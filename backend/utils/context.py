@@ -0,0 +1,195 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+
+from .api import SYSTEM_PROMPT
+from .database import SessionLocal
+from .history import history_writer, get_messages, estimate_tokens, DEFAULT_CONVERSATION
+from .inference import run_in_summary_executor
+from .models import ChatHistory
+
+
+load_dotenv()
+
+# Tokens of the prompt sent to the model: system prompt, summary, past turns and question
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2048))
+# Turns older than the budget are folded into the summary once they add up to this many tokens
+CONTEXT_SUMMARIZE_AFTER = int(os.getenv("CONTEXT_SUMMARIZE_AFTER", 1024))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", 256))
+# Messages read back from the database when a conversation is (re)loaded by this worker
+CONTEXT_LOAD_MESSAGES = int(os.getenv("CONTEXT_LOAD_MESSAGES", 200))
+CONTEXT_MAX_CONVERSATIONS = int(os.getenv("CONTEXT_MAX_CONVERSATIONS", 1000))
+
+
+def summarize_text(text, max_tokens=CONTEXT_SUMMARY_MAX_TOKENS):
+    """Summarize with the shared pipeline of utils/summarizer.py, loaded on first use."""
+    from .summarizer import get_summarizer
+
+    return get_summarizer()(text, max_length=max_tokens, min_length=max_tokens // 4,
+                      do_sample=False, truncation=True)[0]['summary_text']
+
+
+class Conversation:
+    """Turns of one conversation with their token counts, and the summary of the older ones."""
+
+    def __init__(self):
+        self.turns = deque()  # (role, content, tokens), oldest first
+        self.tokens = 0  # of all the turns
+        self.summary = ""
+        self.summary_tokens = 0
+        self.summarizing = False
+        # (message count, last created_at) of the stored conversation this copy reflects
+        self.version = (0, None)
+
+    def add(self, role, content, tokens=None):
+        tokens = estimate_tokens(content) if tokens is None else tokens
+        self.turns.append((role, content, tokens))
+        self.tokens += tokens
+
+    def drop(self, count):
+        """Forget the `count` oldest turns."""
+        for _ in range(count):
+            self.tokens -= self.turns.popleft()[2]
+
+
+class ContextBuilder:
+    """Pack a conversation into the prompt, within a token budget.
+
+    Token counts are computed once per message (the stored `token_count` for
+    messages read from the database) and kept with the turn, so building a
+    prompt only walks the turns that fit: newest first, until the budget is
+    spent. Turns falling out of the budget are folded into a rolling summary
+    on the summary executor, in the background; the summary is put right
+    after the system prompt.
+
+    Other workers add to (and delete) conversations too: before each prompt,
+    the message count and last `created_at` of the stored conversation (one
+    index range) are compared to those of the copy in memory, which is
+    loaded again when they differ. The exchanges of this worker move the
+    version of its copy along, they do not cause a reload.
+
+    Args:
+        budget (int): tokens of the whole prompt
+        summarize_after (int): tokens of dropped turns that trigger a new summary
+        summarizer (Callable): text -> summary, None to drop old turns without summary
+        session_factory (Callable): returns a SQLAlchemy session, to load conversations
+        writer (HistoryWriter): where the exchanges are stored
+    """
+
+    def __init__(self, budget=CONTEXT_TOKEN_BUDGET, summarize_after=CONTEXT_SUMMARIZE_AFTER,
+                 summarizer=summarize_text, session_factory=SessionLocal,
+                 max_conversations=CONTEXT_MAX_CONVERSATIONS, writer=history_writer):
+        self.budget = budget
+        self.summarize_after = summarize_after
+        self.summarizer = summarizer
+        self.session_factory = session_factory
+        self.max_conversations = max_conversations
+        self.writer = writer
+        self._conversations = OrderedDict()
+
+    def _load(self, user_id, conversation_id, version=None):
+        """The stored conversation, or None if it is still at `version`."""
+        # The exchanges of this worker waiting to be written count in the version
+        self.writer.flush()
+        db = self.session_factory()
+        try:
+            stored = tuple(db.execute(select(func.count(), func.max(ChatHistory.created_at)).where(
+                ChatHistory.user_id == user_id, ChatHistory.conversation_id == conversation_id)).one())
+            if stored == version:
+                return None
+            messages, _ = get_messages(db, user_id, conversation_id, limit=CONTEXT_LOAD_MESSAGES)
+        finally:
+            db.close()
+        conversation = Conversation()
+        for message in reversed(messages):
+            conversation.add(message.role, message.content, message.token_count or None)
+        conversation.version = stored
+        return conversation
+
+    async def conversation(self, user_id, conversation_id=None):
+        key = (user_id, conversation_id or DEFAULT_CONVERSATION)
+        cached = self._conversations.get(key)
+        loop = asyncio.get_running_loop()
+        conversation = await loop.run_in_executor(
+            None, self._load, *key, cached.version if cached is not None else None)
+        if conversation is None:
+            conversation = cached
+            if self._conversations.get(key) is not cached:
+                # Forgotten (deleted) while the version was read
+                conversation = await loop.run_in_executor(None, self._load, *key)
+        self._conversations[key] = conversation
+        self._conversations.move_to_end(key)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+        return conversation
+
+    def forget(self, user_id, conversation_id=None):
+        """Drop the copy of a conversation, e.g. once it is deleted."""
+        self._conversations.pop((user_id, conversation_id or DEFAULT_CONVERSATION), None)
+
+    def pack(self, conversation, question, system_prompt=SYSTEM_PROMPT):
+        """Messages for the model: system prompt, summary, the recent turns that fit, question."""
+        remaining = self.budget - estimate_tokens(system_prompt) - estimate_tokens(question) - conversation.summary_tokens
+        recent = []
+        kept_tokens = 0
+        # Stops at the first turn that does not fit, so the cost does not grow with the conversation
+        for role, content, tokens in reversed(conversation.turns):
+            if tokens > remaining:
+                break
+            remaining -= tokens
+            kept_tokens += tokens
+            recent.append({"role": role, "content": content})
+
+        if conversation.tokens - kept_tokens >= self.summarize_after:
+            self._schedule_summary(conversation, len(conversation.turns) - len(recent))
+
+        system = system_prompt
+        if conversation.summary:
+            system += f"\n\nSummary of the earlier conversation: {conversation.summary}"
+        return [{"role": "system", "content": system}, *reversed(recent), {"role": "user", "content": question}]
+
+    async def build(self, user_id, question, conversation_id=None, system_prompt=SYSTEM_PROMPT):
+        conversation = await self.conversation(user_id, conversation_id)
+        return self.pack(conversation, question, system_prompt)
+
+    def _schedule_summary(self, conversation, count):
+        if conversation.summarizing:
+            return
+        if self.summarizer is None:
+            # No summarizer: just forget the turns that no longer fit
+            conversation.drop(count)
+            return
+        conversation.summarizing = True
+        turns = [conversation.turns[i] for i in range(count)]
+        text = "\n".join(filter(None, [conversation.summary] + [f"{role}: {content}" for role, content, _ in turns]))
+        task = asyncio.ensure_future(run_in_summary_executor(self.summarizer, text))
+
+        def done(task):
+            conversation.summarizing = False
+            if task.cancelled() or task.exception() is not None:
+                # e.g. transformers missing: the old turns are forgotten instead, memory stays bounded
+                logging.warning("Could not summarize the conversation: %s", None if task.cancelled() else task.exception())
+            else:
+                conversation.summary = task.result()
+                conversation.summary_tokens = estimate_tokens(conversation.summary)
+            # Only these turns are removed, new ones may have been added meanwhile
+            conversation.drop(count)
+
+        task.add_done_callback(done)
+
+    def record_exchange(self, user_id, question, answer, conversation_id=None):
+        """Store a question and its answer, and add them to the conversation if it is loaded."""
+        created_at = self.writer.record_exchange(user_id, question, answer, conversation_id)
+        conversation = self._conversations.get((user_id, conversation_id or DEFAULT_CONVERSATION))
+        if conversation is not None:
+            conversation.add('user', question)
+            conversation.add('assistant', answer)
+            count, last = conversation.version
+            conversation.version = (count + 2, max(filter(None, (last, created_at))))
+
+
+context_builder = ContextBuilder()
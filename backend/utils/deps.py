@@ -1,48 +1,29 @@
-import os
-
-
-
 from typing import Annotated
 from sqlalchemy.orm import Session
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
-from jose import jwt, JWTError
-from dotenv import load_dotenv
-from .database import SessionLocal
-
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import Depends
+from .database import LazySession, AsyncSessionLocal
 
-load_dotenv()
+# Authentication lives in utils.auth, re-exported for the routers importing it from here
+from .auth import bcrypt_context, get_current_user, user_dependency  # noqa: F401
 
-SECRET_KEY = os.getenv('AUTH_SECRET_KEY')
-ALGORITHM = os.getenv('AUTH_ALGORITHM')
 
 def get_db():
-    db = SessionLocal()
+    # The session (and its connection) is only opened if the endpoint uses it
+    db = LazySession()
     try:
         yield db
     finally:
         db.close()
-        
+
 
 db_dependency = Annotated[Session, Depends(get_db)]
 
-bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
-oauth2_bearer = OAuth2PasswordBearer(tokenUrl='auth/token')
-oauth2_bearer_dependency = Annotated[str, Depends(oauth2_bearer)]
 
+async def get_async_db():
+    # Connects on the first awaited query, like the sync one
+    async with AsyncSessionLocal() as db:
+        yield db
 
-async def get_current_user(token: oauth2_bearer_dependency):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get('sub')
-        user_id: int = payload.get('id')
-        if username is None or user_id is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate user')
-        return {'username': username, 'id': user_id}
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate user')
-    
-
-user_dependency = Annotated[dict, Depends(get_current_user)]
 
+async_db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
@@ -0,0 +1,203 @@
+"""Drift of the image classifier: logged predictions against a reference built from TRAIN_DATA_DIR.
+
+    python -m utils.drift --hours 24
+    python -m utils.drift --rebuild-reference
+
+The reference holds the embeddings (avgpool output), confidences and classes
+of the served model on the training images, computed once per model version
+with the preprocessing of the endpoints. The prediction log of a window is
+compared to it:
+
+- confidence: two-sample Kolmogorov-Smirnov test and PSI
+- embedding: share of the 512 dimensions whose KS test rejects, and the
+  cosine distance between the mean embeddings
+- predicted classes: PSI of the class frequencies
+"""
+import os
+import json
+import hashlib
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import torch
+from scipy.stats import ks_2samp
+from dotenv import load_dotenv
+
+from .batch import IMAGE_EXTENSIONS, BATCH_PREDICT_SIZE, chunked
+from .inference import run_model
+from .model import CAT_DOG_MODEL, TRAIN_DATA_DIR, cat_dog_classes, device, model_version, pop_embeddings
+from .prediction_log import PREDICTION_LOG_DIR, EMBEDDING_DTYPE, embeddings_matrix, read_predictions
+from .transform import preprocessor, open_image
+
+
+load_dotenv()
+
+# Prefixed with an underscore, the Parquet readers of the prediction log skip it
+DRIFT_REFERENCE_DIR = os.getenv("DRIFT_REFERENCE_DIR", os.path.join(PREDICTION_LOG_DIR, '_reference'))
+# Training images in the reference, sampled evenly when there are more
+DRIFT_REFERENCE_LIMIT = int(os.getenv("DRIFT_REFERENCE_LIMIT", 2000))
+DRIFT_WINDOW_HOURS = int(os.getenv("DRIFT_WINDOW_HOURS", 24))
+DRIFT_MIN_SAMPLES = int(os.getenv("DRIFT_MIN_SAMPLES", 30))
+# Logged predictions compared at most, sampled evenly from the window
+DRIFT_MAX_SAMPLES = int(os.getenv("DRIFT_MAX_SAMPLES", 5000))
+DRIFT_PVALUE = float(os.getenv("DRIFT_PVALUE", 0.01))
+DRIFT_EMBEDDING_SHARE = float(os.getenv("DRIFT_EMBEDDING_SHARE", 0.2))
+DRIFT_PSI_THRESHOLD = float(os.getenv("DRIFT_PSI_THRESHOLD", 0.2))
+
+
+def reference_path(version=None):
+    digest = hashlib.sha256((version or model_version()).encode()).hexdigest()[:12]
+    return os.path.join(DRIFT_REFERENCE_DIR, f"reference-{digest}.npz")
+
+
+def _sample(items, limit, seed=0):
+    if limit is None or len(items) <= limit:
+        return items
+    indices = np.sort(np.random.default_rng(seed).choice(len(items), limit, replace=False))
+    return [items[index] for index in indices]
+
+
+def build_reference(data_dir=TRAIN_DATA_DIR, limit=DRIFT_REFERENCE_LIMIT, batch_size=BATCH_PREDICT_SIZE):
+    """Embeddings, confidences and classes of the model on (a sample of) the images of `data_dir`."""
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(data_dir)
+        for name in names if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    )
+    classes = cat_dog_classes()
+    embeddings, confidences, predicted = [], [], []
+    for chunk in chunked(_sample(paths, limit), batch_size):
+        buffer = preprocessor.empty(len(chunk))
+        kept = 0
+        for path in chunk:
+            try:
+                with open(path, 'rb') as f:
+                    preprocessor.into(open_image(f.read()), buffer, kept)
+                kept += 1
+            except Exception:
+                continue
+        if not kept:
+            continue
+        outputs = run_model(CAT_DOG_MODEL, buffer[:kept], device)
+        batch_embeddings = pop_embeddings()
+        if batch_embeddings is None:
+            raise RuntimeError("The served model keeps no embeddings, drift needs INFERENCE_BACKEND=eager")
+        confidence, index = torch.softmax(outputs, dim=1).max(1)
+        embeddings.append(batch_embeddings.float().cpu().numpy().astype(EMBEDDING_DTYPE))
+        confidences.append(confidence.numpy())
+        predicted += [classes[i] for i in index.tolist()]
+    if not predicted:
+        raise ValueError(f"No readable images in {data_dir}")
+    return {
+        "embeddings": np.concatenate(embeddings),
+        "confidence": np.concatenate(confidences).astype(np.float32),
+        "predicted": np.array(predicted),
+        "model_version": np.array(model_version()),
+    }
+
+
+def load_reference(rebuild=False, data_dir=TRAIN_DATA_DIR):
+    """The reference of the served model version, built and saved the first time."""
+    path = reference_path()
+    if not rebuild and os.path.exists(path):
+        with np.load(path) as reference:
+            return {key: reference[key] for key in reference.files}
+    reference = build_reference(data_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(temporary, **reference)
+    os.replace(temporary, path)
+    return reference
+
+
+def psi(reference, current, bins=10):
+    """Population stability index of a numeric feature, on the deciles of the reference."""
+    edges = np.unique(np.quantile(reference, np.linspace(0, 1, bins + 1)))
+    if len(edges) < 2:
+        return 0.0
+    edges[0], edges[-1] = -np.inf, np.inf
+    expected = np.histogram(reference, edges)[0] / len(reference)
+    actual = np.histogram(current, edges)[0] / len(current)
+    return categorical_psi(expected, actual)
+
+
+def categorical_psi(expected, actual, floor=1e-4):
+    expected = np.clip(np.asarray(expected, dtype=float), floor, None)
+    actual = np.clip(np.asarray(actual, dtype=float), floor, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def compute_drift(reference, confidence, predicted, embeddings, pvalue=DRIFT_PVALUE,
+                  embedding_share=DRIFT_EMBEDDING_SHARE, psi_threshold=DRIFT_PSI_THRESHOLD):
+    """Compare current confidences, classes and embeddings to the reference."""
+    report = {"reference_rows": int(len(reference["confidence"])), "current_rows": int(len(confidence))}
+
+    test = ks_2samp(reference["confidence"], confidence)
+    confidence_psi = psi(reference["confidence"], confidence)
+    report["confidence"] = {
+        "reference_mean": round(float(np.mean(reference["confidence"])), 4),
+        "current_mean": round(float(np.mean(confidence)), 4),
+        "ks_statistic": round(float(test.statistic), 4),
+        "p_value": float(test.pvalue),
+        "psi": round(confidence_psi, 4),
+        "drift": bool(test.pvalue < pvalue),
+    }
+
+    classes = sorted(set(reference["predicted"].tolist()) | set(predicted))
+    expected = [np.mean(reference["predicted"] == name) for name in classes]
+    actual = [np.mean(np.asarray(predicted) == name) for name in classes]
+    class_psi = categorical_psi(expected, actual)
+    report["predicted_class"] = {
+        "reference": dict(zip(classes, np.round(expected, 4).tolist())),
+        "current": dict(zip(classes, np.round(actual, 4).tolist())),
+        "psi": round(class_psi, 4),
+        "drift": bool(class_psi >= psi_threshold),
+    }
+
+    if len(embeddings):
+        reference_embeddings = reference["embeddings"].astype(np.float32)
+        pvalues = ks_2samp(reference_embeddings, embeddings, axis=0).pvalue
+        drifted = float(np.mean(pvalues < pvalue))
+        a, b = reference_embeddings.mean(0), embeddings.mean(0)
+        cosine = 1 - float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-12))
+        report["embedding"] = {
+            "rows": int(len(embeddings)),
+            "drifted_dimensions": round(drifted, 4),
+            "mean_cosine_distance": round(cosine, 6),
+            "drift": bool(drifted > embedding_share),
+        }
+
+    report["drift"] = any(part["drift"] for part in report.values() if isinstance(part, dict))
+    return report
+
+
+def run_drift(hours=DRIFT_WINDOW_HOURS, end=None, directory=PREDICTION_LOG_DIR, reference=None, rebuild_reference=False):
+    """Drift report of the predictions logged in the last `hours` hours (up to `end`, UTC)."""
+    end = end or datetime.utcnow()
+    start = end - timedelta(hours=hours)
+    current = read_predictions(directory, start, end, columns=['confidence', 'predicted_class', 'embedding', 'cached'])
+    # Cache hits repeat an earlier prediction, without confidence nor embedding
+    current = current[~current['cached'].fillna(False).astype(bool)]
+    window = {"start": start.isoformat(), "end": end.isoformat(), "hours": hours}
+    if len(current) < DRIFT_MIN_SAMPLES:
+        return {"window": window, "rows": int(len(current)), "drift": None,
+                "detail": f"At least {DRIFT_MIN_SAMPLES} predictions are needed"}
+
+    if reference is None:
+        reference = load_reference(rebuild=rebuild_reference)
+    if len(current) > DRIFT_MAX_SAMPLES:
+        current = current.iloc[np.sort(np.random.default_rng(0).choice(len(current), DRIFT_MAX_SAMPLES, replace=False))]
+    confidence = current['confidence'].dropna().to_numpy(dtype=np.float32)
+    report = compute_drift(reference, confidence, current['predicted_class'].astype(str).tolist(),
+                           embeddings_matrix(current['embedding'].tolist()))
+    return {"window": window, "rows": int(len(current)), "model_version": str(reference["model_version"]), **report}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=int, default=DRIFT_WINDOW_HOURS)
+    parser.add_argument('--directory', default=PREDICTION_LOG_DIR)
+    parser.add_argument('--rebuild-reference', action='store_true')
+    args = parser.parse_args()
+    print(json.dumps(run_drift(args.hours, directory=args.directory, rebuild_reference=args.rebuild_reference), indent=2))
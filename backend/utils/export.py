@@ -0,0 +1,207 @@
+"""Export the cat/dog ResNet-18 to optimized CPU inference backends and compare them.
+
+Run from the backend folder:
+
+    python -m utils.export --backends torchscript onnx int8-dynamic int8-static --report
+
+Artifacts are written to EXPORT_DIR, where `load_cat_dog_model` picks them up
+when INFERENCE_BACKEND is set to the same name. The report measures accuracy,
+agreement with the FP32 eager model and latency of every backend on the Test split.
+"""
+import os
+import json
+import time
+import argparse
+import logging
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+from torchvision import datasets
+from dotenv import load_dotenv
+
+from .model import (
+    CHANNELS_LAST,
+    EXPORT_DIR,
+    TRAIN_DATA_DIR,
+    ChannelsLast,
+    build_cat_dog_resnet,
+    exported_model_path,
+    load_cat_dog_model,
+)
+from .transform import data_transforms
+
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+REPORTS_DIR = os.getenv("REPORTS_DIR", os.path.join(BASE_DIR, '..', 'reports'))
+
+
+def example_input(batch_size=1):
+    return torch.randn(batch_size, 3, 224, 224)
+
+
+def test_data_dir():
+    """The Test split: TRAIN_DATA_DIR either holds the Train/Test splits or is the Train split itself."""
+    candidates = [os.path.join(TRAIN_DATA_DIR, 'Test'),
+                  os.path.join(os.path.dirname(TRAIN_DATA_DIR.rstrip(os.sep)), 'Test')]
+    for path in candidates:
+        if os.path.isdir(path):
+            return path
+    raise FileNotFoundError(f"No Test split found in {candidates}")
+
+
+def test_loader(batch_size=32, data_dir=None):
+    dataset = datasets.ImageFolder(data_dir or test_data_dir(), data_transforms)
+    return DataLoader(dataset, batch_size=batch_size, shuffle=False)
+
+
+def export_torchscript(model, path):
+    if CHANNELS_LAST:
+        model = ChannelsLast(model).eval()
+    with torch.inference_mode():
+        traced = torch.jit.trace(model, example_input())
+    # Freezing inlines the weights and folds batch norms into the convolutions
+    traced = torch.jit.freeze(traced)
+    torch.jit.save(traced, path)
+
+
+def export_onnx(model, path):
+    torch.onnx.export(
+        model, (example_input(),), path,
+        input_names=['input'], output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+        dynamo=False,
+    )
+
+
+def export_int8_dynamic(model, path):
+    # Only the final Linear layer is dynamically quantizable in a ResNet
+    quantized = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    with torch.inference_mode():
+        traced = torch.jit.freeze(torch.jit.trace(quantized, example_input()))
+    torch.jit.save(traced, path)
+
+
+def export_int8_static(model, path, calibration_batches=10, data_dir=None):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    prepared = prepare_fx(model, get_default_qconfig_mapping('x86'), (example_input(),))
+    # Calibrate the activation ranges on real images of the Test split
+    with torch.inference_mode():
+        for batch_index, (images, _) in enumerate(test_loader(data_dir=data_dir)):
+            if batch_index >= calibration_batches:
+                break
+            prepared(images)
+    quantized = convert_fx(prepared)
+    with torch.inference_mode():
+        traced = torch.jit.freeze(torch.jit.trace(quantized, example_input()))
+    torch.jit.save(traced, path)
+
+
+EXPORTERS = {
+    'torchscript': export_torchscript,
+    'onnx': export_onnx,
+    'int8-dynamic': export_int8_dynamic,
+    'int8-static': export_int8_static,
+}
+
+
+def export(backends, calibration_batches=10, data_dir=None):
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    for backend in backends:
+        path = exported_model_path(backend)
+        logging.info("Exporting %s to %s", backend, path)
+        kwargs = {'calibration_batches': calibration_batches, 'data_dir': data_dir} if backend == 'int8-static' else {}
+        # Every exporter gets a fresh FP32 model, quantization modifies it
+        EXPORTERS[backend](build_cat_dog_resnet(), path, **kwargs)
+        print(f"Exported {backend}: {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+def _latency_ms(model, batch_size, repeat):
+    images = example_input(batch_size)
+    with torch.inference_mode():
+        model(images)  # warm-up
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model(images)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+
+def evaluate(backend, reference_predictions=None, repeat=20, data_dir=None):
+    """Accuracy, agreement with the FP32 predictions and latency of one backend."""
+    model = load_cat_dog_model(backend)
+    if backend == 'eager':
+        model = model.cpu()
+
+    predictions, labels = [], []
+    with torch.inference_mode():
+        for images, targets in test_loader(data_dir=data_dir):
+            predictions.append(model(images).argmax(1))
+            labels.append(targets)
+    predictions = torch.cat(predictions)
+    labels = torch.cat(labels)
+
+    result = {
+        "backend": backend,
+        "accuracy": (predictions == labels).float().mean().item(),
+        "latency_ms_batch_1": _latency_ms(model, 1, repeat),
+        "latency_ms_batch_32": _latency_ms(model, 32, max(1, repeat // 4)),
+    }
+    if reference_predictions is not None:
+        result["agreement_with_fp32"] = (predictions == reference_predictions).float().mean().item()
+    return result, predictions
+
+
+def write_report(results):
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    json_path = os.path.join(REPORTS_DIR, 'inference_backends_report.json')
+    with open(json_path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    columns = ["backend", "accuracy", "agreement_with_fp32", "latency_ms_batch_1", "latency_ms_batch_32"]
+    rows = "".join(
+        "<tr>" + "".join(f"<td>{result.get(column, '')}</td>" for column in columns) + "</tr>"
+        for result in results
+    )
+    html_path = os.path.join(REPORTS_DIR, 'inference_backends_report.html')
+    with open(html_path, 'w') as f:
+        f.write("<h1>Cat/dog classifier: accuracy vs latency per backend</h1>"
+                "<table border='1'><tr>" + "".join(f"<th>{column}</th>" for column in columns) + "</tr>"
+                + rows + "</table>")
+    return html_path
+
+
+def report(backends, data_dir=None):
+    reference, reference_predictions = evaluate('eager', data_dir=data_dir)
+    reference["agreement_with_fp32"] = 1.0
+    results = [reference]
+    for backend in backends:
+        if backend == 'eager':
+            continue
+        result, _ = evaluate(backend, reference_predictions, data_dir=data_dir)
+        results.append(result)
+
+    for result in results:
+        print(json.dumps(result))
+    print(f"Report saved to {write_report(results)}")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', nargs='+', default=list(EXPORTERS), choices=list(EXPORTERS))
+    parser.add_argument('--calibration-batches', type=int, default=10)
+    parser.add_argument('--data-dir', help='labelled images used for calibration and the report (default: the Test split)')
+    parser.add_argument('--report', action='store_true', help='compare every exported backend with the FP32 eager model')
+    args = parser.parse_args()
+
+    export(args.backends, args.calibration_batches, args.data_dir)
+    if args.report:
+        report(args.backends, args.data_dir)
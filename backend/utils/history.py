@@ -0,0 +1,198 @@
+import os
+import json
+import base64
+import queue
+import logging
+import threading
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, or_, func, select
+
+from .aggregates import increment_statement
+from .database import SessionLocal
+from .models import ChatHistory
+
+
+load_dotenv()
+
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", 200))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", 0.5))
+DEFAULT_CONVERSATION = 'default'
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token), good enough for budgets and stats."""
+    return max(1, len(text) // 4) if text else 0
+
+
+class HistoryWriter:
+    """Write-behind store of chat messages.
+
+    `record` only puts the message on a queue, a background thread inserts the
+    queued messages in batches (one transaction per batch), so the chat path
+    never waits on SQLite. `created_at` is taken when the message is recorded,
+    not when it is written.
+
+    Args:
+        session_factory (Callable): returns a SQLAlchemy session
+        batch_size (int): maximum messages per insert
+        flush_interval (float): seconds between two writes when the queue is not full
+    """
+
+    def __init__(self, session_factory=SessionLocal, batch_size=HISTORY_BATCH_SIZE,
+                 flush_interval=HISTORY_FLUSH_INTERVAL):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._closed = threading.Event()
+
+    def record(self, user_id, role, content, conversation_id=None):
+        """Queue a message, returns its `created_at`."""
+        created_at = datetime.utcnow()
+        self._queue.put({
+            'user_id': user_id,
+            'conversation_id': conversation_id or DEFAULT_CONVERSATION,
+            'role': role,
+            'content': content,
+            'created_at': created_at,
+            'token_count': estimate_tokens(content),
+        })
+        if self._thread is None:
+            self._start()
+        return created_at
+
+    def record_exchange(self, user_id, question, answer, conversation_id=None):
+        self.record(user_id, 'user', question, conversation_id)
+        return self.record(user_id, 'assistant', answer, conversation_id)
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._closed.clear()
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+
+    def _drain(self):
+        rows = []
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def flush(self):
+        """Write everything queued so far, e.g. before reading the history back."""
+        with self._lock:
+            while rows := self._drain():
+                self._write(rows)
+
+    def _write(self, rows):
+        db = self.session_factory()
+        try:
+            db.add_all([ChatHistory(**row) for row in rows])
+            db.execute(increment_statement(db, {'chats': len(rows)}))
+            db.commit()
+            self.written += len(rows)
+            self.batches += 1
+        except Exception:
+            db.rollback()
+            self.errors += 1
+            logging.exception("Could not write %d chat messages", len(rows))
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def close(self):
+        """Stop the writer thread after a last flush."""
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'errors': self.errors,
+        }
+
+
+def encode_cursor(message):
+    payload = json.dumps([message.created_at.isoformat(), message.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    created_at, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(created_at), message_id
+
+
+def messages_query(user_id, conversation_id, limit=50, cursor=None):
+    """One page (and one row more) of a conversation, newest first.
+
+    Keyset pagination on (created_at, id): every page is an index range scan,
+    however deep the client pages.
+    """
+    query = select(ChatHistory).where(
+        ChatHistory.user_id == user_id,
+        ChatHistory.conversation_id == conversation_id,
+    )
+    if cursor:
+        created_at, message_id = decode_cursor(cursor)
+        query = query.where(or_(
+            ChatHistory.created_at < created_at,
+            and_(ChatHistory.created_at == created_at, ChatHistory.id < message_id),
+        ))
+    return query.order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc()).limit(limit + 1)
+
+
+def _page(messages, limit):
+    next_cursor = encode_cursor(messages[limit - 1]) if len(messages) > limit else None
+    return messages[:limit], next_cursor
+
+
+def conversations_query(user_id):
+    last_at = func.max(ChatHistory.created_at).label('last_message_at')
+    return (
+        select(ChatHistory.conversation_id, func.count(ChatHistory.id).label('messages'), last_at)
+        .where(ChatHistory.user_id == user_id)
+        .group_by(ChatHistory.conversation_id)
+        .order_by(last_at.desc())
+    )
+
+
+def get_messages(db, user_id, conversation_id, limit=50, cursor=None):
+    """One page of a conversation, newest first, and the cursor of the next (older) page."""
+    return _page(db.scalars(messages_query(user_id, conversation_id, limit, cursor)).all(), limit)
+
+
+async def fetch_messages(db, user_id, conversation_id, limit=50, cursor=None):
+    """`get_messages` on an AsyncSession."""
+    return _page((await db.scalars(messages_query(user_id, conversation_id, limit, cursor))).all(), limit)
+
+
+def get_conversations(db, user_id):
+    """Conversations of a user with their message count and last activity, most recent first."""
+    return db.execute(conversations_query(user_id)).all()
+
+
+async def fetch_conversations(db, user_id):
+    """`get_conversations` on an AsyncSession."""
+    return (await db.execute(conversations_query(user_id))).all()
+
+
+history_writer = HistoryWriter()
@@ -0,0 +1,216 @@
+import os
+import asyncio
+import logging
+import functools
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from dotenv import load_dotenv
+
+from .registry import registry
+
+
+load_dotenv()
+
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", 32))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", 5))
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 2))
+# Threads of the summarization model (documents and older chat turns), apart from the inference executor
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", 1))
+INFERENCE_TORCH_THREADS = int(os.getenv("INFERENCE_TORCH_THREADS", max(1, (os.cpu_count() or 1) // INFERENCE_WORKERS)))
+
+# Split the cores between the executor threads so concurrent forward passes
+# do not oversubscribe the CPU (torch's intra-op pool is process-wide).
+torch.set_num_threads(INFERENCE_TORCH_THREADS)
+
+# Decoding, preprocessing and forward passes run here instead of on the event loop,
+# so a slow image never stalls unrelated endpoints served by the same worker.
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix='inference')
+# A summary keeps a thread for seconds: on the inference executor it would hold up /predict
+summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix='summary')
+
+
+async def _run(executor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # In a copy of the caller's context, so stage timers on the thread know the request they belong to
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """Run blocking CPU work (PIL, transforms, torch) on the inference executor."""
+    return await _run(inference_executor, func, *args, **kwargs)
+
+
+async def run_in_summary_executor(func, *args, **kwargs):
+    """Run summarization (loading the model, tokenizing, generating) on the summary executor."""
+    return await _run(summary_executor, func, *args, **kwargs)
+
+
+def _bucket(value):
+    """Round a count up to the next power of two, used as histogram bucket."""
+    bucket = 1
+    while bucket < value:
+        bucket *= 2
+    return bucket
+
+
+class InferenceBatcher:
+    """Shared inference queue that groups concurrent requests into one forward pass.
+
+    Requests are collected until `max_batch_size` items are waiting or `max_wait_ms`
+    elapsed since the first one arrived, then stacked into a single tensor.
+
+    Args:
+        model: callable taking a (N, C, H, W) tensor and returning (N, num_classes) logits
+        device: device the stacked batch is moved to before the forward pass
+        max_batch_size (int): maximum number of images per forward pass
+        max_wait_ms (float): how long the first request of a batch waits for company
+        executor: executor running the forward passes
+        max_inflight (int): number of batches allowed on the executor at once
+        capture (Callable): called on the executor thread right after a forward pass, returns
+            extra (N, ...) outputs of that pass (e.g. embeddings) or None
+    """
+
+    def __init__(self, model, device=None,
+                 max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+                 max_wait_ms=INFERENCE_MAX_WAIT_MS,
+                 executor=inference_executor,
+                 max_inflight=INFERENCE_WORKERS,
+                 capture=None):
+        self.model = model
+        self.capture = capture
+        self.device = device or torch.device('cpu')
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self.max_inflight = max_inflight
+
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._inflight = None
+
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = Counter()
+        self.queue_depths = Counter()
+
+    async def predict(self, tensor):
+        """Queue one preprocessed image (C, H, W) and wait for its logits row."""
+        logits, _ = await self.predict_with_extras(tensor)
+        return logits
+
+    async def predict_with_extras(self, tensor):
+        """Same as `predict`, also returns the row of the `capture` outputs (None without capture)."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((tensor, future))
+        return await future
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "requests": self.requests,
+            "batches": self.batches,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "queue_depth_histogram": dict(sorted(self.queue_depths.items())),
+        }
+
+    def _ensure_worker(self):
+        # The queue and worker task are bound to the running loop, so they are
+        # created lazily (and recreated if the loop changed, e.g. in tests).
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+            self._worker = loop.create_task(self._run())
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without yielding, then wait for the rest.
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Wait for a free executor slot first: while every slot is busy, new
+            # requests pile up in the queue and end up in a larger batch.
+            await self._inflight.acquire()
+            batch = await self._collect()
+            self.queue_depths[_bucket(self._queue.qsize() + len(batch))] += 1
+
+            # Requests whose client went away do not need a slot in the batch.
+            batch = [(tensor, future) for tensor, future in batch if not future.done()]
+            if not batch:
+                self._inflight.release()
+                continue
+
+            self.requests += len(batch)
+            self.batches += 1
+            self.batch_sizes[len(batch)] += 1
+
+            self._loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        try:
+            outputs, extras = await self._loop.run_in_executor(
+                self.executor, self._forward, [tensor for tensor, _ in batch])
+        except Exception as e:
+            logging.exception("Batched inference failed")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._inflight.release()
+
+        for index, ((_, future), output) in enumerate(zip(batch, outputs)):
+            if not future.done():
+                future.set_result((output, extras[index] if extras is not None else None))
+
+    def _forward(self, tensors):
+        images = torch.stack(tensors).to(self.device)
+        with torch.inference_mode():
+            outputs = self.model(images)
+        extras = self.capture() if self.capture is not None else None
+        return outputs.cpu(), extras.cpu() if extras is not None else None
+
+
+def run_model(name, images, device=None):
+    """Blocking forward pass of a registry model over an already stacked (N, C, H, W) batch."""
+    with torch.inference_mode():
+        outputs = registry.get(name)(images.to(device or torch.device('cpu')))
+    return outputs.cpu()
+
+
+_batchers = {}
+
+
+def get_batcher(name, device=None, capture=None):
+    """Shared batcher for a registry model, so every router feeds the same queue."""
+    if name not in _batchers:
+        def model(images):
+            # Resolved on the executor, so a cold model never loads on the event loop
+            return registry.get(name)(images)
+
+        _batchers[name] = InferenceBatcher(model, device)
+    if capture is not None:
+        _batchers[name].capture = capture
+    return _batchers[name]
@@ -0,0 +1,384 @@
+import os
+import json
+import time
+import uuid
+import socket
+import shutil
+import asyncio
+import logging
+import itertools
+import functools
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import or_
+
+from .database import SessionLocal
+from .models import Job
+
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# Uploaded payloads wait here until their job runs: a file-based stand-in for a broker
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(BASE_DIR, '..', 'jobs_data'))
+# Progress is pushed to subscribers on every update, but written to the database at most this often
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", 1.0))
+# Every worker process polls the table this often: heartbeats, queued jobs, cancellations, remote progress
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+# A running job whose process has not sent a heartbeat for this long is queued again
+JOB_HEARTBEAT_TIMEOUT = float(os.getenv("JOB_HEARTBEAT_TIMEOUT", 30))
+
+TERMINAL_STATUSES = {'succeeded', 'failed', 'cancelled'}
+
+
+def _requeue(db, *conditions):
+    """Queue the matching running jobs again, or cancel those whose cancellation was requested. Returns the count."""
+    running = db.query(Job).filter(Job.status == 'running', *conditions)
+    cancelled = running.filter(Job.cancel_requested).update(
+        {"status": 'cancelled', "finished_at": datetime.utcnow()}, synchronize_session=False)
+    queued = running.filter(~Job.cancel_requested).update(
+        {"status": 'queued', "owner": None, "heartbeat_at": None}, synchronize_session=False)
+    db.commit()
+    return cancelled + queued
+
+
+def job_to_dict(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "user_id": job.user_id,
+        "status": job.status,
+        "priority": job.priority,
+        "progress": job.progress,
+        "detail": job.detail,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class JobContext:
+    """Handed to a job handler: its parameters, uploaded files and progress reporting."""
+
+    def __init__(self, queue, job_id, params):
+        self.queue = queue
+        self.job_id = job_id
+        self.params = params
+        self._saved_at = 0.0
+        self._unsaved = {}
+
+    @property
+    def files(self):
+        return self.params.get('files', [])
+
+    async def progress(self, fraction=None, detail=None):
+        """Report progress, a fraction in [0, 1] and/or a short description; either one left out keeps its value."""
+        fields = {}
+        if fraction is not None:
+            fields["progress"] = round(min(max(fraction, 0.0), 1.0), 4)
+        if detail is not None:
+            fields["detail"] = detail
+        self.queue._publish(self.job_id, status='running', **fields)
+        # Saved at most every JOB_PROGRESS_INTERVAL: what the skipped calls set goes with the next save
+        self._unsaved.update(fields)
+        if self._unsaved and time.monotonic() - self._saved_at >= JOB_PROGRESS_INTERVAL:
+            self._saved_at = time.monotonic()
+            fields, self._unsaved = self._unsaved, {}
+            await self.queue._save(self.job_id, **fields)
+
+
+class JobQueue:
+    """Job queue backed by the `jobs` table, shared by the worker processes of the API.
+
+    Submitting a job writes its row and returns its id right away; in every
+    process a bounded set of worker tasks runs the jobs by priority (higher
+    first, then oldest first). A job is claimed with one conditional UPDATE,
+    so a single process runs it: it records itself as the job's `owner` and
+    keeps bumping `heartbeat_at` while the job runs. A running job whose
+    heartbeat is older than `heartbeat_timeout` (its process died) is queued
+    again; a process stopping cleanly hands its running jobs back itself.
+
+    Every `poll_interval` seconds each process also picks up the jobs queued
+    by the others, cancels its jobs cancelled through another process, and
+    relays the progress of the jobs run elsewhere to its subscribers (the /ws
+    WebSocket). The jobs it runs itself are pushed to them on every update.
+
+    Handlers are `async def handler(context, **params)` returning a JSON
+    serializable result; blocking work belongs on an executor.
+
+    Args:
+        session_factory (Callable): returns a SQLAlchemy session
+        workers (int): jobs running at the same time in this process
+        jobs_dir (str): where uploaded payloads are kept until their job is done, shared by the processes
+        poll_interval (float): seconds between two polls of the table
+        heartbeat_timeout (float): seconds without a heartbeat after which a running job is queued again
+    """
+
+    def __init__(self, session_factory=SessionLocal, workers=JOB_WORKERS, jobs_dir=JOBS_DIR,
+                 poll_interval=JOB_POLL_INTERVAL, heartbeat_timeout=JOB_HEARTBEAT_TIMEOUT):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.jobs_dir = jobs_dir
+        self.poll_interval = poll_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        # Unique per process and per start, a restarted worker does not take over the jobs of its previous life
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers = {}
+        self._queue = None
+        # Ids waiting in _queue, so that polling does not queue them twice
+        self._queued = set()
+        self._tasks = []
+        self._poller_task = None
+        self._stopping = False
+        self._running = {}
+        self._subscribers = {}
+        # Last state of the jobs of other processes sent to the subscribers
+        self._relayed = {}
+        self._order = itertools.count()
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    # Database access, always on an executor thread
+
+    def _query(self, func, *args):
+        db = self.session_factory()
+        try:
+            return func(db, *args)
+        finally:
+            db.close()
+
+    async def _run_db(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, self._query, func, *args)
+
+    async def _save(self, job_id, **fields):
+        def save(db):
+            db.query(Job).filter(Job.id == job_id).update(fields)
+            db.commit()
+        await self._run_db(save)
+
+    async def get(self, job_id):
+        def get(db):
+            job = db.get(Job, job_id)
+            return job_to_dict(job) if job is not None else None
+        return await self._run_db(get)
+
+    async def list(self, user_id, limit=50):
+        def list_jobs(db):
+            jobs = db.query(Job).filter(Job.user_id == user_id).order_by(Job.created_at.desc()).limit(limit)
+            return [job_to_dict(job) for job in jobs]
+        return await self._run_db(list_jobs)
+
+    # Submission and lifecycle
+
+    def _store_files(self, job_id, files):
+        directory = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(directory, exist_ok=True)
+        stored = []
+        for index, file in enumerate(files):
+            filename = os.path.basename(file.filename or f"file{index}")
+            path = os.path.join(directory, f"{index}-{filename}")
+            file.file.seek(0)
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(file.file, f, 1024 * 1024)
+            stored.append({"filename": filename, "path": path, "content_type": file.content_type})
+        return stored
+
+    async def submit(self, kind, params=None, user_id=None, priority=0, files=()):
+        """Queue a job and return its id. `files` are uploads copied to the jobs directory."""
+        if kind not in self._handlers:
+            raise KeyError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        params = dict(params or {})
+        if files:
+            params['files'] = await asyncio.get_running_loop().run_in_executor(None, self._store_files, job_id, files)
+
+        def insert(db):
+            db.add(Job(id=job_id, kind=kind, user_id=user_id, priority=priority, status='queued',
+                       params=json.dumps(params), created_at=datetime.utcnow()))
+            db.commit()
+        await self._run_db(insert)
+        self._enqueue(job_id, priority)
+        self._publish(job_id, status='queued', progress=0.0)
+        return job_id
+
+    def _enqueue(self, job_id, priority):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait((-priority, next(self._order), job_id))
+
+    async def start(self):
+        """Queue the unfinished jobs (those of dead processes included) and start the workers and the poller."""
+        self._stopping = False
+        # A new queue for the running loop, everything still queued is read back from the table
+        self._queue = asyncio.PriorityQueue()
+        self._queued = set()
+        await self.poll()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._poller_task = asyncio.create_task(self._poller())
+
+    async def stop(self):
+        """Stop the workers, the jobs they were running are handed back to the queue."""
+        self._stopping = True
+        tasks = self._tasks + ([self._poller_task] if self._poller_task is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks, self._poller_task = [], None
+        await self._run_db(_requeue, Job.owner == self.owner)
+
+    async def poll(self):
+        """One pass over the table: heartbeat, recovery, queued jobs, cancellations and remote progress."""
+        watched = [job_id for job_id in self._subscribers if job_id not in self._running]
+
+        def poll(db):
+            now = datetime.utcnow()
+            # Also covers the jobs claimed but not started yet
+            db.query(Job).filter(Job.owner == self.owner, Job.status == 'running').update(
+                {"heartbeat_at": now}, synchronize_session=False)
+            recovered = _requeue(db, or_(Job.heartbeat_at.is_(None),
+                                         Job.heartbeat_at < now - timedelta(seconds=self.heartbeat_timeout)))
+            queued = (db.query(Job.id, Job.priority).filter(Job.status == 'queued')
+                      .order_by(Job.priority.desc(), Job.created_at).all())
+            cancelled = [row.id for row in db.query(Job.id).filter(
+                Job.owner == self.owner, Job.status == 'running', Job.cancel_requested)]
+            remote = [job_to_dict(job) for job in db.query(Job).filter(
+                Job.id.in_(watched), Job.owner.is_not(None), Job.owner != self.owner)] if watched else []
+            return recovered, queued, cancelled, remote
+
+        recovered, queued, cancelled, remote = await self._run_db(poll)
+        if recovered:
+            logging.warning("Queued again %d jobs of workers that stopped sending heartbeats", recovered)
+        for job_id, priority in queued:
+            self._enqueue(job_id, priority)
+        for job_id in cancelled:
+            # Until it is in _running (claimed, not started), the request stays and is seen at the next poll
+            task = self._running.get(job_id)
+            if task is not None:
+                task.cancel()
+        for job in remote:
+            event = {key: job[key] for key in ("status", "progress", "detail", "result", "error")}
+            if self._relayed.get(job["id"]) != event:
+                self._relayed[job["id"]] = event
+                self._publish(job["id"], **event)
+
+    async def _poller(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except Exception:
+                logging.exception("Could not poll the jobs table")
+
+    async def cancel(self, job_id):
+        """Cancel a queued or running job, in whichever process runs it. Returns False if it was already finished."""
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+            return True
+
+        def cancel(db):
+            cancelled = db.query(Job).filter(Job.id == job_id, Job.status == 'queued').update(
+                {"status": 'cancelled', "finished_at": datetime.utcnow()}, synchronize_session=False)
+            # Running elsewhere (or claimed here and not started yet): its owner cancels it at its next poll
+            requested = cancelled or db.query(Job).filter(Job.id == job_id, Job.status == 'running').update(
+                {"cancel_requested": True}, synchronize_session=False)
+            db.commit()
+            return cancelled, requested
+
+        cancelled, requested = await self._run_db(cancel)
+        if cancelled:
+            self._publish(job_id, status='cancelled')
+        return bool(requested)
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Job %s crashed", job_id)
+
+    async def _run_job(self, job_id):
+        def claim(db):
+            # One conditional UPDATE: of the processes trying to claim the job, only one updates its row
+            now = datetime.utcnow()
+            claimed = db.query(Job).filter(Job.id == job_id, Job.status == 'queued').update(
+                {"status": 'running', "owner": self.owner, "heartbeat_at": now, "started_at": now,
+                 "progress": 0.0}, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                # Cancelled, or claimed by another process meanwhile: skip it
+                return None
+            job = db.get(Job, job_id)
+            return job.kind, json.loads(job.params or '{}')
+
+        claimed = await self._run_db(claim)
+        if claimed is None:
+            return
+        kind, params = claimed
+        self._publish(job_id, status='running', progress=0.0)
+
+        context = JobContext(self, job_id, params)
+        task = asyncio.ensure_future(self._handlers[kind](context, **{k: v for k, v in params.items() if k != 'files'}))
+        self._running[job_id] = task
+        result = None
+        try:
+            result = await task
+            fields = {"status": 'succeeded', "progress": 1.0, "result": json.dumps(result)}
+        except asyncio.CancelledError:
+            if self._stopping or not task.cancelled():
+                # The worker itself is being stopped, stop() queues the job again
+                raise
+            fields = {"status": 'cancelled'}
+        except Exception as e:
+            logging.exception("Job %s (%s) failed", job_id, kind)
+            fields = {"status": 'failed', "error": str(e)}
+        finally:
+            self._running.pop(job_id, None)
+
+        await self._save(job_id, finished_at=datetime.utcnow(), **fields)
+        self._publish(job_id, **{**fields, "result": result})
+        # The payloads are not needed anymore
+        await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(shutil.rmtree, os.path.join(self.jobs_dir, job_id), ignore_errors=True))
+
+    # Subscriptions
+
+    def subscribe(self, job_id):
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_id, queue):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[job_id]
+                self._relayed.pop(job_id, None)
+
+    def _publish(self, job_id, **event):
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait({"id": job_id, **event})
+
+    def stats(self):
+        return {
+            "owner": self.owner,
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": len(self._running),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+        }
+
+
+job_queue = JobQueue()
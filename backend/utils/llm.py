@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+
+import httpx
+from dotenv import load_dotenv
+
+from .metrics import observe_stage, stage
+
+
+load_dotenv()
+
+HUGGINGFACE_TOKEN = os.environ.get("HUGGINGFACE_TOKEN")
+# Any OpenAI-compatible chat completions server, e.g. benchmarks/stub_llm_server.py offline
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://router.huggingface.co/v1")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 64))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 8))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", 5))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", 30))
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    pass
+
+
+class CircuitOpenError(LLMError):
+    pass
+
+
+class _RetryableError(LLMError):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fail fast while the LLM server keeps failing.
+
+    After `threshold` consecutive failures the circuit opens and calls fail
+    immediately for `reset_after` seconds. Then one trial call is let through,
+    the others keep failing fast: its success closes the circuit, its failure
+    opens it again. A trial that never reports back (cancelled, 4xx) gives
+    way to another one after `reset_after` seconds.
+    """
+
+    def __init__(self, threshold=LLM_BREAKER_THRESHOLD, reset_after=LLM_BREAKER_RESET, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def check(self):
+        state = self.state
+        if state == "half-open":
+            if self.probe_started_at is None or self.clock() - self.probe_started_at >= self.reset_after:
+                # This call is the trial
+                self.probe_started_at = self.clock()
+                return
+            raise CircuitOpenError("LLM server unavailable, circuit breaker is trying it again")
+        if state == "open":
+            raise CircuitOpenError("LLM server unavailable, circuit breaker is open")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold or self.state == "half-open":
+            self.opened_at = self.clock()
+        self.probe_started_at = None
+
+
+class AsyncLLMClient:
+    """Async client for OpenAI-compatible chat completion servers.
+
+    - one pooled HTTP/1.1 keep-alive connection pool per client
+    - at most `max_concurrency` requests in flight, the others wait their turn
+    - connect/read timeouts, jittered exponential backoff on retryable errors
+    - a circuit breaker failing fast while the server is down
+    - identical requests in flight at the same time share one upstream call
+
+    Args:
+        base_url (str): server URL, `/chat/completions` is appended
+        token (str): bearer token
+        transport: optional httpx transport, e.g. `httpx.MockTransport` in tests
+    """
+
+    def __init__(self, base_url=LLM_BASE_URL, token=HUGGINGFACE_TOKEN,
+                 max_concurrency=LLM_MAX_CONCURRENCY, max_connections=LLM_MAX_CONNECTIONS,
+                 timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES,
+                 backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX,
+                 breaker=None, transport=None):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.transport = transport
+
+        self._client = None
+        self._loop = None
+        self._semaphore = None
+        self._inflight = {}
+
+        self.requests = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _session(self):
+        # The connection pool and the semaphore belong to the running loop
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                timeout=httpx.Timeout(self.timeout, connect=LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                transport=self.transport,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Full jitter: spreads the retries of concurrent requests
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _check_response(response):
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            retry_after = response.headers.get("retry-after")
+            raise _RetryableError(
+                f"LLM server returned {response.status_code}",
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        if response.status_code >= 400:
+            raise LLMError(f"LLM server returned {response.status_code}: {response.text[:200]}")
+
+    async def _with_retries(self, call):
+        """Run `call()` under the concurrency limit, with retries and the circuit breaker."""
+        for attempt in range(self.max_retries + 1):
+            self.breaker.check()
+            try:
+                async with self._semaphore:
+                    result = await call()
+                self.breaker.record_success()
+                return result
+            except (httpx.TransportError, _RetryableError) as e:
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    self.failures += 1
+                    raise LLMError(f"LLM request failed after {attempt + 1} attempts: {e}") from e
+                self.retries += 1
+                delay = self._backoff(attempt, getattr(e, 'retry_after', None))
+                logging.warning("LLM request failed (%s), retrying in %.2fs", e, delay)
+                await asyncio.sleep(delay)
+
+    async def _complete(self, payload):
+        client = self._session()
+
+        async def call():
+            response = await client.post('/chat/completions', json=payload)
+            self._check_response(response)
+            return response.json()
+
+        self.requests += 1
+        return await self._with_retries(call)
+
+    async def chat(self, messages, model, **params):
+        """Return the completion text. Identical concurrent calls share one upstream request."""
+        self._session()
+        payload = {"model": model, "messages": messages, **params}
+        key = json.dumps(payload, sort_keys=True)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._complete(payload))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded: one caller going away must not cancel the call of the others
+        with stage('llm', model):
+            result = await asyncio.shield(task)
+        return result["choices"][0]["message"]["content"]
+
+    async def stream(self, messages, model, **params):
+        """Yield the completion tokens as they arrive (server-sent events).
+
+        Retries only happen before the first token, a stream cut in the middle raises LLMError.
+        """
+        client = self._session()
+        payload = {"model": model, "messages": messages, "stream": True, **params}
+        requested = time.perf_counter()
+        self.requests += 1
+        self.breaker.check()
+
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with self._semaphore:
+                    async with client.stream('POST', '/chat/completions', json=payload) as response:
+                        if response.status_code >= 400:
+                            await response.aread()
+                            self._check_response(response)
+                        async for line in response.aiter_lines():
+                            if not line.startswith('data:'):
+                                continue
+                            data = line[len('data:'):].strip()
+                            if data == '[DONE]':
+                                break
+                            chunk = json.loads(data)
+                            choices = chunk.get("choices") or [{}]
+                            content = (choices[0].get("delta") or {}).get("content")
+                            if content:
+                                if not started:
+                                    observe_stage('llm_first_token', time.perf_counter() - requested, model)
+                                started = True
+                                yield content
+                self.breaker.record_success()
+                # Up to the last token, the time the caller took to consume the stream included
+                observe_stage('llm', time.perf_counter() - requested, model)
+                return
+            except (httpx.TransportError, _RetryableError) as e:
+                self.breaker.record_failure()
+                if started or attempt == self.max_retries:
+                    self.failures += 1
+                    raise LLMError(f"LLM stream failed: {e}") from e
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt, getattr(e, 'retry_after', None)))
+                self.breaker.check()
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "in_flight": len(self._inflight),
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "failures": self.failures,
+            "circuit": self.breaker.state,
+        }
+
+
+llm_client = AsyncLLMClient()
@@ -0,0 +1,239 @@
+"""Columnar store of the assistant logs: Parquet files partitioned by day.
+
+    python -m utils.logstore convert path/to/logs.csv
+
+The monitoring reads the store instead of parsing the CSV: files are
+memory-mapped, only the requested columns are read, and a time window skips
+the day partitions and the row groups (sorted on start_time, with min/max
+statistics) outside of it. The low-cardinality columns are dictionary
+encoded, and come back as pandas categoricals.
+"""
+import os
+import json
+import uuid
+import shutil
+import argparse
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: the store is only locked within the process
+    fcntl = None
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+LOGSTORE_DIR = os.getenv("LOGSTORE_DIR", os.path.join(BASE_DIR, '..', 'logstore'))
+LOGSTORE_ROW_GROUP_SIZE = int(os.getenv("LOGSTORE_ROW_GROUP_SIZE", 64 * 1024))
+# Small files appended to a day are merged into one past this many
+LOGSTORE_COMPACT_FILES = int(os.getenv("LOGSTORE_COMPACT_FILES", 16))
+
+DATE_COLUMNS = ['start_time', 'end_time']
+TEXT_COLUMNS = ['question', 'response']
+CATEGORICAL_COLUMNS = ['organization', 'model_ID', 'region', 'environment', 'feedback']
+
+TIMESTAMP = pa.timestamp('us')
+SCHEMA = pa.schema(
+    [(column, TIMESTAMP) for column in DATE_COLUMNS]
+    + [(column, pa.string()) for column in TEXT_COLUMNS]
+    + [(column, pa.dictionary(pa.int32(), pa.string())) for column in CATEGORICAL_COLUMNS]
+)
+PARTITIONING = ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive')
+STATE_FILE = '_state.json'
+# Held (flock) by the process writing to the store; kept by clear(), every writer must lock the same file
+LOCK_FILE = '_lock'
+
+
+def to_table(frame):
+    """Arrow table of a frame of logs, with the columns and types of the store."""
+    arrays = []
+    for field in SCHEMA:
+        if field.name not in frame:
+            arrays.append(pa.nulls(len(frame), field.type))
+        elif field.name in DATE_COLUMNS:
+            values = pd.to_datetime(frame[field.name], errors='coerce')
+            arrays.append(pa.array(values, type=pa.timestamp('ns')).cast(TIMESTAMP, safe=False))
+        else:
+            values = frame[field.name].astype('string')
+            arrays.append(pa.array(values, type=pa.string()).cast(field.type))
+    return pa.Table.from_arrays(arrays, schema=SCHEMA)
+
+
+class LogStore:
+    """Append-only Parquet dataset of assistant logs, one `day=YYYY-MM-DD` directory per day.
+
+    Files are written under a temporary name then renamed, so readers never
+    see a partial file. Writers, the log monitors of every worker process,
+    take turns through `locked()`, readers can be anywhere.
+
+    Args:
+        root (str): directory of the dataset
+        row_group_size (int): rows per Parquet row group
+        compact_files (int): files of a day that trigger merging them
+    """
+
+    def __init__(self, root=LOGSTORE_DIR, row_group_size=LOGSTORE_ROW_GROUP_SIZE,
+                 compact_files=LOGSTORE_COMPACT_FILES):
+        self.root = root
+        self.row_group_size = row_group_size
+        self.compact_files = compact_files
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._lock_file = None
+        self._fs = fs.LocalFileSystem(use_mmap=True)
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold the store against the other writers, threads of this process and other processes alike.
+
+        Reentrant: `append`, `save_state` and `clear` take it too, a writer
+        holds it around "read the state, append, save the state".
+        """
+        with self._lock:
+            if self._depth == 0:
+                os.makedirs(self.root, exist_ok=True)
+                self._lock_file = open(os.path.join(self.root, LOCK_FILE), 'a')
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    # Closing the file releases the flock
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def _day_dir(self, day):
+        return os.path.join(self.root, f"day={day}")
+
+    def _files(self, day):
+        directory = self._day_dir(day)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.parquet'))
+
+    def _write(self, table, day):
+        directory = self._day_dir(day)
+        os.makedirs(directory, exist_ok=True)
+        name = f"{uuid.uuid4().hex}.parquet"
+        # Names starting with a dot are skipped by the readers until renamed
+        temporary = os.path.join(directory, f".{name}.tmp")
+        pq.write_table(table, temporary, row_group_size=self.row_group_size)
+        os.replace(temporary, os.path.join(directory, name))
+
+    def append(self, frame):
+        """Add logs to the store, returns the number of rows written."""
+        frame = frame[frame['start_time'].notna()]
+        if frame.empty:
+            return 0
+        frame = frame.sort_values('start_time', kind='stable')
+        days = frame['start_time'].dt.strftime('%Y-%m-%d')
+        with self.locked():
+            for day, rows in frame.groupby(days, sort=False):
+                self._write(to_table(rows), day)
+                if len(self._files(day)) > self.compact_files:
+                    self._compact(day)
+        return len(frame)
+
+    def _compact(self, day):
+        files = self._files(day)
+        table = pq.read_table(files, schema=SCHEMA, memory_map=True)
+        self._write(table.sort_by('start_time'), day)
+        for path in files:
+            os.remove(path)
+
+    def _dataset(self):
+        if not os.path.isdir(self.root):
+            return None
+        return ds.dataset(self.root, format='parquet', partitioning=PARTITIONING, filesystem=self._fs,
+                          schema=SCHEMA.append(pa.field('day', pa.string())))
+
+    def read(self, start=None, end=None, columns=None):
+        """Logs with `start <= start_time < end`, as a DataFrame of `columns` (all the log columns by default)."""
+        columns = list(columns or SCHEMA.names)
+        dataset = self._dataset()
+        if dataset is None:
+            return to_table(pd.DataFrame({'start_time': []})).select(columns).to_pandas()
+
+        condition = None
+        if start is not None:
+            start = pd.Timestamp(start)
+            # The day filter prunes whole directories, the time filter row groups
+            condition = (ds.field('day') >= start.strftime('%Y-%m-%d')) & (
+                ds.field('start_time') >= pa.scalar(start.to_pydatetime(), TIMESTAMP))
+        if end is not None:
+            end = pd.Timestamp(end)
+            before_end = (ds.field('day') <= end.strftime('%Y-%m-%d')) & (
+                ds.field('start_time') < pa.scalar(end.to_pydatetime(), TIMESTAMP))
+            condition = before_end if condition is None else condition & before_end
+        table = dataset.to_table(columns=columns, filter=condition)
+        if 'start_time' in columns:
+            table = table.sort_by('start_time')
+        return table.to_pandas()
+
+    def days(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[len('day='):] for name in os.listdir(self.root) if name.startswith('day='))
+
+    # The log monitor keeps where it stopped reading the CSV here
+
+    def state(self):
+        try:
+            with open(os.path.join(self.root, STATE_FILE)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save_state(self, state):
+        with self.locked():
+            temporary = os.path.join(self.root, f".{STATE_FILE}.tmp")
+            with open(temporary, 'w') as f:
+                json.dump(state, f)
+            os.replace(temporary, os.path.join(self.root, STATE_FILE))
+
+    def clear(self):
+        """Remove the logs and the state, not the lock file the other writers may be waiting on."""
+        with self.locked():
+            for day in self.days():
+                shutil.rmtree(self._day_dir(day), ignore_errors=True)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.root, STATE_FILE))
+
+    def stats(self):
+        files = [path for day in self.days() for path in self._files(day)]
+        return {
+            "root": self.root,
+            "days": len(self.days()),
+            "files": len(files),
+            "bytes": sum(os.path.getsize(path) for path in files),
+        }
+
+
+log_store = LogStore()
+
+
+if __name__ == '__main__':
+    # Through the log monitor, so that the server goes on from where the conversion stopped
+    from .monitoring import LogMonitor
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert', help='add the new rows of a CSV of logs to the store')
+    convert.add_argument('csv')
+    convert.add_argument('--root', default=LOGSTORE_DIR)
+    args = parser.parse_args()
+    store = LogStore(args.root)
+    rows = LogMonitor(args.csv, store=store).ingest()
+    print(f"{rows} rows written to {store.root}: {store.stats()}")
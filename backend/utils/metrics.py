@@ -0,0 +1,227 @@
+"""Prometheus metrics of the API, served in the text exposition format on /metrics.
+
+- `http_requests_total` and `http_request_duration_seconds`, per method,
+  route template (`/predict/`, not the raw path) and status, recorded by
+  `MetricsMiddleware` around every HTTP request
+- `stage_duration_seconds`, per stage, route and model version, recorded by
+  the `stage` timers of the handlers: decode, transform, forward, llm,
+  llm_first_token, db (every SQL statement, see `instrument_engine`) and
+  report_render
+
+An observation is a bisect and two additions under a lock, about 2us per
+stage timer and 5us per request (benchmarks/bench_metrics.py): no sampling,
+no background thread. Stages timed on executor
+threads get the route of their request through the context variables
+(`utils.inference.run_in_executor` runs the work in a copy of them).
+"""
+import os
+import time
+import bisect
+import threading
+import contextvars
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Seconds, from a cache hit to a long report render or LLM answer
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Route of requests outside any (e.g. background writers, the job workers)
+NO_ROUTE = ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter per combination of label values (passed positionally, in `labelnames` order)."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram per combination of label values, with fixed `buckets` (upper bounds, in seconds)."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (the last one is +Inf, not cumulative), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                bucket = _labels(self.labelnames, labels, [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._metrics.setdefault(name, Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUESTS = metrics.counter(
+    'http_requests_total', 'HTTP requests by method, route and status.', ('method', 'route', 'status'))
+HTTP_DURATION = metrics.histogram(
+    'http_request_duration_seconds', 'Time from the request to the last byte of the response.', ('method', 'route'))
+STAGE_DURATION = metrics.histogram(
+    'stage_duration_seconds', 'Time spent in one stage of a request.', ('stage', 'route', 'model_version'))
+
+# The ASGI scope of the request being served, its route is only known once the router matched it
+_scope = contextvars.ContextVar('metrics_scope', default=None)
+
+
+def current_route():
+    scope = _scope.get()
+    if scope is None:
+        return NO_ROUTE
+    route = scope.get('route')
+    return getattr(route, 'path', None) or NO_ROUTE
+
+
+def observe_stage(name, seconds, model_version=''):
+    if METRICS_ENABLED:
+        STAGE_DURATION.observe(seconds, name, current_route(), model_version)
+
+
+class stage:
+    """Time a block as one stage of the current request.
+
+        with stage('forward', model_version()):
+            outputs = await batcher.predict(image)
+    """
+
+    __slots__ = ('name', 'model_version', 'started')
+
+    def __init__(self, name, model_version=''):
+        self.name = name
+        self.model_version = model_version
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe_stage(self.name, time.perf_counter() - self.started, self.model_version)
+        return False
+
+
+def instrument_engine(engine):
+    """Time every SQL statement of a SQLAlchemy engine (sync, or the sync engine of an async one) as the `db` stage."""
+    # A connection runs one statement at a time, a failed one is simply not observed
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info['metrics_started'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('metrics_started', None)
+        if started is not None:
+            observe_stage('db', time.perf_counter() - started)
+
+    return engine
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware counting and timing HTTP requests per route template.
+
+    Unlike BaseHTTPMiddleware it adds no task nor stream per request, and
+    streaming responses are timed up to their last byte.
+    """
+
+    def __init__(self, app, enabled=METRICS_ENABLED):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        token = _scope.set(scope)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _scope.reset(token)
+            route = scope.get('route')
+            # Unmatched paths share one label, a scan of random URLs cannot grow the series
+            route = getattr(route, 'path', None) or 'unmatched'
+            method = scope['method']
+            HTTP_DURATION.observe(time.perf_counter() - started, method, route)
+            HTTP_REQUESTS.inc(method, route, str(status[0]))
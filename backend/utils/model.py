@@ -1,12 +1,162 @@
+import os
+import threading
+from functools import lru_cache
+
 from torchvision import  models
 import torch.nn as nn
 import torch.nn.functional as F
 import torch
+from dotenv import load_dotenv
+
+# Personal imports
+from .registry import registry
+from .tools import get_classes
+
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+
+RESNET_CAT_AND_DOG_MODEL_WEIGHT = os.environ.get("RESNET_CAT_AND_DOG_MODEL_WEIGHT")
+TRAIN_DATA_DIR = os.environ.get("TRAIN_DATA_DIR")
+
+# Serving backend: eager, torchscript, onnx, int8-dynamic or int8-static (see utils/export.py)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+CHANNELS_LAST = os.getenv("CHANNELS_LAST", "true").lower() == "true"
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(BASE_DIR, '..', 'exported_models'))
+
+CAT_DOG_MODEL = 'resnet18_cat_dog'
+MODEL_VERSION = os.getenv("MODEL_VERSION")
+
+BACKENDS = ['eager', 'torchscript', 'onnx', 'int8-dynamic', 'int8-static']
+EXPORTED_FILES = {
+    'torchscript': 'resnet18_cat_dog.torchscript.pt',
+    'onnx': 'resnet18_cat_dog.onnx',
+    'int8-dynamic': 'resnet18_cat_dog.int8-dynamic.torchscript.pt',
+    'int8-static': 'resnet18_cat_dog.int8-static.torchscript.pt',
+}
+
+# Exported and quantized models are CPU-only
+device = torch.device('cuda' if torch.cuda.is_available() and INFERENCE_BACKEND == 'eager' else 'cpu')
+
+
+class ChannelsLast(nn.Module):
+    """Run a model whose weights are channels-last on channels-last inputs (faster CPU convolutions)."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model.to(memory_format=torch.channels_last)
+
+    def forward(self, x):
+        return self.model(x.contiguous(memory_format=torch.channels_last))
+
+
+class OnnxModel:
+    """Run an exported ONNX model with onnxruntime, called like an nn.Module."""
+
+    def __init__(self, path):
+        # Optional dependency, only needed for the onnx backend
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, images):
+        outputs = self.session.run(None, {self.input_name: images.cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+
+# Penultimate layer output of the last forward pass, per executor thread
+_penultimate = threading.local()
 
 
-model0 = models.resnet18(pretrained=True)
-num_ftrs = model0.fc.in_features
-model0.fc = nn.Linear(num_ftrs, 2) 
+def _keep_embeddings(module, inputs, output):
+    # Only a reference is kept here, the copy happens when the prediction log is written
+    _penultimate.embeddings = output.flatten(1)
+
+
+def capture_embeddings(model):
+    """Keep the output of the avgpool layer (the 512-d image embedding) of every forward pass, see `pop_embeddings`.
+
+    Exported backends have no layer to hook, their forward passes keep nothing.
+    """
+    resnet = model.model if isinstance(model, ChannelsLast) else model
+    avgpool = getattr(resnet, 'avgpool', None)
+    if isinstance(avgpool, nn.Module):
+        avgpool.register_forward_hook(_keep_embeddings)
+    return model
+
+
+def pop_embeddings():
+    """(N, 512) embeddings of the last forward pass run by this thread, None if it kept none."""
+    embeddings = getattr(_penultimate, 'embeddings', None)
+    _penultimate.embeddings = None
+    return embeddings
+
+
+def build_cat_dog_resnet():
+    """Build the fine-tuned cat/dog ResNet-18 (FP32, eval mode, on CPU) and load its weights."""
+    # The fine-tuned state_dict overwrites every parameter, so there is no need
+    # to download the ImageNet weights first.
+    model = models.resnet18(weights=None)
+    model.fc = nn.Linear(model.fc.in_features, 2)  # 2 classes (binary classification)
+    model.load_state_dict(torch.load(RESNET_CAT_AND_DOG_MODEL_WEIGHT, map_location=torch.device('cpu'), weights_only=True))
+    model.eval()
+    return model
+
+
+def exported_model_path(backend):
+    return os.path.join(EXPORT_DIR, EXPORTED_FILES[backend])
+
+
+def load_cat_dog_model(backend=None):
+    """Load the cat/dog classifier for the configured serving backend."""
+    backend = backend or INFERENCE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {BACKENDS}")
+
+    if backend == 'eager':
+        model = build_cat_dog_resnet()
+        if CHANNELS_LAST:
+            model = ChannelsLast(model)
+        return capture_embeddings(model.eval().to(device))
+
+    path = exported_model_path(backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found, export it with `python -m utils.export --backends {backend}`")
+    if backend == 'onnx':
+        return OnnxModel(path)
+    model = torch.jit.load(path, map_location='cpu')
+    model.eval()
+    return model
+
+
+def warmup_image_model(model):
+    with torch.inference_mode():
+        model(torch.zeros(1, 3, 224, 224, device=device))
+
+
+@lru_cache(maxsize=None)
+def model_version():
+    """Identify the served weights and backend, e.g. in prediction cache keys."""
+    if MODEL_VERSION:
+        return MODEL_VERSION
+    try:
+        stat = os.stat(RESNET_CAT_AND_DOG_MODEL_WEIGHT)
+        weights = f"{stat.st_size}-{int(stat.st_mtime)}"
+    except (OSError, TypeError):
+        weights = "unknown"
+    return f"{CAT_DOG_MODEL}:{INFERENCE_BACKEND}:{weights}"
+
+
+@lru_cache(maxsize=None)
+def cat_dog_classes():
+    return get_classes(path=TRAIN_DATA_DIR)
+
+
+registry.register(CAT_DOG_MODEL, load_cat_dog_model, warmup=warmup_image_model)
 
 
 
@@ -100,6 +250,3 @@ class ResNet(nn.Module):
 def resnet18(num_classes=2):
     return ResNet(BasicBlock, [2, 2, 2, 2], num_classes)
 
-# Create the model
-model = resnet18(num_classes=2)
-
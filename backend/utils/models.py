@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, Integer, String, Text, Float, DateTime, ForeignKey, Index, inspect, text
 from  .database import  Base, engine
 from pydantic import BaseModel
 
@@ -28,12 +30,103 @@ class ChatHistory(Base):
     __tablename__ = 'chat_history'
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
+    conversation_id = Column(String, nullable=False, default='default')
+    role = Column(String, nullable=False, default='user')  # user | assistant
     content = Column(String)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    token_count = Column(Integer, nullable=False, default=0)
+
+    # Serves both "messages of a conversation, in order" and the per-user listing
+    __table_args__ = (
+        Index('ix_chat_history_user_conversation_created', 'user_id', 'conversation_id', 'created_at'),
+    )
 
     # chats = relationship('User', back_populates='user')
     
 
 
 
-Base.metadata.create_all(bind=engine)
+class Job(Base):
+    __tablename__ = 'jobs'
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'))
+    status = Column(String, nullable=False, default='queued')  # queued | running | succeeded | failed | cancelled
+    priority = Column(Integer, nullable=False, default=0)  # higher runs first
+    params = Column(Text)  # JSON
+    progress = Column(Float, nullable=False, default=0.0)
+    detail = Column(String)
+    result = Column(Text)  # JSON
+    error = Column(String)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    # Worker process running the job, alive as long as it keeps bumping heartbeat_at
+    owner = Column(String)
+    heartbeat_at = Column(DateTime)
+    # Set by the worker receiving DELETE /jobs/{id}, the owner cancels the job when it sees it
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        Index('ix_jobs_status_priority_created', 'status', 'priority', 'created_at'),
+        Index('ix_jobs_user_created', 'user_id', 'created_at'),
+    )
+
+
+class Aggregate(Base):
+    """A counter of utils.aggregates: users, documents, chats, predictions:<class>."""
+    __tablename__ = 'aggregates'
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+def _migrate_chat_history(bind=engine):
+    """create_all does not alter existing tables: add the columns and index missing in older databases."""
+    columns = {column['name'] for column in inspect(bind).get_columns('chat_history')}
+    # SQLite only adds columns with a constant default to tables holding rows:
+    # created_at is added nullable, then set on the existing rows
+    missing = {
+        'conversation_id': "VARCHAR NOT NULL DEFAULT 'default'",
+        'role': "VARCHAR NOT NULL DEFAULT 'user'",
+        'created_at': "DATETIME",
+        'token_count': "INTEGER NOT NULL DEFAULT 0",
+    }
+    with bind.begin() as connection:
+        for name, definition in missing.items():
+            if name not in columns:
+                connection.execute(text(f"ALTER TABLE chat_history ADD COLUMN {name} {definition}"))
+        if 'created_at' not in columns:
+            connection.execute(text("UPDATE chat_history SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_chat_history_user_conversation_created "
+            "ON chat_history (user_id, conversation_id, created_at)"
+        ))
+
+
+def _migrate_jobs(bind=engine):
+    """Add the ownership columns to a `jobs` table created before them."""
+    columns = {column['name'] for column in inspect(bind).get_columns('jobs')}
+    missing = {
+        'owner': "VARCHAR",
+        'heartbeat_at': "DATETIME",
+        'cancel_requested': "BOOLEAN NOT NULL DEFAULT 0",
+    }
+    with bind.begin() as connection:
+        for name, definition in missing.items():
+            if name not in columns:
+                connection.execute(text(f"ALTER TABLE jobs ADD COLUMN {name} {definition}"))
+
+
+def init_db(bind=engine):
+    """Create the missing tables and bring the older ones up to date, run once at startup.
+
+        python -m utils.models
+    """
+    Base.metadata.create_all(bind=bind)
+    _migrate_chat_history(bind)
+    _migrate_jobs(bind)
+
 
+if __name__ == '__main__':
+    init_db()
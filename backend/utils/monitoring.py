@@ -0,0 +1,330 @@
+import io
+import os
+import math
+import hashlib
+import threading
+from collections import Counter
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from .logstore import log_store, DATE_COLUMNS, TEXT_COLUMNS, CATEGORICAL_COLUMNS
+
+
+load_dotenv()
+
+DATA_RAW_PATH = os.getenv("DATA_RAW_PATH")
+# Hours of logs in a report when the caller does not ask for a window
+MONITORING_WINDOW_HOURS = int(os.getenv("MONITORING_WINDOW_HOURS", 24))
+# Bytes of new log rows parsed at a time, bounds the memory of the first ingest of a large file
+MONITORING_READ_BYTES = int(os.getenv("MONITORING_READ_BYTES", 64 * 1024 * 1024))
+
+# Columns read back from the log store to rebuild the aggregates after a restart
+AGGREGATED_COLUMNS = ['start_time', *TEXT_COLUMNS, *CATEGORICAL_COLUMNS]
+
+
+def split_records(data):
+    """Start offsets of the complete CSV records of `data`, and where the last one ends.
+
+    A newline inside a quoted field (LLM responses have plenty) does not end a
+    record: a record ends on a newline preceded by an even number of quotes.
+    Blank lines are skipped, as pandas does.
+    """
+    starts, end = [], 0
+    position, start, quotes = 0, 0, 0
+    while True:
+        newline = data.find(b'\n', position)
+        if newline < 0:
+            break
+        quotes += data.count(b'"', position, newline)
+        position = newline + 1
+        if quotes % 2 == 0:
+            if data[start:newline].strip():
+                starts.append(start)
+            start = end = position
+            quotes = 0
+    return starts, end
+
+
+class HourlyBucket:
+    """Aggregates of the log rows of one hour."""
+
+    __slots__ = ('rows', 'lengths', 'counts')
+
+    def __init__(self):
+        self.rows = 0
+        # count, total, sum of squares, min, max of the text lengths
+        self.lengths = {column: [0, 0, 0, math.inf, -math.inf] for column in TEXT_COLUMNS}
+        self.counts = {column: Counter() for column in CATEGORICAL_COLUMNS}
+
+
+def length_stats(count, total, squares, minimum, maximum):
+    if not count:
+        return {"mean": None, "std": None, "min": None, "max": None}
+    mean = total / count
+    return {
+        "mean": round(mean, 2),
+        "std": round(math.sqrt(max(squares / count - mean * mean, 0.0)), 2),
+        "min": int(minimum),
+        "max": int(maximum),
+    }
+
+
+class LogMonitor:
+    """Incremental monitoring of the assistant logs (the DATA_RAW_PATH CSV).
+
+    Every call reads only the rows appended since the previous one, from the
+    byte offset where it stopped, adds them to hourly aggregates (text
+    lengths, counts per organization, model, region, environment and
+    feedback) and appends them to the columnar log store. Summaries over any
+    window are computed from the aggregates, reports needing the rows read
+    the window from the store; the CSV is never parsed twice.
+
+    The position in the CSV is saved with the store, and the monitors of all
+    the worker processes share it: each call first catches up with the rows
+    the others stored, and after a restart the aggregates are rebuilt from
+    the store. A truncated or replaced file is read again from the start,
+    into an empty store. A row is taken once its line is complete, a last line without
+    newline waits for the next call.
+
+    Args:
+        path (str): the CSV of the logs, written by appending rows
+        read_bytes (int): bytes parsed at a time
+        store (LogStore): where the rows are kept in columnar form
+    """
+
+    def __init__(self, path=DATA_RAW_PATH, read_bytes=MONITORING_READ_BYTES, store=log_store):
+        self.path = path
+        self.read_bytes = read_bytes
+        self.store = store
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode):
+        self._inode = inode
+        self.columns = None
+        self.offset = 0
+        self.rows = 0
+        self.skipped = 0
+        self.buckets = {}
+
+    def _sync(self, stat):
+        """Bring the aggregates up to the position saved in the store, called with the store locked.
+
+        The saved position is the only one that counts: another process may
+        have stored rows since this one's last call, or started the store
+        over for a new file. The store is cleared only when its state does
+        not belong to the file as it is now.
+        """
+        state = self.store.state()
+        if not (state and state.get('path') == os.path.realpath(self.path) and state.get('inode') == stat.st_ino
+                and state.get('offset', 0) <= stat.st_size):
+            # Replaced or truncated (or never read): the first process to see it starts the store over
+            self.store.clear()
+            self._reset(stat.st_ino)
+            self._save_state()
+        elif self._inode != stat.st_ino or self.offset > state['offset']:
+            # Started, or restarted by another process since: rebuilt from the store
+            self._reset(stat.st_ino)
+            self.columns, self.offset, self.skipped = state['columns'], state['offset'], state.get('skipped', 0)
+            self._aggregate(self.store.read(columns=AGGREGATED_COLUMNS))
+        elif self.offset < state['offset']:
+            # Rows stored by another process since the last call: aggregated from the CSV, not stored again
+            with open(self.path, 'rb') as f:
+                self._read(f, until=state['offset'], store=False)
+            self.skipped = state.get('skipped', 0)
+
+    def _save_state(self):
+        self.store.save_state({
+            "path": os.path.realpath(self.path),
+            "inode": self._inode,
+            "offset": self.offset,
+            "columns": self.columns,
+            "skipped": self.skipped,
+        })
+
+    def ingest(self):
+        """Aggregate the rows appended since the last call, returns how many."""
+        if not self.path:
+            return 0
+        # Every worker process runs a monitor on the same store: one of them ingests at a time
+        with self._lock, self.store.locked():
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return 0
+            self._sync(stat)
+            with open(self.path, 'rb') as f:
+                if self.columns is None:
+                    header = f.readline()
+                    if not header.endswith(b'\n'):
+                        return 0
+                    self.columns = list(pd.read_csv(io.BytesIO(header)).columns)
+                    self.offset = len(header)
+                    self._save_state()
+                return self._read(f)
+
+    def _read(self, f, until=None, store=True):
+        """Aggregate the complete rows from the offset on, up to `until` (the end of the file by default)."""
+        added = 0
+        block = self.read_bytes
+        while until is None or self.offset < until:
+            f.seek(self.offset)
+            data = f.read(block if until is None else min(block, until - self.offset))
+            if not data:
+                break
+            starts, end = split_records(data)
+            if end == 0:
+                if len(data) < block:
+                    # The last row is still being written
+                    break
+                # A single row larger than the block
+                block *= 2
+                continue
+            if starts:
+                added += self._add(data[:end], store)
+            self.offset += end
+            if store:
+                self._save_state()
+        return added
+
+    def _parse(self, data):
+        return pd.read_csv(io.BytesIO(data), header=None, names=self.columns, index_col=0,
+                           parse_dates=DATE_COLUMNS)
+
+    def _add(self, data, store=True):
+        frame = self._parse(data)
+        valid = frame['start_time'].notna()
+        self.skipped += int((~valid).sum())
+        frame = frame[valid]
+        if frame.empty:
+            return 0
+        self._aggregate(frame)
+        if store:
+            self.store.append(frame)
+        return len(frame)
+
+    def _aggregate(self, frame):
+        if frame.empty:
+            return
+        self.rows += len(frame)
+        hours = frame['start_time'].dt.floor('h').rename('hour')
+        for hour, rows in hours.value_counts().items():
+            bucket = self.buckets.get(hour)
+            if bucket is None:
+                bucket = self.buckets[hour] = HourlyBucket()
+            bucket.rows += int(rows)
+
+        for column in TEXT_COLUMNS:
+            if column not in frame:
+                continue
+            lengths = frame[column].fillna('').astype(str).str.len()
+            aggregates = pd.DataFrame({'length': lengths, 'square': lengths ** 2}).groupby(hours).agg(
+                count=('length', 'size'), total=('length', 'sum'), squares=('square', 'sum'),
+                minimum=('length', 'min'), maximum=('length', 'max'))
+            for hour, row in aggregates.iterrows():
+                stats = self.buckets[hour].lengths[column]
+                stats[0] += int(row['count'])
+                stats[1] += int(row['total'])
+                stats[2] += int(row['squares'])
+                stats[3] = min(stats[3], row['minimum'])
+                stats[4] = max(stats[4], row['maximum'])
+
+        for column in CATEGORICAL_COLUMNS:
+            if column not in frame:
+                continue
+            values = frame[column].astype(object).where(frame[column].notna(), 'unknown').astype(str)
+            for (hour, value), count in values.groupby([hours, values]).size().items():
+                self.buckets[hour].counts[column][value] += int(count)
+
+    def _window(self, window_size, end):
+        """Hours of the window and their buckets, the window ends with the latest log by default."""
+        if not self.buckets:
+            return None, None, []
+        end = pd.Timestamp(end).floor('h') if end is not None else max(self.buckets)
+        start = end - pd.Timedelta(hours=window_size - 1)
+        return start, end, [(hour, self.buckets[hour]) for hour in sorted(self.buckets) if start <= hour <= end]
+
+    def summary(self, window_size=MONITORING_WINDOW_HOURS, end=None):
+        """Aggregates of the last `window_size` hours of logs, up to `end`."""
+        self.ingest()
+        with self._lock:
+            start, end, selected = self._window(window_size, end)
+            rows = sum(bucket.rows for _, bucket in selected)
+            lengths = {}
+            for column in TEXT_COLUMNS:
+                merged = [0, 0, 0, math.inf, -math.inf]
+                for _, bucket in selected:
+                    count, total, squares, minimum, maximum = bucket.lengths[column]
+                    merged = [merged[0] + count, merged[1] + total, merged[2] + squares,
+                              min(merged[3], minimum), max(merged[4], maximum)]
+                lengths[column] = length_stats(*merged)
+            counts = {column: Counter() for column in CATEGORICAL_COLUMNS}
+            for _, bucket in selected:
+                for column, counter in bucket.counts.items():
+                    counts[column].update(counter)
+            hourly = [{
+                "hour": hour.isoformat(),
+                "rows": bucket.rows,
+                "response_length": length_stats(*bucket.lengths['response'])["mean"],
+            } for hour, bucket in selected]
+
+        return {
+            "window": {
+                "start": start.isoformat() if start is not None else None,
+                "end": (end + pd.Timedelta(hours=1)).isoformat() if end is not None else None,
+                "hours": window_size,
+            },
+            "rows": rows,
+            "text_length": lengths,
+            "counts": {column: dict(counter.most_common()) for column, counter in counts.items()},
+            "feedback_ratio": {value: round(count / rows, 4) for value, count in counts['feedback'].items()} if rows else {},
+            "hourly": hourly,
+        }
+
+    def window_version(self, window_size=MONITORING_WINDOW_HOURS, end=None):
+        """Bounds of the window (`end` excluded) and a version of its data, None without logs.
+
+        The version is a digest of the hourly row counts of the window: it
+        changes when rows are added to the window, not when they are added
+        elsewhere.
+        """
+        self.ingest()
+        with self._lock:
+            start, end, selected = self._window(window_size, end)
+            counts = [(hour.isoformat(), bucket.rows) for hour, bucket in selected]
+            inode = self._inode
+        if not selected:
+            return None
+        version = hashlib.sha256(repr((inode, counts)).encode()).hexdigest()[:16]
+        return {"start": start, "end": end + pd.Timedelta(hours=1), "version": version}
+
+    def read_window(self, start, end, columns=None):
+        """The log rows with `start <= start_time < end`, from the store, indexed by start_time."""
+        frame = self.store.read(start, end, columns=columns)
+        if 'start_time' in frame:
+            frame.index = frame['start_time']
+            frame.index.rename('index', inplace=True)
+        return frame
+
+    def window_frame(self, window_size=MONITORING_WINDOW_HOURS, end=None, columns=None):
+        """The log rows of the window, read from the store, for reports that need the rows themselves (Evidently)."""
+        self.ingest()
+        with self._lock:
+            start, end, selected = self._window(window_size, end)
+        if not selected:
+            return None
+        return self.read_window(start, end + pd.Timedelta(hours=1), columns)
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "offset": self.offset,
+            "rows": self.rows,
+            "skipped": self.skipped,
+            "hours": len(self.buckets),
+            "store": self.store.stats(),
+        }
+
+
+log_monitor = LogMonitor()
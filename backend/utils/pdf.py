@@ -1,12 +1,128 @@
+import os
+import shutil
+import asyncio
+import logging
+import resource
+import tempfile
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
 from PyPDF2 import PdfReader
 from fastapi import UploadFile, HTTPException
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# Below this many pages, pages are extracted in a thread of this process
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 32))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", max(1, (os.cpu_count() or 1) - 1)))
+# Address space of one extraction process; a pathological PDF fails its job instead of the server
+PDF_MAX_MEMORY_MB = int(os.getenv("PDF_MAX_MEMORY_MB", 1024))
+
+_pool = None
+
+
+def _limit_memory(max_memory_mb):
+    if max_memory_mb:
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def get_pool():
+    """Process pool of the large PDFs, created on first use.
+
+    Workers are spawned rather than forked so they do not inherit the models
+    (and the address space) of the API process, then capped to PDF_MAX_MEMORY_MB.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_limit_memory,
+            initargs=(PDF_MAX_MEMORY_MB,),
+        )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def count_pages(path):
+    return len(PdfReader(path).pages)
+
+
+def extract_pages(path, start, stop):
+    """Text of the pages [start, stop) of a PDF file, run in the worker processes."""
+    reader = PdfReader(path)
+    return [reader.pages[index].extract_text() or "" for index in range(start, min(stop, len(reader.pages)))]
+
+
+def iter_pages(path):
+    """Yield the text of every page, one page in memory at a time."""
+    reader = PdfReader(path)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def spool_upload(fileobj, suffix='.pdf'):
+    """Copy an upload to a temporary file on disk and return its path.
+
+    PDF readers need random access and the worker processes need a path, a
+    temporary file provides both without holding the document in memory.
+    """
+    fileobj.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as spooled:
+        shutil.copyfileobj(fileobj, spooled, 1024 * 1024)
+    return spooled.name
+
+
+async def stream_pages(path, parallel_min_pages=PDF_PARALLEL_MIN_PAGES, pages_per_task=PDF_PAGES_PER_TASK):
+    """Yield the text of the pages of a PDF file, in order, without blocking the event loop.
+
+    Small documents are read in one go on a thread. Larger ones are split in
+    page ranges extracted in the process pool, which are yielded in order as
+    soon as they are ready.
+    """
+    loop = asyncio.get_running_loop()
+    pages = await loop.run_in_executor(None, count_pages, path)
+
+    if pages < parallel_min_pages:
+        for text in await loop.run_in_executor(None, extract_pages, path, 0, pages):
+            yield text
+        return
+
+    pool = get_pool()
+    futures = [
+        loop.run_in_executor(pool, functools.partial(extract_pages, path, start, start + pages_per_task))
+        for start in range(0, pages, pages_per_task)
+    ]
+    try:
+        for future in futures:
+            for text in await future:
+                yield text
+    finally:
+        for future in futures:
+            future.cancel()
+
 
 async def extract_text_from_pdf(pdf_file: UploadFile):
+    path = None
     try:
-        pdf_reader = PdfReader(pdf_file.file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        return text
+        loop = asyncio.get_running_loop()
+        path = await loop.run_in_executor(None, spool_upload, pdf_file.file)
+        # Joined once at the end: repeated `text +=` copies the whole text for every page
+        return "\n".join([text async for text in stream_pages(path)])
     except Exception as e:
+        logging.exception("Could not extract the text of %s", pdf_file.filename)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if path is not None:
+            os.remove(path)
@@ -0,0 +1,228 @@
+import os
+import uuid
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import torch
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+PREDICTION_LOG_ENABLED = os.getenv("PREDICTION_LOG_ENABLED", "true").lower() == "true"
+PREDICTION_LOG_DIR = os.getenv("PREDICTION_LOG_DIR", os.path.join(BASE_DIR, '..', 'prediction_logs'))
+# A file is written every PREDICTION_LOG_FLUSH_INTERVAL seconds, or as soon as this many rows wait
+PREDICTION_LOG_BATCH_ROWS = int(os.getenv("PREDICTION_LOG_BATCH_ROWS", 4096))
+PREDICTION_LOG_FLUSH_INTERVAL = float(os.getenv("PREDICTION_LOG_FLUSH_INTERVAL", 10.0))
+# Rows waiting to be written past which new ones are dropped instead of growing memory
+PREDICTION_LOG_MAX_PENDING = int(os.getenv("PREDICTION_LOG_MAX_PENDING", 100_000))
+
+# Embeddings are stored as float16 bytes: 1 kB per prediction for the 512-d ResNet-18 embedding
+EMBEDDING_DTYPE = np.float16
+
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+SCHEMA = pa.schema([
+    ('timestamp', pa.timestamp('us')),
+    ('endpoint', CATEGORY),
+    ('model_version', CATEGORY),
+    ('predicted_class', CATEGORY),
+    ('confidence', pa.float32()),
+    ('latency_ms', pa.float32()),
+    ('width', pa.int32()),
+    ('height', pa.int32()),
+    ('bytes', pa.int64()),
+    ('cached', pa.bool_()),
+    ('embedding', pa.binary()),
+])
+PARTITIONING = ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive')
+
+
+def embeddings_to_bytes(embeddings):
+    """float16 bytes of every embedding (a tensor row or None), None where missing."""
+    present = [index for index, embedding in enumerate(embeddings) if embedding is not None]
+    values = [None] * len(embeddings)
+    if present:
+        matrix = torch.stack([embeddings[index] for index in present]).float().numpy().astype(EMBEDDING_DTYPE)
+        for row, index in enumerate(present):
+            values[index] = matrix[row].tobytes()
+    return values
+
+
+def embeddings_matrix(values):
+    """(N, D) float32 array of the stored embeddings, missing ones skipped."""
+    values = [value for value in values if value is not None]
+    if not values:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.frombuffer(b"".join(values), dtype=EMBEDDING_DTYPE).reshape(len(values), -1).astype(np.float32)
+
+
+class PredictionLogger:
+    """Append-only log of the image classifier predictions, written as Parquet in the background.
+
+    `record` appends one tuple to an in-memory buffer: no I/O and no
+    conversion on the request path, the embedding stays the tensor row the
+    forward pass produced. A background thread swaps the buffer out every
+    `flush_interval` seconds (or once it holds `batch_rows` rows), converts it
+    to columns and writes one file per day to `directory/day=YYYY-MM-DD/`.
+    When writing falls behind by `max_pending` rows, new rows are dropped and
+    counted rather than slowing requests down.
+
+    Args:
+        directory (str): root of the Parquet dataset
+        batch_rows (int): rows that trigger a write before the interval
+        flush_interval (float): seconds between two writes
+        max_pending (int): rows kept in memory at most
+        enabled (bool): False makes `record` a no-op
+    """
+
+    def __init__(self, directory=PREDICTION_LOG_DIR, batch_rows=PREDICTION_LOG_BATCH_ROWS,
+                 flush_interval=PREDICTION_LOG_FLUSH_INTERVAL, max_pending=PREDICTION_LOG_MAX_PENDING,
+                 enabled=PREDICTION_LOG_ENABLED):
+        self.directory = directory
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self.recorded = 0
+        self.written = 0
+        self.files = 0
+        self.dropped = 0
+        self.errors = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Call `listener(table)` on the writer thread with every batch of rows once written."""
+        self._listeners.append(listener)
+
+    def record(self, endpoint, model_version, predicted_class, confidence=None, latency_ms=None,
+               width=None, height=None, size=None, cached=False, embedding=None):
+        if not self.enabled:
+            return
+        row = (datetime.utcnow(), endpoint, model_version, predicted_class, confidence, latency_ms,
+               width, height, size, cached, embedding)
+        with self._lock:
+            if len(self._buffer) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._buffer.append(row)
+            self.recorded += 1
+            pending = len(self._buffer)
+        if pending >= self.batch_rows:
+            self._wake.set()
+        if self._thread is None:
+            self._start()
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._closed.clear()
+                self._thread = threading.Thread(target=self._run, name='prediction-log', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Write every buffered row now."""
+        with self._write_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if rows:
+                try:
+                    self._write(rows)
+                    self.written += len(rows)
+                except Exception:
+                    self.errors += 1
+                    logging.exception("Could not write %d prediction log rows", len(rows))
+
+    def _write(self, rows):
+        columns = list(zip(*rows))
+        embeddings = embeddings_to_bytes(columns[-1])
+        table = pa.Table.from_arrays([
+            pa.array(columns[0], pa.timestamp('us')),
+            *[pa.array(column, pa.string()).cast(CATEGORY) for column in columns[1:4]],
+            pa.array(columns[4], pa.float32()),
+            pa.array(columns[5], pa.float32()),
+            pa.array(columns[6], pa.int32()),
+            pa.array(columns[7], pa.int32()),
+            pa.array(columns[8], pa.int64()),
+            pa.array(columns[9], pa.bool_()),
+            pa.array(embeddings, pa.binary()),
+        ], schema=SCHEMA)
+        days = [timestamp.strftime('%Y-%m-%d') for timestamp in columns[0]]
+        for day in sorted(set(days)):
+            mask = pa.array([row_day == day for row_day in days])
+            directory = os.path.join(self.directory, f"day={day}")
+            os.makedirs(directory, exist_ok=True)
+            name = f"{uuid.uuid4().hex}.parquet"
+            # Readers skip names starting with a dot, the file appears once complete
+            temporary = os.path.join(directory, f".{name}.tmp")
+            pq.write_table(table.filter(mask), temporary)
+            os.replace(temporary, os.path.join(directory, name))
+            self.files += 1
+        for listener in self._listeners:
+            try:
+                listener(table)
+            except Exception:
+                logging.exception("Prediction log listener %r failed", listener)
+
+    def close(self):
+        """Stop the writer thread after a last write."""
+        self._closed.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "pending": len(self._buffer),
+            "recorded": self.recorded,
+            "written": self.written,
+            "files": self.files,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+def read_predictions(directory=PREDICTION_LOG_DIR, start=None, end=None, columns=None):
+    """Logged predictions with `start <= timestamp < end` as a DataFrame."""
+    columns = list(columns or SCHEMA.names)
+    if not os.path.isdir(directory):
+        return SCHEMA.empty_table().select(columns).to_pandas()
+    dataset = ds.dataset(directory, format='parquet', partitioning=PARTITIONING,
+                         schema=SCHEMA.append(pa.field('day', pa.string())))
+    condition = None
+    if start is not None:
+        start = pd.Timestamp(start)
+        condition = (ds.field('day') >= start.strftime('%Y-%m-%d')) & (
+            ds.field('timestamp') >= pa.scalar(start.to_pydatetime(), pa.timestamp('us')))
+    if end is not None:
+        end = pd.Timestamp(end)
+        before_end = (ds.field('day') <= end.strftime('%Y-%m-%d')) & (
+            ds.field('timestamp') < pa.scalar(end.to_pydatetime(), pa.timestamp('us')))
+        condition = before_end if condition is None else condition & before_end
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+prediction_logger = PredictionLogger()
@@ -0,0 +1,88 @@
+import os
+import time
+import logging
+import resource
+import threading
+
+
+def _rss_bytes():
+    """Current resident set size of the process, in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # Not on Linux: fall back to the peak RSS (kilobytes on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ModelRegistry:
+    """Process-wide registry loading each named model lazily, exactly once.
+
+    Routers ask the registry for a model by name instead of building their own copy
+    at import time, so every worker holds a single instance per model.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._warmups = {}
+        self._models = {}
+        self._stats = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, warmup=None):
+        """Register a model loader.
+
+        Args:
+            name (str): name the model is requested with
+            loader (Callable): zero-argument function returning the ready-to-serve model
+            warmup (Callable): optional function running the loaded model once on a dummy input
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            self._warmups[name] = warmup
+            self._locks[name] = threading.Lock()
+
+    def get(self, name):
+        """Return the model registered under `name`, loading it on first use."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self._loaders:
+            raise KeyError(f"Unknown model: {name}")
+
+        with self._locks[name]:
+            # Another thread may have loaded it while we were waiting for the lock
+            if name not in self._models:
+                rss_before = _rss_bytes()
+                start = time.perf_counter()
+                self._models[name] = self._loaders[name]()
+                self._stats[name] = {
+                    "load_seconds": time.perf_counter() - start,
+                    "rss_bytes": _rss_bytes() - rss_before,
+                }
+                logging.info("Loaded model %s in %.2fs", name, self._stats[name]["load_seconds"])
+        return self._models[name]
+
+    def warmup(self, names=None):
+        """Load the given models (all registered ones by default) and run their warm-up."""
+        for name in names or list(self._loaders):
+            try:
+                model = self.get(name)
+                warmup = self._warmups.get(name)
+                if warmup is not None:
+                    start = time.perf_counter()
+                    warmup(model)
+                    self._stats[name]["warmup_seconds"] = time.perf_counter() - start
+            except Exception:
+                logging.exception("Could not warm up model %s", name)
+
+    def report(self):
+        """Load time and resident memory of every registered model."""
+        return {
+            name: {"loaded": name in self._models, **self._stats.get(name, {})}
+            for name in self._loaders
+        }
+
+
+registry = ModelRegistry()
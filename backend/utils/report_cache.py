@@ -0,0 +1,123 @@
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+import contextvars
+
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+REPORTS_DIR = os.getenv("REPORTS_DIR") or os.path.join(BASE_DIR, '..', 'reports')
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join(REPORTS_DIR, 'cache'))
+REPORT_CACHE_MAX_FILES = int(os.getenv("REPORT_CACHE_MAX_FILES", 64))
+
+
+def report_key(**parts):
+    """Content address of a report: the hash of everything it is made of (data window, data version, metrics)."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header matches the (strong) ETag of a report."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+
+class ReportCache:
+    """Rendered reports on disk, named after their key.
+
+    A key always names the same content, so a cached file is served as is and
+    the key doubles as its ETag. Concurrent requests of a missing report wait
+    for one render. Renders write a temporary file of their own, renamed once
+    complete: readers see a whole report or none, never a half-written one.
+    The least recently used reports are removed past `max_files`.
+
+    Args:
+        directory (str): where the reports are kept
+        max_files (int): reports kept
+    """
+
+    def __init__(self, directory=REPORT_CACHE_DIR, max_files=REPORT_CACHE_MAX_FILES, suffix='.html'):
+        self.directory = directory
+        self.max_files = max_files
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+        self.errors = 0
+        self._renders = {}
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    async def get(self, key, render):
+        """Path of the report `key`, rendered with `render(path)` on a thread if it is not cached."""
+        path = self.path(key)
+        try:
+            # Touched, eviction removes the least recently used reports
+            os.utime(path)
+            self.hits += 1
+            return path
+        except FileNotFoundError:
+            pass
+        self.misses += 1
+        future = self._renders.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            # In the context of the first caller, its route labels the render in /metrics
+            context = contextvars.copy_context()
+            future = self._renders[key] = loop.run_in_executor(None, context.run, self._render, key, render)
+            future.add_done_callback(lambda _: self._renders.pop(key, None))
+        # A caller going away does not cancel the render the others wait for
+        return await asyncio.shield(future)
+
+    def _render(self, key, render):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        temporary = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            render(temporary)
+            os.replace(temporary, path)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        self.renders += 1
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep):
+        reports = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                path = os.path.join(self.directory, name)
+                try:
+                    reports.append((os.path.getmtime(path), path))
+                except FileNotFoundError:
+                    pass
+        reports.sort(reverse=True)
+        for _, path in reports[self.max_files:]:
+            if path != keep:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    # Evicted by another worker meanwhile
+                    pass
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "renders": self.renders,
+            "rendering": len(self._renders),
+            "errors": self.errors,
+        }
@@ -0,0 +1,100 @@
+import os
+import time
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+from .api import CHAT_MODEL
+from .llm import llm_client
+
+
+load_dotenv()
+
+# Tokens buffered between the LLM and a slow client before the LLM stream is paused
+CHAT_STREAM_BUFFER = int(os.getenv("CHAT_STREAM_BUFFER", 64))
+
+_DONE = object()
+
+
+class TokenStream:
+    """Relay the tokens of a streamed chat completion to an async consumer.
+
+    The completion is read by a task that pushes tokens into a bounded queue: when
+    the consumer (an SSE response or a WebSocket) is slower than the model, the
+    queue fills up and the task stops reading until there is room again.
+    `cancel()` stops the task and closes the upstream stream, e.g. when the client
+    disconnects.
+
+    Time to first token and total latency are recorded separately, see `timings()`.
+
+    Args:
+        messages (list): chat messages, OpenAI format
+        model (str): model used for the completion
+        buffer (int): maximum number of tokens waiting for the consumer
+        client (AsyncLLMClient): client streaming the completion
+    """
+
+    def __init__(self, messages, model=CHAT_MODEL, buffer=CHAT_STREAM_BUFFER, client=None):
+        self.messages = messages
+        self.model = model
+        self.buffer = buffer
+        self.client = client or llm_client
+        self.tokens = []
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        self._producer = None
+
+    def cancel(self):
+        if self._producer is not None and not self._producer.done():
+            self._producer.cancel()
+
+    @property
+    def cancelled(self):
+        return self._producer is not None and self._producer.cancelled()
+
+    @property
+    def text(self):
+        return "".join(self.tokens)
+
+    def timings(self):
+        def since_start(moment):
+            return round((moment - self.started_at) * 1000, 2) if moment and self.started_at else None
+
+        return {
+            "time_to_first_token_ms": since_start(self.first_token_at),
+            "total_ms": since_start(self.finished_at),
+            "tokens": len(self.tokens),
+        }
+
+    async def _produce(self, queue):
+        try:
+            # Closing the generator on cancellation closes the upstream response
+            async for token in self.client.stream(self.messages, self.model):
+                await queue.put(token)
+            await queue.put(_DONE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+
+    async def __aiter__(self):
+        queue = asyncio.Queue(maxsize=self.buffer)
+        self.started_at = time.perf_counter()
+        self._producer = asyncio.create_task(self._produce(queue))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if self.first_token_at is None:
+                    self.first_token_at = time.perf_counter()
+                self.tokens.append(item)
+                yield item
+            self.finished_at = time.perf_counter()
+            logging.info("Chat stream finished: %s", self.timings())
+        finally:
+            self.cancel()
@@ -1,5 +1,173 @@
+import os
+import re
+import asyncio
+
 import torch
-from transformers import pipeline
+from dotenv import load_dotenv
+
+from .registry import registry
+from .history import estimate_tokens
+from .inference import SUMMARY_WORKERS, run_in_summary_executor
+
+
+load_dotenv()
+
+SUMMARIZER_MODEL = os.getenv("SUMMARIZER_MODEL", "Falconsai/text_summarization")
+# Tokens per chunk, below the 512 positions of the default (t5-small) model
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", 480))
+# Chunks per pipeline call, and calls running at the same time on the summary executor
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", 8))
+SUMMARY_PARALLEL_BATCHES = int(os.getenv("SUMMARY_PARALLEL_BATCHES", SUMMARY_WORKERS))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", 150))
+SUMMARY_MIN_TOKENS = int(os.getenv("SUMMARY_MIN_TOKENS", 30))
+
+SUMMARIZER = 'summarizer'
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-summarizer = pipeline(task="summarization", model="Falconsai/text_summarization", device=device)
+
+
+def load_summarizer():
+    from transformers import pipeline
+
+    return pipeline(task="summarization", model=SUMMARIZER_MODEL, device=device)
+
+
+registry.register(SUMMARIZER, load_summarizer)
+
+
+def get_summarizer():
+    """The shared summarization pipeline, loaded on first use."""
+    return registry.get(SUMMARIZER)
+
+
+def split_sentences(text):
+    text = re.sub(r"[ \t]+", " ", text)
+    return [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+|\n{2,}", text) if sentence.strip()]
+
+
+def chunk_text(text, max_tokens=SUMMARY_CHUNK_TOKENS, tokenizer=None):
+    """Split a text into chunks of at most `max_tokens` tokens, on sentence boundaries.
+
+    Sentences are tokenized in one batched call of the model tokenizer when
+    given, otherwise their length is estimated. A sentence longer than a chunk
+    is cut on words.
+    """
+    sentences = split_sentences(text)
+    if not sentences:
+        return []
+    if tokenizer is not None:
+        counts = [len(ids) for ids in tokenizer(sentences, add_special_tokens=False)['input_ids']]
+    else:
+        counts = [estimate_tokens(sentence) for sentence in sentences]
+
+    chunks, current, current_tokens = [], [], 0
+    for sentence, tokens in zip(sentences, counts):
+        if tokens > max_tokens:
+            # Rare (tables, extraction noise): cut the sentence on words, proportionally
+            words = sentence.split()
+            step = max(1, len(words) * max_tokens // tokens)
+            pieces = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+            parts = [(piece, max_tokens) for piece in pieces]
+        else:
+            parts = [(sentence, tokens)]
+        for part, part_tokens in parts:
+            if current and current_tokens + part_tokens > max_tokens:
+                chunks.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+class SummarizationEngine:
+    """Map-reduce summarization of long documents.
+
+    The document is cut into token-aware chunks, the chunks are summarized in
+    batched pipeline calls (several batches at a time on the summary
+    executor), then the partial summaries are joined, re-chunked and
+    summarized again until they fit in a single chunk.
+
+    Args:
+        summarizer (Callable): a transformers summarization pipeline, or anything called the same way
+        chunk_tokens (int): tokens per chunk
+        batch_size (int): chunks per pipeline call
+        parallel_batches (int): pipeline calls in flight at the same time
+    """
+
+    def __init__(self, summarizer=None, chunk_tokens=SUMMARY_CHUNK_TOKENS, batch_size=SUMMARY_BATCH_SIZE,
+                 parallel_batches=SUMMARY_PARALLEL_BATCHES, max_tokens=SUMMARY_MAX_TOKENS,
+                 min_tokens=SUMMARY_MIN_TOKENS):
+        self._summarizer = summarizer
+        self.chunk_tokens = chunk_tokens
+        self.batch_size = batch_size
+        self.parallel_batches = parallel_batches
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+
+    def _summarize_batch(self, summarizer, chunks):
+        outputs = summarizer(
+            chunks, batch_size=len(chunks), truncation=True, do_sample=False,
+            max_length=self.max_tokens, min_length=min(self.min_tokens, self.max_tokens),
+        )
+        return [output['summary_text'].strip() for output in outputs]
+
+    async def _map(self, summarizer, chunks):
+        """Summarize the chunks, yielding (index, summary) as the batches finish."""
+        semaphore = asyncio.Semaphore(self.parallel_batches)
+
+        async def run(start):
+            async with semaphore:
+                return start, await run_in_summary_executor(self._summarize_batch, summarizer, chunks[start:start + self.batch_size])
+
+        tasks = [asyncio.ensure_future(run(start)) for start in range(0, len(chunks), self.batch_size)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                start, summaries = await task
+                for offset, summary in enumerate(summaries):
+                    yield start + offset, summary
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def stream(self, text):
+        """Yield the partial results of every level, then the final summary.
+
+        Events are dicts: `{"level", "chunk", "chunks", "summary"}` for a summarized
+        chunk (level 0 is the document, the next levels the reduce steps), and
+        `{"summary", "levels", "chunks"}` last.
+        """
+        # Loading the model and tokenizing a long document both stay off the event loop
+        summarizer = self._summarizer or await run_in_summary_executor(get_summarizer)
+        tokenizer = getattr(summarizer, 'tokenizer', None)
+        chunks = await run_in_summary_executor(chunk_text, text, self.chunk_tokens, tokenizer)
+        if not chunks:
+            yield {"summary": "", "levels": 0, "chunks": 0}
+            return
+        document_chunks = len(chunks)
+        level = 0
+        while True:
+            summaries = [None] * len(chunks)
+            async for index, summary in self._map(summarizer, chunks):
+                summaries[index] = summary
+                yield {"level": level, "chunk": index, "chunks": len(chunks), "summary": summary}
+            level += 1
+            joined = " ".join(summaries)
+            if len(chunks) == 1:
+                break
+            reduced = await run_in_summary_executor(chunk_text, joined, self.chunk_tokens, tokenizer)
+            if len(reduced) >= len(chunks):
+                # Summaries as long as their chunks, another level would not converge
+                break
+            chunks = reduced
+        yield {"summary": joined, "levels": level, "chunks": document_chunks}
+
+    async def summarize(self, text):
+        result = None
+        async for result in self.stream(text):
+            pass
+        return result
+
+
+summarization_engine = SummarizationEngine()
@@ -48,7 +48,8 @@ def CustumeData(data_dir):
 def get_classes(path):
     
     all_items = os.listdir(path)
-    folders = [item for item in all_items if os.path.isdir(os.path.join(path, item))]
+    # Sorted, like ImageFolder, so indices match the ones the model was trained with
+    folders = sorted(item for item in all_items if os.path.isdir(os.path.join(path, item)))
     classes = folders
 
     return classes